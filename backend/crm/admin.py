@@ -12,6 +12,7 @@ from .models import (
     Alerta, CategoriaEntidade, Entidade, Contato,
     PessoaFisica, Responsavel, Beneficiario
 )
+from .versoes import marcar_alteracao
 import csv
 
 logger = logging.getLogger('sgfs_app')
@@ -37,26 +38,32 @@ def export_as_csv_action(description="Exportar selecionados para CSV"):
 @admin.action(description="Marcar selecionados como DOADOR")
 def marcar_como_doador(modeladmin, request, queryset):
     queryset.update(eh_doador=True)
+    marcar_alteracao(queryset.model)
 
 @admin.action(description="Marcar selecionados como NÃO DOADOR")
 def desmarcar_como_doador(modeladmin, request, queryset):
     queryset.update(eh_doador=False)
+    marcar_alteracao(queryset.model)
 
 @admin.action(description="Marcar selecionados como GESTOR/RECEBEDOR")
 def marcar_como_gestor(modeladmin, request, queryset):
     queryset.update(eh_gestor=True)
+    marcar_alteracao(queryset.model)
 
 @admin.action(description="Marcar selecionados como NÃO GESTOR/RECEBEDOR")
 def desmarcar_como_gestor(modeladmin, request, queryset):
     queryset.update(eh_gestor=False)
+    marcar_alteracao(queryset.model)
 
 @admin.action(description="Ativar beneficiários selecionados")
 def ativar_beneficiarios(modeladmin, request, queryset):
     queryset.update(ativo=True)
+    marcar_alteracao(queryset.model)
 
 @admin.action(description="Desativar beneficiários selecionados")
 def desativar_beneficiarios(modeladmin, request, queryset):
     queryset.update(ativo=False)
+    marcar_alteracao(queryset.model)
 
 
 # =========================
@@ -0,0 +1,174 @@
+# crm/alertas.py
+"""
+Alertas em tempo real por server-sent events (SSE), no lugar do polling de
+/api/alertas/.
+
+Quem grava um alerta (geradores, admin, API) não sabe de stream nenhum: o
+post_save de Alerta publica um NOTIFY no Postgres depois do commit, e o
+mesmo vale para a contagem de não lidos quando um alerta é marcado como
+lido. Cada processo ASGI mantém uma única conexão com LISTEN enquanto houver
+clientes conectados e repassa cada notificação para a fila de cada cliente.
+Cliente parado só espera na fila: não há consulta ao banco por cliente.
+
+Eventos enviados:
+  ``alerta``     o alerta novo, no formato do AlertaSerializer
+  ``nao_lidos``  {"total": n}, sempre que a contagem muda
+
+Ao reconectar, o cliente relê a contagem em /api/alertas/nao_lidos/.
+O EventSource do navegador não envia cabeçalhos. Em vez do token de acesso
+na URL (que iria parar em logs de acesso), o cliente pede antes um ticket
+em POST /api/alertas/stream-ticket/, com o JWT no cabeçalho como qualquer
+chamada, e abre ``?ticket=``. O ticket só serve para abrir o stream e vence
+em ``VALIDADE_TICKET`` segundos; cada reconexão pede um novo. Exige servidor
+ASGI (uvicorn/daphne com fundo_social.asgi).
+"""
+import asyncio
+import json
+import logging
+
+import psycopg
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, connections, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger('sgfs_app')
+
+CANAL = 'sgfs_alertas'
+# Comentário SSE periódico: mantém a conexão viva em proxies com timeout de inatividade
+INTERVALO_PING = 25
+# Cliente lento demais perde eventos em vez de acumular memória; a contagem corrige na próxima
+MAX_FILA = 100
+# Segundos entre a emissão do ticket e a abertura do stream
+VALIDADE_TICKET = 60
+SALT_TICKET = 'crm.alertas.stream'
+
+
+def contar_nao_lidos():
+    from .models import Alerta
+
+    return Alerta.objects.filter(lido=False).count()
+
+
+def evento_sse(evento, dados):
+    return f'event: {evento}\ndata: {json.dumps(dados, cls=JSONEncoder)}\n\n'
+
+
+def _notificar(evento, dados):
+    # O payload já é o evento SSE pronto: o stream só repassa o texto
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CANAL, evento_sse(evento, dados)])
+
+
+def publicar_alerta(alerta):
+    """ Envia o alerta e a nova contagem quando a transação atual for confirmada. """
+    from .serializers import AlertaSerializer
+
+    def publicar():
+        _notificar('alerta', AlertaSerializer(alerta).data)
+        _notificar('nao_lidos', {'total': contar_nao_lidos()})
+
+    transaction.on_commit(publicar)
+
+
+def publicar_contagem():
+    """ Envia a contagem de não lidos quando a transação atual for confirmada. """
+    transaction.on_commit(lambda: _notificar('nao_lidos', {'total': contar_nao_lidos()}))
+
+
+class OuvinteDeAlertas:
+    """ Uma conexão LISTEN por processo, aberta com o primeiro cliente e fechada com o último. """
+
+    def __init__(self):
+        self.filas = set()
+        self.tarefa = None
+
+    def inscrever(self):
+        fila = asyncio.Queue(maxsize=MAX_FILA)
+        self.filas.add(fila)
+        if self.tarefa is None or self.tarefa.done():
+            self.tarefa = asyncio.create_task(self.escutar())
+        return fila
+
+    def cancelar(self, fila):
+        self.filas.discard(fila)
+        if not self.filas and self.tarefa is not None:
+            self.tarefa.cancel()
+            self.tarefa = None
+
+    async def escutar(self):
+        config = connections['default'].settings_dict
+        parametros = {
+            'dbname': config['NAME'], 'user': config['USER'], 'password': config['PASSWORD'],
+            'host': config['HOST'] or None, 'port': config['PORT'] or None,
+        }
+        while self.filas:
+            try:
+                async with await psycopg.AsyncConnection.connect(**parametros, autocommit=True) as conexao:
+                    await conexao.execute(f'LISTEN {CANAL}')
+                    async for notificacao in conexao.notifies():
+                        self.repassar(notificacao.payload)
+            except psycopg.Error:
+                logger.exception('Conexão LISTEN dos alertas caiu; reconectando.')
+                await asyncio.sleep(1)
+
+    def repassar(self, mensagem):
+        for fila in list(self.filas):
+            try:
+                fila.put_nowait(mensagem)
+            except asyncio.QueueFull:
+                pass
+
+
+ouvinte = OuvinteDeAlertas()
+
+
+async def _eventos():
+    fila = ouvinte.inscrever()
+    try:
+        # Ajusta o contador do cliente logo na conexão
+        yield evento_sse('nao_lidos', {'total': await sync_to_async(contar_nao_lidos)()})
+        while True:
+            try:
+                mensagem = await asyncio.wait_for(fila.get(), INTERVALO_PING)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield mensagem
+    finally:
+        ouvinte.cancelar(fila)
+
+
+def emitir_ticket(usuario):
+    return signing.dumps(usuario.pk, salt=SALT_TICKET)
+
+
+async def _autenticar(request):
+    try:
+        user_id = signing.loads(request.GET.get('ticket', ''), salt=SALT_TICKET, max_age=VALIDADE_TICKET)
+    except signing.BadSignature:
+        raise AuthenticationFailed('Ticket do stream inválido ou vencido.')
+    usuario = await User.objects.filter(pk=user_id, is_active=True).afirst()
+    if usuario is None:
+        raise AuthenticationFailed('Usuário inativo ou inexistente.')
+    return usuario
+
+
+async def stream_de_alertas(request):
+    """ GET /api/alertas/stream/?ticket=<ticket de POST /api/alertas/stream-ticket/> """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'O stream de alertas exige o servidor ASGI.'}, status=501)
+    try:
+        await _autenticar(request)
+    except AuthenticationFailed as erro:
+        return JsonResponse({'detail': str(erro)}, status=401)
+
+    response = StreamingHttpResponse(_eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Sem buffer no nginx: cada evento sai na hora
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,119 @@
+# crm/autenticacao.py
+"""
+Autenticação JWT sem a query do usuário a cada requisição.
+
+O token de acesso leva, além do id, o username, is_staff e a versão das
+permissões (crm.permissoes) no momento do login. Os Users carregados ficam
+num cache em memória do processo por ``SGFS_USUARIO_CACHE_TTL`` segundos;
+cada requisição recebe uma cópia, sem o cache de permissões de outra.
+
+Desativar, renomear ou trocar a senha de um usuário (post_save/post_delete)
+tira a entrada do cache deste processo na hora. Nos demais workers a
+entrada vence em no máximo um TTL: é o tempo máximo em que um usuário
+desativado ainda é aceito. Um token emitido depois da entrada (claims
+diferentes ou versão de permissões mais nova) também força a recarga.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .permissoes import versao_permissoes
+
+TTL_PADRAO = 30
+# Acima disso o cache é esvaziado (os usuários do sistema são poucos)
+MAX_USUARIOS = 1_000
+
+
+class TokenComClaimsSerializer(TokenObtainPairSerializer):
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        token['perm_versao'] = versao_permissoes()
+        return token
+
+
+class UsuariosEmCache:
+    """
+    {user_id: (expira_em, versão das permissões, User)} protegido por lock.
+    O id é guardado como texto, como vem no claim do token.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entradas = {}
+
+    def obter(self, user_id, token):
+        with self.lock:
+            entrada = self.entradas.get(str(user_id))
+        if entrada is None:
+            return None
+        expira_em, versao, usuario = entrada
+        if (
+            time.monotonic() >= expira_em
+            or token.get('perm_versao', 0) > versao
+            or token.get('username', usuario.get_username()) != usuario.get_username()
+            or token.get('is_staff', usuario.is_staff) != usuario.is_staff
+        ):
+            self.esquecer(user_id)
+            return None
+        return copy.copy(usuario)
+
+    def guardar(self, usuario):
+        ttl = getattr(settings, 'SGFS_USUARIO_CACHE_TTL', TTL_PADRAO)
+        # Cópia sem _perm_cache: quem recebe o User pode preenchê-lo à vontade
+        guardado = copy.copy(usuario)
+        guardado.__dict__.pop('_perm_cache', None)
+        with self.lock:
+            if len(self.entradas) >= MAX_USUARIOS:
+                self.entradas.clear()
+            self.entradas[str(usuario.pk)] = (time.monotonic() + ttl, versao_permissoes(), guardado)
+
+    def esquecer(self, user_id):
+        with self.lock:
+            self.entradas.pop(str(user_id), None)
+
+    def limpar(self):
+        with self.lock:
+            self.entradas.clear()
+
+
+usuarios_em_cache = UsuariosEmCache()
+
+
+def esquecer_usuario(user_id):
+    """ Tira o usuário do cache deste processo quando a transação atual for confirmada. """
+    transaction.on_commit(lambda: usuarios_em_cache.esquecer(user_id))
+
+
+class JWTAuthenticationComCache(JWTAuthentication):
+    """ JWTAuthentication que busca o User no cache do processo antes de ir ao banco. """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('O token não identifica o usuário.')
+
+        usuario = usuarios_em_cache.obter(user_id, validated_token)
+        if usuario is None:
+            usuario = super().get_user(validated_token)
+            usuarios_em_cache.guardar(usuario)
+            return usuario
+
+        # Entradas em cache são sempre de usuários ativos; resta a checagem de senha do JWTAuthentication
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(usuario.password)
+        ):
+            raise AuthenticationFailed('A senha do usuário foi alterada.', code='password_changed')
+        return usuario
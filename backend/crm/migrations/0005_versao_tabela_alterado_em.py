@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_versao_tabela'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='versaotabela',
+            name='alterado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_versao_tabela_alterado_em'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(condition=models.Q(('lido', False)), fields=['criado_em'], name='alerta_nao_lido_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 # crm/models.py
 from django.db import models
+from django.utils import timezone
 
 # Modelo para classificar as entidades (Associações, Igrejas, etc.)
 class CategoriaEntidade(models.Model):
@@ -125,4 +126,25 @@ class Alerta(models.Model):
     lido = models.BooleanField(default=False)
 
     class Meta:
-        ordering = ['-criado_em']
\ No newline at end of file
+        ordering = ['-criado_em']
+        indexes = [
+            # Contagem de não lidos (crm.alertas) sem varrer os já lidos
+            models.Index(fields=['criado_em'], condition=models.Q(lido=False), name='alerta_nao_lido_idx'),
+        ]
+
+class VersaoTabela(models.Model):
+    """
+    Contador de alterações de uma tabela, incrementado depois de cada commit
+    que a altera (ver crm.versoes). Serve de ETag e Last-Modified para
+    catálogos e listas que mudam pouco, sem consultar os dados.
+    """
+    tabela = models.CharField(max_length=100, unique=True)  # app_label.model_name
+    versao = models.BigIntegerField(default=0)
+    alterado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Versão de Tabela"
+        verbose_name_plural = "Versões de Tabelas"
+
+    def __str__(self):
+        return f'{self.tabela} v{self.versao}'
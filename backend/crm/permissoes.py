@@ -0,0 +1,72 @@
+# crm/permissoes.py
+"""
+Cache das permissões de cada usuário.
+
+Com JWT o User é recarregado a cada requisição, e o cache que o ModelBackend
+guarda no próprio objeto (``_perm_cache``) se perde: cada checagem do
+DjangoModelPermissions e cada ``get_all_permissions()`` voltava às tabelas
+de usuário, grupo e permissão. Aqui o conjunto fica no cache do Django, na
+chave ``permissoes:<versão>:<id do usuário>``.
+
+Mudanças em grupos e permissões (m2m de User.groups, User.user_permissions e
+Group.permissions, exclusão de Group ou Permission) incrementam a versão, e
+todas as entradas antigas deixam de ser lidas. Salvar um usuário apaga só a
+entrada dele (is_superuser e is_active mudam o conjunto). As duas coisas
+rodam depois do commit, como em crm.versoes.
+
+O cache padrão (LocMemCache) é por processo: com vários workers, configure
+um cache compartilhado em CACHES para que a invalidação chegue a todos. Em
+qualquer caso, uma entrada vale no máximo ``SGFS_PERMISSOES_TTL`` segundos.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+CHAVE_VERSAO = 'permissoes:versao'
+TTL_PADRAO = 300
+
+
+def _ttl():
+    return getattr(settings, 'SGFS_PERMISSOES_TTL', TTL_PADRAO)
+
+
+def versao_permissoes():
+    return cache.get_or_set(CHAVE_VERSAO, 1, timeout=None)
+
+
+def chave(user_id):
+    return f'permissoes:{versao_permissoes()}:{user_id}'
+
+
+def _incrementar_versao():
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:  # chave expulsa do cache
+        cache.set(CHAVE_VERSAO, 1, timeout=None)
+
+
+def invalidar_permissoes():
+    """ Descarta o cache de todos os usuários quando a transação atual for confirmada. """
+    transaction.on_commit(_incrementar_versao)
+
+
+def esquecer_permissoes(user_id):
+    """ Descarta o cache de um usuário quando a transação atual for confirmada. """
+    transaction.on_commit(lambda: cache.delete(chave(user_id)))
+
+
+class ModelBackendComCache(ModelBackend):
+    """ ModelBackend que lê o conjunto de permissões do cache antes de ir ao banco. """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            chave_usuario = chave(user_obj.pk)
+            permissoes = cache.get(chave_usuario)
+            if permissoes is None:
+                permissoes = super().get_all_permissions(user_obj)
+                cache.set(chave_usuario, permissoes, _ttl())
+            user_obj._perm_cache = permissoes
+        return user_obj._perm_cache
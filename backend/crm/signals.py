@@ -1,12 +1,62 @@
 # backend/crm/signals.py
 import logging
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django_rest_passwordreset.signals import reset_password_token_created, post_password_reset
 
+from .models import Alerta, Beneficiario, CategoriaEntidade, Contato, Entidade, PessoaFisica, Responsavel
+from .alertas import publicar_alerta, publicar_contagem
+from .autenticacao import esquecer_usuario
+from .permissoes import esquecer_permissoes, invalidar_permissoes
+from .versoes import versionar
+
 logger = logging.getLogger('sgfs_app')
 
+# Tabelas com versão para ETag (ver crm.versoes)
+versionar(CategoriaEntidade, Entidade, Contato, Responsavel, Beneficiario, PessoaFisica)
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def permissoes_alteradas(sender, action, **kwargs):
+    """ Grupo ou permissão atribuído/removido: descarta o cache de permissões (crm.permissoes). """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_permissoes()
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def grupo_ou_permissao_excluido(sender, **kwargs):
+    invalidar_permissoes()
+
+@receiver(post_save, sender=User)
+def usuario_salvo(sender, instance, created, update_fields=None, **kwargs):
+    # is_superuser/is_active mudam o conjunto; o login só grava last_login
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    esquecer_permissoes(instance.pk)
+    esquecer_usuario(instance.pk)
+
+@receiver(post_delete, sender=User)
+def usuario_excluido(sender, instance, **kwargs):
+    esquecer_usuario(instance.pk)
+
+@receiver(post_save, sender=Alerta)
+def alerta_salvo(sender, instance, created, raw=False, **kwargs):
+    """ Empurra o alerta novo (ou a nova contagem de não lidos) para o stream SSE (crm.alertas). """
+    if raw:
+        return
+    if created:
+        publicar_alerta(instance)
+    else:
+        publicar_contagem()
+
+@receiver(post_delete, sender=Alerta)
+def alerta_excluido(sender, instance, **kwargs):
+    publicar_contagem()
+
 @receiver(post_password_reset)
 def password_was_reset(sender, user, *args, **kwargs):
     """
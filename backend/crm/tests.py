@@ -1,3 +1,267 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import itertools
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import sync_to_async
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from fundo_social.metrics import ColetorDeQueries, fingerprint_sql, registro
+from fundo_social.renderers import ORJSONRenderer
+from fundo_social.testing import QueryCountGuardMixin
+from .autenticacao import usuarios_em_cache
+from .models import CategoriaEntidade, Entidade, Contato, PessoaFisica, Responsavel, Beneficiario, Alerta
+
+_seq = itertools.count()
+
+
+def criar_entidade(**kwargs):
+    n = next(_seq)
+    kwargs.setdefault('razao_social', f'Entidade Teste {n}')
+    kwargs.setdefault('nome_fantasia', f'Entidade {n}')
+    kwargs.setdefault('documento', f'{n:014d}')
+    return Entidade.objects.create(**kwargs)
+
+
+def criar_pessoa(**kwargs):
+    n = next(_seq)
+    kwargs.setdefault('nome_completo', f'Pessoa Teste {n}')
+    kwargs.setdefault('cpf', f'{n:011d}')
+    return PessoaFisica.objects.create(**kwargs)
+
+
+class MetricasTest(APITestCase):
+
+    def setUp(self):
+        registro.limpar()
+        self.admin = User.objects.create_superuser('metricas', 'metricas@sgfs.local', 'metricas')
+        self.client.force_authenticate(self.admin)
+
+    def test_queries_por_rota_e_server_timing(self):
+        for _ in range(3):
+            criar_entidade()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('entidade-list'))
+        self.assertEqual(response.status_code, 200)
+        # A próxima requisição zera connection.queries: guarda a contagem já
+        n_queries = len(ctx.captured_queries)
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn(f'desc="{n_queries} queries"', response['Server-Timing'])
+        self.assertIn('view;desc="GET entidade-list"', response['Server-Timing'])
+
+        rotas = {r['rota']: r for r in self.client.get(reverse('metrics')).data}
+        rota = rotas['GET entidade-list']
+        self.assertEqual(rota['requisicoes'], 1)
+        self.assertEqual(rota['queries_max'], n_queries)
+        self.assertIsNotNone(rota['latencia_ms']['p95'])
+
+    def test_fingerprint_agrupa_queries_repetidas(self):
+        self.assertEqual(
+            fingerprint_sql("SELECT * FROM t WHERE id = 12 AND nome = 'a''b' AND x IN (%s, %s, %s)"),
+            'SELECT * FROM t WHERE id = ? AND nome = ? AND x IN (...)',
+        )
+        coletor = ColetorDeQueries()
+        with connection.execute_wrapper(coletor):
+            for pk in (1, 2, 3):
+                list(Entidade.objects.filter(pk=pk))
+            Entidade.objects.count()
+        self.assertEqual(coletor.total, 4)
+        self.assertEqual(list(coletor.duplicadas.values()), [3])
+
+        registro.registrar('GET teste', 1.0, coletor.total, 0.5, coletor.duplicadas)
+        rota = next(r for r in registro.resumo() if r['rota'] == 'GET teste')
+        self.assertEqual([q['vezes'] for q in rota['queries_repetidas']], [3])
+
+    def test_somente_admin_e_delete_zera(self):
+        self.client.get(reverse('entidade-list'))
+        self.assertTrue(self.client.get(reverse('metrics')).data)
+
+        self.client.force_authenticate(User.objects.create_user('comum', 'comum@sgfs.local', 'comum'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.delete(reverse('metrics')).status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.delete(reverse('metrics')).status_code, 204)
+        # Só sobra o próprio DELETE, registrado depois de zerar
+        self.assertEqual([r['rota'] for r in self.client.get(reverse('metrics')).data], ['DELETE metrics'])
+
+
+class EntidadeQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'entidade'
+
+    def semear(self, n):
+        categoria, _ = CategoriaEntidade.objects.get_or_create(nome='Associação')
+        for _ in range(n):
+            entidade = criar_entidade(categoria=categoria, eh_gestor=True)
+            for i in range(n):
+                Contato.objects.create(entidade=entidade, tipo_contato='T', valor=f'11 9000-{i:04d}')
+                Responsavel.objects.create(entidade=entidade, pessoa_fisica=criar_pessoa(), cargo='Presidente')
+                Beneficiario.objects.create(entidade_intermediaria=entidade, pessoa_fisica=criar_pessoa())
+        return entidade.pk
+
+
+class AlertaQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'alerta'
+
+    def semear(self, n):
+        for _ in range(n):
+            alerta = Alerta.objects.create(titulo='Vigência vencida', entidade=criar_entidade())
+        return alerta.pk
+
+
+class RespostasGrandesTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('agenda', 'agenda@sgfs.local', 'agenda'))
+        entidade = criar_entidade(nome_fantasia='Associação ação   ')
+        for _ in range(30):
+            Responsavel.objects.create(entidade=entidade, pessoa_fisica=criar_pessoa(), cargo='Presidente')
+
+    def test_orjson_igual_ao_json_do_drf_e_gzip_negociado(self):
+        response = self.client.get(reverse('agenda-contatos'))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.assertEqual(ORJSONRenderer().render(response.data), response.content)
+        self.assertGreater(len(response.content), 1024)
+
+        comprimida = self.client.get(reverse('agenda-contatos'), HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', comprimida['Vary'])
+        self.assertEqual(gzip.decompress(comprimida.content), response.content)
+
+        # Abaixo do mínimo a resposta vai como está
+        pequena = self.client.get(reverse('categoria-list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(pequena.has_header('Content-Encoding'))
+
+    def test_html_do_admin_nao_e_comprimido(self):
+        # Token CSRF + busca refletida: comprimir abriria espaço para o BREACH
+        self.client.force_login(User.objects.get(username='agenda'))
+        response = self.client.get('/admin/crm/entidade/?q=' + 'x' * 2000, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class CachePermissoesTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.grupo = Group.objects.create(name='Cadastro')
+        self.usuario = User.objects.create_user('cadastro', 'cadastro@sgfs.local', 'cadastro')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.groups.add(self.grupo)
+
+    def recarregar(self):
+        # Como na autenticação por JWT: um User novo a cada requisição
+        return User.objects.get(pk=self.usuario.pk)
+
+    def test_permissoes_em_cache_e_invalidacao(self):
+        self.assertFalse(self.recarregar().has_perm('crm.add_entidade'))
+        usuario = self.recarregar()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(usuario.has_perm('crm.add_entidade'))
+            usuario.get_all_permissions()
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grupo.permissions.add(Permission.objects.get(codename='add_entidade'))
+        self.assertTrue(self.recarregar().has_perm('crm.add_entidade'))
+
+        # Deixar de ser superusuário descarta o conjunto "todas as permissões"
+        for superusuario in (True, False):
+            usuario = self.recarregar()
+            usuario.is_superuser = superusuario
+            with self.captureOnCommitCallbacks(execute=True):
+                usuario.save()
+            self.assertEqual('crm.delete_entidade' in self.recarregar().get_all_permissions(), superusuario)
+
+    def test_usuario_atual_sem_queries_de_permissao(self):
+        self.client.force_authenticate(self.recarregar())
+        self.client.get(reverse('current-user'))
+        self.client.force_authenticate(self.recarregar())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('current-user'))
+        self.assertEqual(response.json()['permissions'], [])
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+
+class JWTComCacheTest(APITestCase):
+
+    def setUp(self):
+        usuarios_em_cache.limpar()
+        self.usuario = User.objects.create_user('jwt', 'jwt@sgfs.local', 'senha-jwt')
+        self.token = self.client.post(
+            reverse('token_obtain_pair'), {'username': 'jwt', 'password': 'senha-jwt'}
+        ).json()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def consultas_ao_usuario(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('lookups'))
+        self.assertEqual(response.status_code, 200)
+        return [q for q in ctx.captured_queries if '"auth_user"' in q['sql']]
+
+    def test_claims_e_usuario_em_cache(self):
+        claims = AccessToken(self.token)
+        self.assertEqual((claims['username'], claims['is_staff']), ('jwt', False))
+        self.assertIn('perm_versao', claims)
+
+        self.assertEqual(len(self.consultas_ao_usuario()), 1)
+        self.assertEqual(self.consultas_ao_usuario(), [])
+
+    def test_usuario_desativado_recusado(self):
+        self.consultas_ao_usuario()
+        # Sem sinal (outro worker): ainda aceito até o fim do TTL
+        User.objects.filter(pk=self.usuario.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('lookups')).status_code, 200)
+        with mock.patch('crm.autenticacao.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertEqual(self.client.get(reverse('lookups')).status_code, 401)
+
+        # Pelo save (mesmo worker): recusado na hora
+        User.objects.filter(pk=self.usuario.pk).update(is_active=True)
+        self.consultas_ao_usuario()
+        self.usuario.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        self.assertEqual(self.client.get(reverse('lookups')).status_code, 401)
+
+
+class StreamDeAlertasTest(TransactionTestCase):
+
+    async def test_alerta_novo_chega_pelo_stream(self):
+        usuario = await sync_to_async(User.objects.create_user)('sse', 'sse@sgfs.local', 'sse')
+        autorizacao = {'Authorization': f'Bearer {AccessToken.for_user(usuario)}'}
+        ticket = (await self.async_client.post(reverse('alerta-stream-ticket'), headers=autorizacao)).json()['ticket']
+
+        self.assertEqual((await self.async_client.get(reverse('alertas-stream'))).status_code, 401)
+        # O JWT não serve como ticket
+        response = await self.async_client.get(reverse('alertas-stream'), {'ticket': str(AccessToken.for_user(usuario))})
+        self.assertEqual(response.status_code, 401)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 120):
+            self.assertEqual((await self.async_client.get(reverse('alertas-stream'), {'ticket': ticket})).status_code, 401)
+
+        response = await self.async_client.get(reverse('alertas-stream'), {'ticket': ticket})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        eventos = response.streaming_content
+        self.assertEqual((await anext(eventos)).decode(), 'event: nao_lidos\ndata: {"total": 0}\n\n')
+
+        # Espera a conexão LISTEN do processo antes de gravar
+        await asyncio.sleep(0.5)
+        await sync_to_async(Alerta.objects.create)(titulo='Vigência vencida', severity='danger')
+        alerta = (await asyncio.wait_for(anext(eventos), 1)).decode()
+        self.assertTrue(alerta.startswith('event: alerta\n'))
+        self.assertIn('"titulo": "Vig\\u00eancia vencida"', alerta)
+        self.assertEqual((await asyncio.wait_for(anext(eventos), 1)).decode(), 'event: nao_lidos\ndata: {"total": 1}\n\n')
+        await eventos.aclose()
+
+        response = await self.async_client.get(reverse('alerta-nao-lidos'), headers=autorizacao)
+        self.assertEqual(response.json(), {'total': 1})
@@ -7,6 +7,7 @@ from .views import (
     AniversariantesDoDiaView, AgendaContatosView, DoadorSearchView,
     DashboardView, CurrentUserView, AlertaViewSet
 )
+from .alertas import stream_de_alertas
 
 # Cria um router e registra nosso viewset com ele.
 router = DefaultRouter()
@@ -20,6 +21,8 @@ router.register(r'alertas', AlertaViewSet, basename='alerta')
 
 # As URLs da API são determinadas automaticamente pelo router.
 urlpatterns = [
+    # Antes do router: senão "stream" casaria com alertas/<pk>/
+    path('alertas/stream/', stream_de_alertas, name='alertas-stream'),
     path('', include(router.urls)),
     path('aniversariantes/', AniversariantesDoDiaView.as_view(), name='aniversariantes-do-dia'),
     path('agenda/', AgendaContatosView.as_view(), name='agenda-contatos'),
@@ -0,0 +1,124 @@
+# crm/versoes.py
+"""
+Versões por tabela para validação condicional (ETag/Last-Modified) das
+respostas da API.
+
+Cada gravação ou exclusão de um model registrado com ``versionar()``
+incrementa o contador da tabela em VersaoTabela. O incremento roda depois do
+commit: um cliente nunca guarda dados antigos sob uma versão nova. Gravações
+que não disparam sinais (bulk_create, bulk_update, QuerySet.update) chamam
+``marcar_alteracao()`` diretamente.
+
+``LeituraCondicionalMixin`` aplica isso às leituras de um ViewSet: com
+If-None-Match/If-Modified-Since válidos, a resposta é 304 sem executar a
+query nem o serializer.
+"""
+from calendar import timegm
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def chave(modelo):
+    return modelo._meta.label_lower
+
+
+def _linhas(modelos):
+    from .models import VersaoTabela
+
+    return {
+        tabela: (versao, alterado_em)
+        for tabela, versao, alterado_em in VersaoTabela.objects.filter(
+            tabela__in=[chave(m) for m in modelos]
+        ).values_list('tabela', 'versao', 'alterado_em')
+    }
+
+
+def versoes(*modelos):
+    """ {modelo: versão} numa única query; tabela nunca alterada vale 0. """
+    gravadas = _linhas(modelos)
+    return {m: gravadas.get(chave(m), (0, None))[0] for m in modelos}
+
+
+def etag(*modelos):
+    """ Valor de ETag (sem aspas) que muda sempre que uma das tabelas muda. """
+    return '-'.join(str(v) for v in versoes(*modelos).values())
+
+
+def estado(*modelos):
+    """ (etag, data da última alteração ou None) das tabelas, numa única query. """
+    gravadas = _linhas(modelos)
+    linhas = [gravadas.get(chave(m), (0, None)) for m in modelos]
+    datas = [alterado_em for _, alterado_em in linhas if alterado_em]
+    return '-'.join(str(versao) for versao, _ in linhas), max(datas, default=None)
+
+
+def _incrementar(tabelas):
+    from .models import VersaoTabela
+
+    nome = VersaoTabela._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {nome} (tabela, versao, alterado_em) VALUES {", ".join(["(%s, 1, now())"] * len(tabelas))} '
+            f'ON CONFLICT (tabela) DO UPDATE SET versao = {nome}.versao + 1, alterado_em = EXCLUDED.alterado_em',
+            tabelas,
+        )
+
+
+def marcar_alteracao(*modelos):
+    """ Incrementa a versão das tabelas quando a transação atual for confirmada. """
+    tabelas = sorted({chave(m) for m in modelos})
+    transaction.on_commit(lambda: _incrementar(tabelas))
+
+
+def _ao_alterar(sender, **kwargs):
+    marcar_alteracao(sender)
+
+
+def versionar(*modelos):
+    """ Liga o incremento de versão aos sinais de gravação e exclusão dos modelos. """
+    for modelo in modelos:
+        post_save.connect(_ao_alterar, sender=modelo, dispatch_uid=f'versao-save-{chave(modelo)}')
+        post_delete.connect(_ao_alterar, sender=modelo, dispatch_uid=f'versao-delete-{chave(modelo)}')
+
+
+class LeituraCondicionalMixin:
+    """
+    ETag e Last-Modified nas ações de leitura do ViewSet, a partir das
+    versões de ``modelos_versionados`` (todas as tabelas que entram na
+    resposta). A validação roda antes de get_queryset(): se o cliente já tem
+    a versão atual, volta 304 sem consultar os dados.
+
+    O ETag não depende dos filtros nem da página; o cache do cliente é por
+    URL, então cada URL revalida contra a mesma versão das tabelas.
+    """
+    modelos_versionados = ()
+    leituras_condicionais = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.leitura_condicional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.leitura_condicional(super().retrieve, request, *args, **kwargs)
+
+    def leitura_condicional(self, ler, request, *args, **kwargs):
+        if self.action not in self.leituras_condicionais:
+            return ler(request, *args, **kwargs)
+
+        versao, alterado_em = estado(*self.modelos_versionados)
+        # JSON e API navegável são representações diferentes da mesma URL
+        tag = quote_etag(f'{self.basename}-{request.accepted_renderer.format}-{versao}')
+        ultima_alteracao = timegm(alterado_em.utctimetuple()) if alterado_em else None
+
+        response = get_conditional_response(request, etag=tag, last_modified=ultima_alteracao)
+        if response is None:
+            response = ler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = tag
+            if ultima_alteracao is not None:
+                response['Last-Modified'] = http_date(ultima_alteracao)
+            # O navegador guarda, mas sempre revalida
+            response['Cache-Control'] = 'private, no-cache'
+        return response
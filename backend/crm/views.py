@@ -1,7 +1,7 @@
 # crm/views.py
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, BooleanFilter, NumberFilter
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.functions import Coalesce, TruncMonth
+from django.db.models.functions import Coalesce
 from django.db.models import Sum, F, IntegerField, DecimalField, Count, Q, Max
 from django.utils import timezone
 from datetime import date, timedelta
@@ -11,13 +11,17 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.renderers import BrowsableAPIRenderer
+from fundo_social.renderers import ORJSONRenderer
 from .models import Entidade, CategoriaEntidade, PessoaFisica, Responsavel, Beneficiario, Contato, Alerta
+from .versoes import LeituraCondicionalMixin
+from .alertas import contar_nao_lidos, emitir_ticket, publicar_contagem
 from .serializers import (
     EntidadeSerializer, CategoriaEntidadeSerializer, PessoaFisicaSerializer,
     ResponsavelSerializer, BeneficiarioSerializer, ResponsavelWriteSerializer, BeneficiarioWriteSerializer,
     ContatoSerializer, ContatoWriteSerializer, UserSerializer, AlertaSerializer
 )
-from estoque.models import Item, DoacaoRealizada, DoacaoRecebida
+from estoque.models import Item, DoacaoRealizada, DoacaoRecebida, ResumoMensalDoacao
 from estoque.serializers import DoacaoRealizadaSerializer, DoacaoRecebidaSerializer
 
 class CurrentUserView(APIView):
@@ -28,10 +32,11 @@ class CurrentUserView(APIView):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
-class CategoriaEntidadeViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoriaEntidadeViewSet(LeituraCondicionalMixin, viewsets.ReadOnlyModelViewSet):
     """
     Endpoint que apenas lista as categorias de entidades.
     """
+    modelos_versionados = (CategoriaEntidade,)
     queryset = CategoriaEntidade.objects.all().order_by('nome')
     serializer_class = CategoriaEntidadeSerializer
 
@@ -46,13 +51,19 @@ class EntidadeFilter(FilterSet):
         model = Entidade
         fields = ["eh_gestor", "eh_doador", "categoria"]
 
-class EntidadeViewSet(viewsets.ModelViewSet):
+class EntidadeViewSet(LeituraCondicionalMixin, viewsets.ModelViewSet):
     """
     Endpoint da API que permite que as entidades sejam visualizadas ou editadas.
     """
     permission_classes = [IsAuthenticated]
-
-    queryset = Entidade.objects.all().order_by('nome_fantasia')
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    # Só o detalhe é condicional: a lista é filtrada e paginada a cada busca
+    modelos_versionados = (Entidade, CategoriaEntidade, Contato, Responsavel, Beneficiario, PessoaFisica)
+    leituras_condicionais = ('retrieve',)
+
+    queryset = Entidade.objects.select_related('categoria').prefetch_related(
+        'contatos', 'responsaveis__pessoa_fisica', 'beneficiarios__pessoa_fisica'
+    ).order_by('nome_fantasia')
     serializer_class = EntidadeSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = EntidadeFilter
@@ -95,7 +106,9 @@ class EntidadeViewSet(viewsets.ModelViewSet):
     def atendimentos(self, request, pk=None):
         entidade = self.get_object()
         # Filtra todas as doações realizadas para esta entidade
-        queryset = DoacaoRealizada.objects.filter(entidade_gestora=entidade).order_by('-data_saida')
+        queryset = DoacaoRealizada.objects.filter(entidade_gestora=entidade).select_related(
+            'entidade_gestora'
+        ).prefetch_related('itens_saida__item', 'kits_saida__kit').order_by('-data_saida')
         serializer = DoacaoRealizadaSerializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -105,7 +118,9 @@ class EntidadeViewSet(viewsets.ModelViewSet):
         entidade = self.get_object()
         # Filtra todas as doações recebidas desta entidade (usando o GenericForeignKey)
         content_type = ContentType.objects.get_for_model(Entidade)
-        queryset = DoacaoRecebida.objects.filter(content_type=content_type, object_id=entidade.id).order_by('-data_doacao')
+        queryset = DoacaoRecebida.objects.filter(content_type=content_type, object_id=entidade.id).prefetch_related(
+            'itens_doados__item__categoria'
+        ).order_by('-data_doacao')
         serializer = DoacaoRecebidaSerializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -176,6 +191,7 @@ class AgendaContatosView(APIView):
     combinando dados da pessoa, do vínculo e da entidade.
     """
     permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
     
     def get(self, request, format=None):
         contatos_finais = []
@@ -276,17 +292,14 @@ class DashboardView(APIView):
             .annotate(total=Count('id')) \
             .order_by('-total')[:5] # Top 5
 
-        # 4. Ranking de Doadores (genérico, precisa ser refinado se quiser juntar PF e PJ)
-        # Por enquanto, vamos rankear apenas Entidades Doadoras
-        ranking_doadores = DoacaoRecebida.objects.filter(content_type=ContentType.objects.get_for_model(Entidade)) \
-            .values('object_id') \
+        # 4. Ranking de Doadores (PF e PJ), direto do snapshot gravado na doação
+        ranking_doadores = DoacaoRecebida.objects \
+            .values('content_type_id', 'object_id', 'doador_nome', 'doador_tipo') \
             .annotate(total=Count('id')) \
             .order_by('-total')[:5]
-        # Mapeia os IDs para nomes
-        doadores_entidades = Entidade.objects.filter(id__in=[d['object_id'] for d in ranking_doadores])
-        mapa_doadores = {ent.id: ent.nome_fantasia for ent in doadores_entidades}
         ranking_doadores_final = [
-            {'nome_doador': mapa_doadores.get(d['object_id']), 'total': d['total']} for d in ranking_doadores
+            {'nome_doador': d['doador_nome'], 'tipo_doador': d['doador_tipo'], 'total': d['total']}
+            for d in ranking_doadores
         ]
 
         # 5. Aniversariantes (da semana)
@@ -311,13 +324,11 @@ class DashboardView(APIView):
         entradas_por_mes = {i: 0 for i in range(1, 13)}
         saidas_por_mes = {i: 0 for i in range(1, 13)}
 
-        entradas_qs = DoacaoRecebida.objects.filter(data_doacao__year=ano_atual).annotate(month=TruncMonth('data_doacao')).values('month').annotate(total=Count('id')).values('month', 'total')
-        for entrada in entradas_qs:
-            entradas_por_mes[entrada['month'].month] = entrada['total']
-
-        saidas_qs = DoacaoRealizada.objects.filter(data_saida__year=ano_atual).annotate(month=TruncMonth('data_saida')).values('month').annotate(total=Count('id')).values('month', 'total')
-        for saida in saidas_qs:
-            saidas_por_mes[saida['month'].month] = saida['total']
+        # Contagens lidas do resumo mensal pré-agregado (estoque.resumos)
+        por_mes = ResumoMensalDoacao.objects.filter(mes__year=ano_atual).values('mes', 'direcao').annotate(total=Sum('doacoes'))
+        for linha in por_mes:
+            destino = entradas_por_mes if linha['direcao'] == 'E' else saidas_por_mes
+            destino[linha['mes'].month] = linha['total']
         
         movimentacoes_mensais = {
             "labels": meses,
@@ -345,7 +356,7 @@ class DashboardView(APIView):
         return Response(data)
 
 class AlertaViewSet(viewsets.ModelViewSet):
-    queryset = Alerta.objects.all().order_by('-criado_em')
+    queryset = Alerta.objects.select_related('entidade').order_by('-criado_em')
     serializer_class = AlertaSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
@@ -364,8 +375,20 @@ class AlertaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def marcar_todos_como_lidos(self, request):
         count = Alerta.objects.filter(lido=False).update(lido=True)
+        # update() não dispara post_save: avisa o stream de alertas
+        publicar_contagem()
         return Response({'marked': count})
 
+    @action(detail=False, methods=['get'])
+    def nao_lidos(self, request):
+        """ Só a contagem, para o cliente do stream SSE ao reconectar (índice parcial em lido=False). """
+        return Response({'total': contar_nao_lidos()})
+
+    @action(detail=False, methods=['post'], url_path='stream-ticket')
+    def stream_ticket(self, request):
+        """ Ticket de curta duração para abrir o stream SSE sem o JWT na URL (ver crm.alertas). """
+        return Response({'ticket': emitir_ticket(request.user)})
+
     @action(detail=True, methods=['post'])
     def marcar_como_lido(self, request, pk=None):
         alerta = self.get_object()
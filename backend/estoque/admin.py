@@ -1,7 +1,21 @@
 # estoque/admin.py
+import functools
+from datetime import datetime, time, timedelta
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+from rest_framework import serializers
 from django.http import HttpResponse
-from django.db.models import Sum, F
+from django.db.models import Sum, F, OuterRef, Subquery, DecimalField, Max, Min
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
 import csv
 
@@ -9,8 +23,10 @@ from .models import (
     CategoriaDeItens, Item, Kit, ItemKit,
     DoacaoRecebida, ItemDoacaoRecebida,
     DoacaoRealizada, ItemSaida, KitSaida,
-    MovimentacaoEstoque
+    MovimentacaoEstoque, Inventario, ContagemInventario
 )
+from .saidas import somar_necessidades, conferir_estoque, lancar_saida
+from .pagination import estimar_linhas
 
 # =========================
 # AÇÕES COMUNS (CSV)
@@ -30,6 +46,174 @@ def export_as_csv_action(description="Exportar selecionados para CSV"):
     action.short_description = description
     return action
 
+
+def soma_por(queryset, campo_pai, valor):
+    """
+    Subquery com a soma de ``valor`` nas linhas de ``queryset`` que apontam
+    (por ``campo_pai``) para a linha da listagem. Usada nas colunas de total
+    das listagens, que assim custam uma query por página e não uma por linha.
+    """
+    soma = (
+        queryset.filter(**{campo_pai: OuterRef("pk")})
+        .order_by().values(campo_pai)
+        .annotate(total=Sum(valor, output_field=DecimalField()))
+        .values("total")
+    )
+    return Coalesce(Subquery(soma), 0, output_field=DecimalField())
+
+# =========================
+# TABELAS GRANDES
+# =========================
+
+class ContagemEstimadaPaginator(Paginator):
+    """
+    COUNT(*) exato só quando o planejador prevê poucas linhas; acima de
+    LIMITE_EXATO o total (e o nº de páginas) é a estimativa do EXPLAIN.
+    """
+    LIMITE_EXATO = 10_000
+
+    @cached_property
+    def count(self):
+        estimativa = estimar_linhas(self.object_list)
+        if estimativa < self.LIMITE_EXATO:
+            return super().count
+        return estimativa
+
+
+class DatasPeloIndiceMixin:
+    """
+    datetimes() da navegação por data (date_hierarchy) sem o SELECT DISTINCT
+    date_trunc() sobre a tabela inteira: o intervalo vem de MIN/MAX e os
+    períodos candidatos (anos, meses ou dias) são confirmados numa única query,
+    uma lista VALUES com um EXISTS por período sobre o índice da data. Só entra
+    no queryset da listagem do admin (ChangeListTabelaGrande).
+    """
+    # Acima disso, volta ao SELECT DISTINCT padrão
+    MAX_PERIODOS_POR_INDICE = 62
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        limites = self.aggregate(primeiro=Min(field_name), ultimo=Max(field_name))
+        if limites['primeiro'] is None:
+            return []
+        tz = tzinfo or timezone.get_current_timezone()
+        primeiro = timezone.localtime(limites['primeiro'], tz).date()
+        ultimo = timezone.localtime(limites['ultimo'], tz).date()
+
+        def instante(data):
+            return timezone.make_aware(datetime.combine(data, time.min), tz)
+
+        inicio = primeiro.replace(month=1, day=1) if kind == 'year' else primeiro
+        inicio = inicio.replace(day=1) if kind == 'month' else inicio
+        periodos = []
+        while inicio <= ultimo:
+            if kind == 'year':
+                fim = inicio.replace(year=inicio.year + 1)
+            elif kind == 'month':
+                fim = inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+            else:
+                fim = inicio + timedelta(days=1)
+            periodos.append((instante(inicio), instante(fim)))
+            inicio = fim
+        if len(periodos) > self.MAX_PERIODOS_POR_INDICE:
+            return super().datetimes(field_name, kind, order, tzinfo)
+
+        # O EXISTS correlacionado com a linha p da lista VALUES
+        existe = self.filter(**{
+            f'{field_name}__gte': RawSQL('p.inicio', []),
+            f'{field_name}__lt': RawSQL('p.fim', []),
+        }).order_by().values('pk')
+        sql_existe, params_existe = existe.query.sql_with_params()
+        valores = ', '.join(['(%s::timestamptz, %s::timestamptz)'] * len(periodos))
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.inicio FROM (VALUES {valores}) AS p(inicio, fim) WHERE EXISTS ({sql_existe})',
+                [v for periodo in periodos for v in periodo] + list(params_existe),
+            )
+            encontrados = {linha[0] for linha in cursor.fetchall()}
+        resultado = [inicio for inicio, _ in periodos if inicio in encontrados]
+        return resultado[::-1] if order == 'DESC' else resultado
+
+
+@functools.cache
+def _classe_com_datas_pelo_indice(classe):
+    return type(f'{classe.__name__}ComDatasPeloIndice', (DatasPeloIndiceMixin, classe), {})
+
+
+def com_datas_pelo_indice(queryset):
+    """ Cópia de ``queryset`` cujo datetimes() é o de DatasPeloIndiceMixin. """
+    queryset = queryset._chain()
+    queryset.__class__ = _classe_com_datas_pelo_indice(queryset.__class__)
+    return queryset
+
+
+class ChangeListTabelaGrande(ChangeList):
+    """ Listagem cujo queryset usa DatasPeloIndiceMixin na navegação por data. """
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return com_datas_pelo_indice(queryset) if self.date_hierarchy else queryset
+
+
+class FiltroAutocomplete(admin.FieldListFilter):
+    """
+    Filtro por FK com a busca (autocomplete) do admin em vez da lista com
+    todos os valores. O admin do model relacionado precisa de search_fields.
+    Uso: list_filter = (("item", FiltroAutocomplete),)
+    """
+    template = "admin/estoque/filtro_autocomplete.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        super().__init__(field, request, params, model, model_admin, field_path)
+        valor = self.used_parameters.get(self.lookup_kwarg)
+        if isinstance(valor, list):
+            valor = valor[-1]
+        campo = forms.ModelChoiceField(
+            queryset=field.related_model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={"data-filtro": "1"}),
+            required=False,
+        )
+        # só o valor selecionado é lido do banco (para o rótulo)
+        self.campo_renderizado = campo.widget.render(self.lookup_kwarg, valor)
+        self.selecionado = valor is not None
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            "selected": not self.selecionado,
+            "query_string": changelist.get_query_string(remove=[self.lookup_kwarg]),
+            "display": "Todos",
+        }
+
+
+class TabelaGrandeAdminMixin:
+    """
+    Listagens de tabelas com milhões de linhas: total estimado (e sem o
+    segundo COUNT(*) da tabela inteira), navegação por data pelo índice
+    (ChangeListTabelaGrande) e filtros de FK por autocomplete. Cada admin
+    declara list_select_related.
+    """
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListTabelaGrande
+
+    @property
+    def media(self):
+        media = super().media
+        if any(isinstance(f, tuple) and issubclass(f[1], FiltroAutocomplete) for f in self.list_filter):
+            media += AutocompleteSelect(None, self.admin_site).media
+        return media
+
+
 # =========================
 # BÁSICOS
 # =========================
@@ -73,15 +257,20 @@ class KitAdmin(admin.ModelAdmin):
     inlines = [ItemKitInline]
     actions = [export_as_csv_action()]
 
+    def get_queryset(self, request):
+        # soma das quantidades dos itens que compõem o kit
+        return super().get_queryset(request).annotate(
+            _total_itens=soma_por(ItemKit.objects.all(), "kit", "quantidade"),
+        )
+
     def descricao_resumida(self, obj):
         return (obj.descricao[:60] + "…") if obj.descricao and len(obj.descricao) > 60 else obj.descricao
     descricao_resumida.short_description = "Descrição"
 
     def total_itens_ponderado(self, obj):
-        # soma das quantidades dos itens que compõem o kit
-        agg = obj.itens_do_kit.aggregate(total=Sum("quantidade"))
-        return agg["total"] or 0
+        return obj._total_itens
     total_itens_ponderado.short_description = "Qtd. total (unidades)"
+    total_itens_ponderado.admin_order_field = "_total_itens"
 
 
 # =========================
@@ -98,8 +287,8 @@ class ItemDoacaoRecebidaInline(admin.TabularInline):
 @admin.register(DoacaoRecebida)
 class DoacaoRecebidaAdmin(admin.ModelAdmin):
     list_display = ("data_doacao", "doador_str", "qtd_itens", "data_registro")
-    list_filter = (("data_doacao", admin.DateFieldListFilter),)
-    search_fields = ("observacoes", )
+    list_filter = (("data_doacao", admin.DateFieldListFilter), "doador_tipo")
+    search_fields = ("observacoes", "doador_nome", "doador_documento")
     inlines = [ItemDoacaoRecebidaInline]
     actions = [export_as_csv_action()]
 
@@ -110,25 +299,65 @@ class DoacaoRecebidaAdmin(admin.ModelAdmin):
     )
 
     def doador_str(self, obj):
-        # tenta mostrar algo legível do GenericForeignKey
-        try:
-            return str(obj.doador)
-        except Exception:
-            return "-"
+        # snapshot gravado na doação (não resolve o GenericForeignKey)
+        return obj.doador_nome or "-"
     doador_str.short_description = "Doador"
+    doador_str.admin_order_field = "doador_nome"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _qtd_itens=soma_por(ItemDoacaoRecebida.objects.all(), "doacao", "quantidade"),
+        )
 
     def qtd_itens(self, obj):
-        agg = obj.itens_doados.aggregate(total=Sum("quantidade"))
-        return agg["total"] or 0
+        return obj._qtd_itens
     qtd_itens.short_description = "Qtd. Itens"
+    qtd_itens.admin_order_field = "_qtd_itens"
 
 
 # =========================
 # DOAÇÃO REALIZADA + ITENS/KITS (Saídas)
 # =========================
 
+class SaidaEstoqueFormSet(BaseInlineFormSet):
+    """
+    Linhas de itens e de kits de uma DoacaoRealizada. As duas inlines
+    registram as linhas novas no mesmo dict ``saida`` ({modelo: [(id, qtd)]})
+    e cada uma confere o estoque sobre o total registrado até ali: a última
+    a validar confere a saída inteira, numa query.
+    """
+    campo = None  # "item" ou "kit"
+
+    def __init__(self, *args, saida=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.saida = {} if saida is None else saida
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        self.saida[self.model] = [
+            (f.cleaned_data[self.campo].pk, f.cleaned_data["quantidade"])
+            for f in self.forms
+            if f.cleaned_data and f.instance.pk is None and not self._should_delete_form(f)
+        ]
+        try:
+            conferir_estoque(somar_necessidades(self.saida.get(ItemSaida, []), self.saida.get(KitSaida, [])))
+        except serializers.ValidationError as e:
+            raise forms.ValidationError(e.detail)
+
+
+class ItemSaidaFormSet(SaidaEstoqueFormSet):
+    campo = "item"
+
+
+class KitSaidaFormSet(SaidaEstoqueFormSet):
+    campo = "kit"
+
+
 class ItemSaidaInline(admin.TabularInline):
     model = ItemSaida
+    formset = ItemSaidaFormSet
     extra = 0
     autocomplete_fields = ("item",)
     fields = ("item", "quantidade")
@@ -136,15 +365,16 @@ class ItemSaidaInline(admin.TabularInline):
 
 class KitSaidaInline(admin.TabularInline):
     model = KitSaida
+    formset = KitSaidaFormSet
     extra = 0
     autocomplete_fields = ("kit",)
     fields = ("kit", "quantidade")
 
 
 @admin.register(DoacaoRealizada)
-class DoacaoRealizadaAdmin(admin.ModelAdmin):
+class DoacaoRealizadaAdmin(TabelaGrandeAdminMixin, admin.ModelAdmin):
     list_display = ("data_saida", "entidade_gestora", "qtd_itens_total", "data_registro")
-    list_filter = (("data_saida", admin.DateFieldListFilter), "entidade_gestora")
+    list_filter = (("data_saida", admin.DateFieldListFilter), ("entidade_gestora", FiltroAutocomplete))
     search_fields = (
         "observacoes",
         "entidade_gestora__nome_fantasia", "entidade_gestora__documento",
@@ -161,59 +391,39 @@ class DoacaoRealizadaAdmin(admin.ModelAdmin):
     )
     readonly_fields = ("data_registro",)
 
+    def get_queryset(self, request):
+        # soma direta de itens avulsos + soma ponderada dos kits (cada kit
+        # multiplicado pelas quantidades de seus componentes, via join)
+        return super().get_queryset(request).annotate(
+            _qtd_itens_total=(
+                soma_por(ItemSaida.objects.all(), "doacao_realizada", "quantidade")
+                + soma_por(KitSaida.objects.all(), "doacao_realizada", F("quantidade") * F("kit__itens_do_kit__quantidade"))
+            ),
+        )
+
     def qtd_itens_total(self, obj):
-        # soma direta de itens avulsos + soma ponderada dos kits
-        soma_itens = obj.itens_saida.aggregate(s=Sum("quantidade"))["s"] or 0
-        # multiplicar cada kit pela soma de seus componentes
-        total_kits = 0
-        for ks in obj.kits_saida.select_related("kit").all():
-            comp_total = ks.kit.itens_do_kit.aggregate(s=Sum("quantidade"))["s"] or 0
-            total_kits += comp_total * (ks.quantidade or 0)
-        return soma_itens + total_kits
+        return obj._qtd_itens_total
     qtd_itens_total.short_description = "Qtd. Itens (total)"
-
-    # --- Movimentação de SAÍDA automaticamente para novos registros de itens/kits ---
-    def save_formset(self, request, form, formset, change):
-        instances = formset.save(commit=False)
-
-        # Salva primeiro para garantir PKs
-        for obj in instances:
-            obj.save()
-
-        formset.save_m2m()
-
-        # Cria MovimentacaoEstoque de SAÍDA SOMENTE para objetos novos
-        from .models import MovimentacaoEstoque, ItemKit
-
-        if formset.model is ItemSaida:
-            for obj in instances:
-                if obj._state.adding:  # novo
-                    MovimentacaoEstoque.objects.create(
-                        item=obj.item,
-                        tipo_movimento="S",
-                        quantidade=obj.quantidade,
-                        usuario_responsavel=request.user if request.user.is_authenticated else None,
-                        observacao=f"Saída via doação (ItemSaida) ID {obj.pk} - Doação {obj.doacao_realizada_id}",
-                    )
-
-        elif formset.model is KitSaida:
-            for obj in instances:
-                if obj._state.adding:  # novo
-                    # Expande o kit em itens e cria movimentações de saída
-                    componentes = ItemKit.objects.filter(kit=obj.kit)
-                    for comp in componentes:
-                        qtd_total = (obj.quantidade or 0) * (comp.quantidade or 0)
-                        if qtd_total and qtd_total > 0:
-                            MovimentacaoEstoque.objects.create(
-                                item=comp.item,
-                                tipo_movimento="S",
-                                quantidade=qtd_total,
-                                usuario_responsavel=request.user if request.user.is_authenticated else None,
-                                observacao=f"Saída via doação (KitSaida) ID {obj.pk} - Kit {obj.kit_id} expandido",
-                            )
-
-        # Importante: chamar o super para fluxo normal
-        super().save_formset(request, form, formset, change)
+    qtd_itens_total.admin_order_field = "_qtd_itens_total"
+
+    # --- Movimentação de SAÍDA para as linhas novas de itens/kits ---
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if issubclass(inline.formset, SaidaEstoqueFormSet):
+            # mesmo acumulador para as duas inlines desta requisição
+            kwargs["saida"] = request.__dict__.setdefault("_saida_estoque", {})
+        return kwargs
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Mesma regra da API: itens e kits somados por item, uma saída negativa
+        # por item, ligada à doação, gravadas num único bulk_create
+        novos = {fs.model: fs.new_objects for fs in formsets if isinstance(fs, SaidaEstoqueFormSet)}
+        necessidades = somar_necessidades(
+            [(o.item_id, o.quantidade) for o in novos.get(ItemSaida, [])],
+            [(o.kit_id, o.quantidade) for o in novos.get(KitSaida, [])],
+        )
+        lancar_saida(form.instance, necessidades, usuario=request.user if request.user.is_authenticated else None)
 
 
 # =========================
@@ -230,32 +440,44 @@ class ItemKitAdmin(admin.ModelAdmin):
 
 
 @admin.register(ItemDoacaoRecebida)
-class ItemDoacaoRecebidaAdmin(admin.ModelAdmin):
+class ItemDoacaoRecebidaAdmin(TabelaGrandeAdminMixin, admin.ModelAdmin):
     list_display = ("doacao", "item", "quantidade")
     search_fields = ("doacao__observacoes", "item__nome")
-    list_filter = ("doacao__data_doacao",)
+    list_filter = (
+        ("doacao__data_doacao", admin.DateFieldListFilter),
+        ("item", FiltroAutocomplete),
+        ("doacao", FiltroAutocomplete),
+    )
     autocomplete_fields = ("doacao", "item")
     list_select_related = ("doacao", "item")
     actions = [export_as_csv_action()]
 
 
 @admin.register(ItemSaida)
-class ItemSaidaAdmin(admin.ModelAdmin):
+class ItemSaidaAdmin(TabelaGrandeAdminMixin, admin.ModelAdmin):
     list_display = ("doacao_realizada", "item", "quantidade")
     search_fields = ("doacao_realizada__observacoes", "item__nome")
-    list_filter = ("doacao_realizada__data_saida",)
+    list_filter = (
+        ("doacao_realizada__data_saida", admin.DateFieldListFilter),
+        ("item", FiltroAutocomplete),
+        ("doacao_realizada", FiltroAutocomplete),
+    )
     autocomplete_fields = ("doacao_realizada", "item")
-    list_select_related = ("doacao_realizada", "item")
+    list_select_related = ("doacao_realizada__entidade_gestora", "item")
     actions = [export_as_csv_action()]
 
 
 @admin.register(KitSaida)
-class KitSaidaAdmin(admin.ModelAdmin):
+class KitSaidaAdmin(TabelaGrandeAdminMixin, admin.ModelAdmin):
     list_display = ("doacao_realizada", "kit", "quantidade")
     search_fields = ("doacao_realizada__observacoes", "kit__nome")
-    list_filter = ("doacao_realizada__data_saida",)
+    list_filter = (
+        ("doacao_realizada__data_saida", admin.DateFieldListFilter),
+        ("kit", FiltroAutocomplete),
+        ("doacao_realizada", FiltroAutocomplete),
+    )
     autocomplete_fields = ("doacao_realizada", "kit")
-    list_select_related = ("doacao_realizada", "kit")
+    list_select_related = ("doacao_realizada__entidade_gestora", "kit")
     actions = [export_as_csv_action()]
 
 
@@ -264,15 +486,55 @@ class KitSaidaAdmin(admin.ModelAdmin):
 # =========================
 
 @admin.register(MovimentacaoEstoque)
-class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
+class MovimentacaoEstoqueAdmin(TabelaGrandeAdminMixin, admin.ModelAdmin):
     list_display = ("data_movimento", "item", "tipo_movimento", "quantidade", "usuario_responsavel", "observacao")
-    list_filter = ("tipo_movimento", ("data_movimento", admin.DateFieldListFilter))
+    list_filter = (
+        "tipo_movimento",
+        ("item", FiltroAutocomplete),
+        ("usuario_responsavel", FiltroAutocomplete),
+    )
     search_fields = ("item__nome", "observacao", "usuario_responsavel__username")
     autocomplete_fields = ("item", "usuario_responsavel")
     list_select_related = ("item", "usuario_responsavel")
     date_hierarchy = "data_movimento"
     actions = [export_as_csv_action()]
 
+# =========================
+# INVENTÁRIO
+# =========================
+
+class ContagemInventarioInline(admin.TabularInline):
+    model = ContagemInventario
+    extra = 0
+    fields = ("item", "quantidade_contada", "saldo_sistema")
+    readonly_fields = ("saldo_sistema",)
+    autocomplete_fields = ("item",)
+
+    # Depois da aprovação as contagens ficam só para consulta
+    def _aberto(self, obj):
+        return obj is None or obj.status == Inventario.Status.ABERTO
+
+    def has_add_permission(self, request, obj=None):
+        return self._aberto(obj) and super().has_add_permission(request, obj)
+
+    def has_change_permission(self, request, obj=None):
+        return self._aberto(obj) and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return self._aberto(obj) and super().has_delete_permission(request, obj)
+
+
+@admin.register(Inventario)
+class InventarioAdmin(admin.ModelAdmin):
+    # A aprovação (que lança os ajustes) é feita pela API: /api/inventarios/<id>/aprovar/
+    list_display = ("id", "descricao", "status", "data_abertura", "aberto_por", "data_aprovacao", "aprovado_por")
+    list_filter = ("status", ("data_abertura", admin.DateFieldListFilter))
+    search_fields = ("descricao", "observacoes")
+    readonly_fields = ("status", "data_abertura", "aberto_por", "data_aprovacao", "aprovado_por")
+    list_select_related = ("aberto_por", "aprovado_por")
+    inlines = [ContagemInventarioInline]
+    actions = [export_as_csv_action()]
+
 # Branding opcional do Admin (se quiser unificar com o CRM)
 admin.site.site_header = "SGFS — Administração"
 admin.site.site_title  = "SGFS Admin"
@@ -0,0 +1,85 @@
+# estoque/doadores.py
+"""
+Snapshot do doador (nome, tipo e documento) gravado na própria DoacaoRecebida.
+
+Listagens e rankings de entradas leem só a tabela de doações, sem passar
+pelo GenericForeignKey. O snapshot é calculado na gravação da doação e
+ressincronizado em lote (estoque.signals) quando a Entidade ou a PessoaFisica muda.
+"""
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Func, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from crm.models import Entidade, PessoaFisica
+
+
+def normalizar_documento(documento):
+    """ Mantém só os dígitos de CPF/CNPJ. """
+    return re.sub(r'\D', '', documento or '')
+
+
+def snapshot_do_doador(doador):
+    """ Campos doador_* para uma instância de Entidade ou PessoaFisica. """
+    from .models import DoacaoRecebida
+
+    TipoDoador = DoacaoRecebida.TipoDoador
+    if isinstance(doador, Entidade):
+        return {
+            'doador_nome': str(doador),
+            'doador_tipo': TipoDoador.ENTIDADE,
+            'doador_documento': normalizar_documento(doador.documento),
+        }
+    if isinstance(doador, PessoaFisica):
+        return {
+            'doador_nome': doador.nome_completo,
+            'doador_tipo': TipoDoador.PESSOA_FISICA,
+            'doador_documento': normalizar_documento(doador.cpf),
+        }
+    return {'doador_nome': str(doador) if doador else '', 'doador_tipo': '', 'doador_documento': ''}
+
+
+def sincronizar_doador(doador):
+    """
+    Atualiza, num único UPDATE, o snapshot de todas as doações deste doador.
+    Doações que já estão em dia são ignoradas pelo filtro, então salvar um
+    doador sem mudar nome/documento não reescreve nenhuma linha.
+    """
+    from .models import DoacaoRecebida
+
+    snapshot = snapshot_do_doador(doador)
+    ct = ContentType.objects.get_for_model(doador)
+    return (
+        DoacaoRecebida.objects
+        .filter(content_type=ct, object_id=doador.pk)
+        .exclude(**snapshot)
+        .update(**snapshot)
+    )
+
+
+def _so_digitos(campo):
+    return Func(Coalesce(F(campo), Value('')), Value(r'\D'), Value(''), Value('g'), function='REGEXP_REPLACE')
+
+
+def reconstruir_snapshots():
+    """ Recalcula o snapshot de todas as doações com dois UPDATEs (um por tipo de doador). """
+    from .models import DoacaoRecebida
+
+    TipoDoador = DoacaoRecebida.TipoDoador
+    entidades = Entidade.objects.filter(pk=OuterRef('object_id'))
+    pessoas = PessoaFisica.objects.filter(pk=OuterRef('object_id'))
+
+    total = DoacaoRecebida.objects.filter(content_type=ContentType.objects.get_for_model(Entidade)).update(
+        doador_tipo=TipoDoador.ENTIDADE,
+        doador_nome=Coalesce(Subquery(entidades.values(
+            nome=Coalesce(NullIf('nome_fantasia', Value('')), 'razao_social')
+        )[:1]), Value('')),
+        doador_documento=Coalesce(Subquery(entidades.values(doc=_so_digitos('documento'))[:1]), Value('')),
+    )
+    total += DoacaoRecebida.objects.filter(content_type=ContentType.objects.get_for_model(PessoaFisica)).update(
+        doador_tipo=TipoDoador.PESSOA_FISICA,
+        doador_nome=Coalesce(Subquery(pessoas.values('nome_completo')[:1]), Value('')),
+        doador_documento=Coalesce(Subquery(pessoas.values(doc=_so_digitos('cpf'))[:1]), Value('')),
+    )
+    return total
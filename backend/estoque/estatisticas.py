@@ -0,0 +1,71 @@
+# estoque/estatisticas.py
+"""
+Séries temporais do livro de movimentações calculadas no banco.
+
+Cada período (date_trunc por dia, semana ou mês) traz entradas, saídas,
+variação e o saldo acumulado até o fim do período. O saldo acumulado é um
+SUM(SUM(quantidade)) OVER (ORDER BY período) somado ao saldo anterior ao
+início do intervalo. Períodos sem movimentação não aparecem.
+"""
+from django.db.models import DateField, DecimalField, F, Func, Q, Sum, Window
+from django.db.models.functions import Abs, Trunc
+
+INTERVALOS = {'dia': 'day', 'semana': 'week', 'mes': 'month'}
+
+
+class SomaAcumulada(Func):
+    """ SUM(expr) usado como função de janela sobre uma coluna já agregada. """
+    function = 'SUM'
+    window_compatible = True
+    output_field = DecimalField(max_digits=14, decimal_places=2)
+
+
+def serie_do_estoque(movimentacoes, inicio, fim, intervalo, por_item=False):
+    """
+    movimentacoes: queryset de MovimentacaoEstoque já filtrado por item/categoria.
+    inicio/fim: datetimes (fim exclusivo). Devolve a lista de séries, uma por
+    item quando por_item=True ou uma única série somando todos os itens.
+    """
+    grupo = ['item_id'] if por_item else []
+
+    anteriores = movimentacoes.filter(data_movimento__lt=inicio).order_by()
+    saldo_inicial = {
+        tuple(linha[c] for c in grupo): linha['saldo']
+        for linha in anteriores.values(*grupo).annotate(saldo=Sum('quantidade'))
+    }
+
+    pontos = (
+        movimentacoes.filter(data_movimento__gte=inicio, data_movimento__lt=fim)
+        .order_by()
+        .annotate(periodo=Trunc('data_movimento', INTERVALOS[intervalo], output_field=DateField()))
+        .values(*grupo, 'periodo')
+        .annotate(
+            entradas=Sum(Abs('quantidade'), filter=Q(tipo_movimento='E'), default=0),
+            saidas=Sum(Abs('quantidade'), filter=Q(tipo_movimento='S'), default=0),
+            variacao=Sum('quantidade'),
+        )
+        .annotate(acumulado=Window(
+            SomaAcumulada(F('variacao')),
+            partition_by=[F(c) for c in grupo] or None,
+            order_by=F('periodo').asc(),
+        ))
+        .order_by(*grupo, 'periodo')
+    )
+
+    series = {}
+    for ponto in pontos:
+        chave = tuple(ponto.pop(c) for c in grupo)
+        serie = series.setdefault(chave, {
+            **dict(zip(grupo, chave)),
+            'saldo_inicial': saldo_inicial.get(chave, 0),
+            'pontos': [],
+        })
+        ponto['saldo'] = serie['saldo_inicial'] + ponto.pop('acumulado')
+        serie['pontos'].append(ponto)
+
+    # Itens com saldo mas sem movimentação no intervalo também aparecem
+    for chave, saldo in saldo_inicial.items():
+        series.setdefault(chave, {**dict(zip(grupo, chave)), 'saldo_inicial': saldo, 'pontos': []})
+    if not series:
+        series[()] = {'saldo_inicial': 0, 'pontos': []}
+    return list(series.values())
@@ -0,0 +1,98 @@
+# estoque/idempotencia.py
+"""
+Cabeçalho Idempotency-Key nos POST que criam doações.
+
+A primeira requisição com uma chave grava a linha de ChaveIdempotencia na
+mesma transação da doação, e a resposta é guardada nela. Reenvios (clique
+duplo, nova tentativa do SPA após timeout) recebem a resposta gravada sem
+validar, agregar ou gravar nada de novo.
+
+Duplicatas simultâneas não correm em paralelo: o INSERT da segunda esbarra
+no índice único e o Postgres a faz esperar o commit (ou rollback) da
+primeira. Se a primeira falhar (erro de validação, exceção), a linha some e
+a seguinte executa normalmente. A chave vale por usuário e rota por
+``SGFS_IDEMPOTENCIA_HORAS`` horas.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import ChaveIdempotencia
+
+CABECALHO = 'Idempotency-Key'
+HORAS_PADRAO = 24
+
+
+def validade():
+    return timedelta(hours=getattr(settings, 'SGFS_IDEMPOTENCIA_HORAS', HORAS_PADRAO))
+
+
+def assinar(dados):
+    corpo = json.dumps(dados, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(corpo.encode()).hexdigest()
+
+
+def _reservar(usuario, rota, chave, assinatura):
+    """ (linha nova, None) para a primeira requisição; (None, linha gravada) para reenvios. """
+    try:
+        with transaction.atomic():
+            return ChaveIdempotencia.objects.create(
+                usuario=usuario, rota=rota, chave=chave, assinatura=assinatura
+            ), None
+    except IntegrityError:
+        pass
+    gravada = ChaveIdempotencia.objects.get(usuario=usuario, rota=rota, chave=chave)
+    if gravada.criada_em < timezone.now() - validade():
+        # Vencida e ainda não limpa: a chave volta a valer como nova
+        gravada.delete()
+        return _reservar(usuario, rota, chave, assinatura)
+    return None, gravada
+
+
+def idempotente(metodo):
+    """ Decora o create() de um ViewSet: sem o cabeçalho, nada muda. """
+
+    @functools.wraps(metodo)
+    def envolvido(self, request, *args, **kwargs):
+        chave = request.headers.get(CABECALHO)
+        if not chave:
+            return metodo(self, request, *args, **kwargs)
+        if len(chave) > 255:
+            raise ValidationError({CABECALHO: 'Use no máximo 255 caracteres.'})
+
+        assinatura = assinar(request.data)
+        with transaction.atomic():
+            registro, gravada = _reservar(request.user, f'{self.basename}-{self.action}', chave, assinatura)
+            if gravada is not None:
+                if gravada.assinatura != assinatura:
+                    return Response(
+                        {'detail': f'{CABECALHO} já usada com outro conteúdo.'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                return Response(gravada.resposta, status=gravada.status_code, headers={'Idempotent-Replayed': 'true'})
+
+            response = metodo(self, request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                registro.status_code = response.status_code
+                registro.resposta = response.data
+                registro.save(update_fields=['status_code', 'resposta'])
+            else:
+                # Falhou sem exceção: libera a chave para uma nova tentativa
+                registro.delete()
+            return response
+
+    return envolvido
+
+
+def limpar_vencidas():
+    """ Apaga as chaves mais velhas que a validade. Devolve quantas foram apagadas. """
+    apagadas, _ = ChaveIdempotencia.objects.filter(criada_em__lt=timezone.now() - validade()).delete()
+    return apagadas
@@ -0,0 +1,130 @@
+# estoque/inventarios.py
+"""
+Inventário (contagem física) do estoque.
+
+As contagens de uma sessão aberta são gravadas com um upsert em lote. A
+diferença entre o contado e o saldo de cada item sai de uma única query
+(fechamento + delta, ver estoque.saldos). Na aprovação, todos os ajustes são
+gravados com um bulk_create de MovimentacaoEstoque na mesma transação que
+fecha a sessão. Itens sem contagem na sessão não são ajustados.
+"""
+import csv
+import io
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from rest_framework import serializers
+
+from .lotes import ErrosPorLinha, _ids_inexistentes
+from .models import ContagemInventario, Inventario, Item, MovimentacaoEstoque
+from .saldos import anotar_saldo_em
+
+
+class ContagemLoteSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField()
+    quantidade_contada = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+
+
+def ler_planilha(arquivo):
+    """
+    Linhas de um CSV com as colunas ``item_id`` e ``quantidade_contada``,
+    separado por vírgula ou ponto e vírgula. Aceita vírgula decimal.
+    """
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig')
+    cabecalho = texto.readline()
+    separador = ';' if ';' in cabecalho else ','
+    leitor = csv.DictReader(texto, fieldnames=[c.strip() for c in cabecalho.split(separador)], delimiter=separador)
+    linhas = []
+    for linha in leitor:
+        quantidade = (linha.get('quantidade_contada') or '').strip()
+        if ',' in quantidade:  # 1.234,5
+            quantidade = quantidade.replace('.', '').replace(',', '.')
+        linhas.append({'item_id': (linha.get('item_id') or '').strip(), 'quantidade_contada': quantidade})
+    return linhas
+
+
+def gravar_contagens(inventario, linhas, lote=5_000):
+    """
+    Grava (ou substitui) as quantidades contadas com um único upsert por lote.
+    Recontar um item já contado na sessão sobrescreve a contagem anterior.
+    """
+    if inventario.status != Inventario.Status.ABERTO:
+        raise serializers.ValidationError({'non_field_errors': ['O inventário já foi aprovado.']})
+
+    erros = ErrosPorLinha(len(linhas))
+    inexistentes = _ids_inexistentes(Item, [l['item_id'] for l in linhas])
+    vistos = {}
+    for i, linha in enumerate(linhas):
+        if linha['item_id'] in inexistentes:
+            erros.add(i, 'item_id', 'Item não encontrado.')
+        if linha['item_id'] in vistos:
+            erros.add(i, 'item_id', f"Repetido na linha {vistos[linha['item_id']]}.")
+        vistos.setdefault(linha['item_id'], i)
+    erros.levantar()
+
+    ContagemInventario.objects.bulk_create(
+        [
+            ContagemInventario(inventario=inventario, item_id=l['item_id'], quantidade_contada=l['quantidade_contada'])
+            for l in linhas
+        ],
+        batch_size=lote,
+        update_conflicts=True, unique_fields=['inventario', 'item'], update_fields=['quantidade_contada'],
+    )
+    return len(linhas)
+
+
+def calcular_diferencas(inventario, corte=None):
+    """
+    Contagens anotadas com ``saldo`` e ``diferenca`` (contado - saldo). Em
+    sessões abertas o saldo é o do sistema em ``corte`` (padrão: agora); nas
+    aprovadas é o saldo gravado na aprovação.
+    """
+    contagens = inventario.contagens.all()
+    if inventario.status == Inventario.Status.APROVADO:
+        contagens = contagens.annotate(saldo=F('saldo_sistema'))
+    else:
+        contagens = anotar_saldo_em(contagens, corte or timezone.now(), nome='saldo', item='item_id')
+    return contagens.annotate(diferenca=F('quantidade_contada') - F('saldo'))
+
+
+def aprovar_inventario(inventario, usuario=None, lote=5_000):
+    """
+    Fecha a sessão e lança um ajuste para cada item com diferença: entrada se
+    sobrou, saída (quantidade negativa) se faltou. O saldo do sistema é gravado
+    em todas as contagens com um único UPDATE e só as linhas divergentes voltam
+    para o Python. Tudo ou nada. Devolve o nº de contagens e de ajustes.
+    """
+    with transaction.atomic():
+        # Trava a sessão: duas aprovações simultâneas não lançam os ajustes duas vezes
+        inventario = Inventario.objects.select_for_update().get(pk=inventario.pk)
+        if inventario.status != Inventario.Status.ABERTO:
+            raise serializers.ValidationError({'non_field_errors': ['O inventário já foi aprovado.']})
+
+        corte = timezone.now()
+        saldo = calcular_diferencas(inventario, corte).filter(pk=OuterRef('pk')).values('saldo')[:1]
+        contagens = inventario.contagens.update(saldo_sistema=Subquery(saldo))
+
+        inventario.status = Inventario.Status.APROVADO
+        inventario.aprovado_por = usuario
+        inventario.data_aprovacao = corte
+        inventario.save(update_fields=['status', 'aprovado_por', 'data_aprovacao'])
+
+        ajustes = MovimentacaoEstoque.objects.bulk_create(
+            [
+                MovimentacaoEstoque(
+                    item_id=item_id,
+                    tipo_movimento=MovimentacaoEstoque.Tipo.ENTRADA if diferenca > 0 else MovimentacaoEstoque.Tipo.SAIDA,
+                    quantidade=diferenca,
+                    observacao=f"Ajuste do inventário #{inventario.pk}",
+                    usuario_responsavel=usuario,
+                    inventario=inventario,
+                )
+                for item_id, diferenca in (
+                    calcular_diferencas(inventario).exclude(diferenca=0).values_list('item_id', 'diferenca')
+                )
+            ],
+            batch_size=lote,
+        )
+    return {'contagens': contagens, 'ajustes': len(ajustes)}
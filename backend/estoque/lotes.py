@@ -0,0 +1,202 @@
+# estoque/lotes.py
+"""
+Gravação em lote de itens, composições de kit e movimentações.
+
+Os serializers daqui validam cada linha sem ir ao banco (ids chegam como
+inteiros). As checagens que dependem do banco (nomes repetidos, ids
+existentes, saldo suficiente) rodam uma vez para o lote inteiro, e os
+erros voltam por linha, no mesmo formato do ``many=True`` do DRF.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+from crm.versoes import marcar_alteracao
+from .models import CategoriaDeItens, Item, ItemKit, MovimentacaoEstoque
+from .resumos import sincronizar_categorias
+
+
+class ItemLoteSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    nome = serializers.CharField(max_length=150)
+    descricao = serializers.CharField(required=False, allow_blank=True, default='')
+    unidade_medida = serializers.CharField(max_length=50)
+    categoria_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+
+
+class ComponenteKitSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField()
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+
+class MovimentacaoLoteSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField()
+    tipo_movimento = serializers.ChoiceField(choices=MovimentacaoEstoque.Tipo.choices)
+    quantidade = serializers.DecimalField(max_digits=10, decimal_places=2)
+    observacao = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+def validar_lote(serializer_class, dados):
+    """ Valida cada linha com ``serializer_class`` e devolve a lista de validated_data. """
+    if not isinstance(dados, list) or not dados:
+        raise serializers.ValidationError({'non_field_errors': ['Envie uma lista não vazia.']})
+    serializer = serializer_class(data=dados, many=True)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+class ErrosPorLinha:
+    """ Junta erros por linha e levanta um único ValidationError no formato many=True. """
+
+    def __init__(self, total):
+        self.erros = [{} for _ in range(total)]
+
+    def add(self, indice, campo, mensagem):
+        self.erros[indice].setdefault(campo, []).append(mensagem)
+
+    def levantar(self):
+        if any(self.erros):
+            raise serializers.ValidationError(self.erros)
+
+
+def _ids_inexistentes(model, ids):
+    ids = {i for i in ids if i is not None}
+    return ids - set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+
+def gravar_itens(linhas):
+    """
+    Cria (linhas sem id) e atualiza (linhas com id) itens com um bulk_create e
+    um bulk_update. Devolve a lista de itens gravados, na ordem recebida.
+    """
+    erros = ErrosPorLinha(len(linhas))
+
+    vistos = {}
+    for i, linha in enumerate(linhas):
+        chave = linha['nome'].strip()
+        if chave in vistos:
+            erros.add(i, 'nome', f"Repetido na linha {vistos[chave]}.")
+        vistos.setdefault(chave, i)
+
+    existentes = {i.pk: i for i in Item.objects.filter(pk__in=[l['id'] for l in linhas if l.get('id')])}
+    ocupados = dict(Item.objects.filter(nome__in=[l['nome'].strip() for l in linhas]).values_list('nome', 'pk'))
+    categorias_invalidas = _ids_inexistentes(CategoriaDeItens, [l['categoria_id'] for l in linhas])
+
+    for i, linha in enumerate(linhas):
+        if linha.get('id') and linha['id'] not in existentes:
+            erros.add(i, 'id', 'Item não encontrado.')
+        dono = ocupados.get(linha['nome'].strip())
+        if dono is not None and dono != linha.get('id'):
+            erros.add(i, 'nome', 'Já existe um item com este nome.')
+        if linha['categoria_id'] in categorias_invalidas:
+            erros.add(i, 'categoria_id', 'Categoria não encontrada.')
+    erros.levantar()
+
+    campos = ['nome', 'descricao', 'unidade_medida', 'categoria_id']
+    novos, alterados, gravados = [], [], []
+    for linha in linhas:
+        if linha.get('id'):
+            item = existentes[linha['id']]
+            for campo in campos:
+                setattr(item, campo, linha[campo].strip() if campo == 'nome' else linha[campo])
+            alterados.append(item)
+        else:
+            item = Item(**{campo: linha[campo] for campo in campos})
+            item.nome = item.nome.strip()
+            novos.append(item)
+        gravados.append(item)
+
+    Item.objects.bulk_create(novos)
+    Item.objects.bulk_update(alterados, campos)
+    # bulk_update não dispara post_save: a categoria dos resumos mensais vem daqui
+    sincronizar_categorias(alterados)
+    marcar_alteracao(Item)
+    return gravados
+
+
+def validar_componentes(linhas):
+    """ {item_id: quantidade} a partir das linhas validadas por ComponenteKitSerializer. """
+    erros = ErrosPorLinha(len(linhas))
+    inexistentes = _ids_inexistentes(Item, [l['item_id'] for l in linhas])
+    componentes = {}
+    for i, linha in enumerate(linhas):
+        if linha['item_id'] in inexistentes:
+            erros.add(i, 'item_id', 'Item não encontrado.')
+        if linha['item_id'] in componentes:
+            erros.add(i, 'item_id', 'Item repetido na composição.')
+        componentes[linha['item_id']] = linha['quantidade']
+    erros.levantar()
+    return componentes
+
+
+def aplicar_composicao(kit, componentes):
+    """
+    Ajusta os ItemKit do kit para ``componentes`` ({item_id: quantidade}) pelo
+    diff com o que está gravado: um delete para os removidos, um bulk_create
+    para os novos e um bulk_update para os que mudaram de quantidade. Linhas
+    inalteradas mantêm o id. Devolve as contagens de cada operação.
+    """
+    atuais = {ik.item_id: ik for ik in ItemKit.objects.filter(kit=kit)}
+
+    removidos = [ik.pk for item_id, ik in atuais.items() if item_id not in componentes]
+    novos, alterados = [], []
+    for item_id, quantidade in componentes.items():
+        atual = atuais.get(item_id)
+        if atual is None:
+            novos.append(ItemKit(kit=kit, item_id=item_id, quantidade=quantidade))
+        elif atual.quantidade != quantidade:
+            atual.quantidade = quantidade
+            alterados.append(atual)
+
+    if removidos:
+        ItemKit.objects.filter(pk__in=removidos).delete()
+    ItemKit.objects.bulk_create(novos)
+    ItemKit.objects.bulk_update(alterados, ['quantidade'])
+    if novos or alterados:
+        marcar_alteracao(ItemKit)
+    return {'adicionados': len(novos), 'alterados': len(alterados), 'removidos': len(removidos)}
+
+
+def saldos_dos_itens(item_ids):
+    """ Saldo atual de cada item, numa única query agregada. """
+    return dict(
+        Item.objects.filter(pk__in=item_ids).annotate(
+            saldo=Coalesce(Sum('movimentacoes__quantidade'), Decimal('0'), output_field=DecimalField())
+        ).values_list('pk', 'saldo')
+    )
+
+
+def gravar_movimentacoes(linhas, usuario=None):
+    """
+    Lança as movimentações com um único bulk_create. Saídas são gravadas com
+    quantidade negativa (mesma regra do MovimentacaoEstoqueSerializer) e o lote
+    é recusado se algum item ficar com saldo negativo.
+    """
+    erros = ErrosPorLinha(len(linhas))
+    saldos = saldos_dos_itens({l['item_id'] for l in linhas})
+
+    movs = []
+    for i, linha in enumerate(linhas):
+        if linha['item_id'] not in saldos:
+            erros.add(i, 'item_id', 'Item não encontrado.')
+            continue
+        quantidade = linha['quantidade']
+        if linha['tipo_movimento'] == MovimentacaoEstoque.Tipo.ENTRADA:
+            if quantidade < 0:
+                erros.add(i, 'quantidade', 'Quantidade deve ser positiva para entradas.')
+        else:
+            quantidade = -abs(quantidade)
+        saldos[linha['item_id']] += quantidade
+        if saldos[linha['item_id']] < 0:
+            erros.add(i, 'quantidade', f"Estoque insuficiente: saldo {saldos[linha['item_id']] - quantidade}.")
+        movs.append(MovimentacaoEstoque(
+            item_id=linha['item_id'],
+            tipo_movimento=linha['tipo_movimento'],
+            quantidade=quantidade,
+            observacao=linha['observacao'],
+            usuario_responsavel=usuario,
+        ))
+    erros.levantar()
+    return MovimentacaoEstoque.objects.bulk_create(movs)
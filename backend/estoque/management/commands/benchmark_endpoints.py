@@ -0,0 +1,125 @@
+# estoque/management/commands/benchmark_endpoints.py
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from crm.urls import router as crm_router
+from estoque.urls import router as estoque_router
+from fundo_social.metrics import percentil
+
+# Abaixo disso a variação de latência é ruído de medição
+LATENCIA_MINIMA_MS = 5.0
+
+
+def endpoints_do_router(router):
+    """ Lista (nome, url) de cada rota GET registrada: list, detail e actions de leitura. """
+    endpoints = []
+    for prefixo, viewset, basename in router.registry:
+        endpoints.append((f'{basename}-list', reverse(f'{basename}-list')))
+
+        model = viewset.queryset.model if viewset.queryset is not None else viewset.serializer_class.Meta.model
+        pk = model._default_manager.order_by('pk').values_list('pk', flat=True).first()
+        if pk is None:
+            continue
+        endpoints.append((f'{basename}-detail', reverse(f'{basename}-detail', args=[pk])))
+
+        for extra in viewset.get_extra_actions():
+            if 'get' not in extra.mapping:
+                continue
+            nome = f'{basename}-{extra.url_name}'
+            if extra.detail:
+                endpoints.append((nome, reverse(nome, args=[pk])))
+            else:
+                endpoints.append((nome, reverse(nome)))
+    return endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência e nº de queries de todas as rotas dos routers do CRM e do Estoque, '
+        'grava o resultado em JSON e falha se houver regressão em relação a uma baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help='Requisições por endpoint')
+        parser.add_argument('--saida', default='benchmark_endpoints.json', help='Arquivo JSON de resultado')
+        parser.add_argument('--baseline', help='JSON de uma execução anterior para comparação')
+        parser.add_argument('--tolerancia', type=float, default=0.25, help='Aumento relativo de latência (p50) tolerado')
+        parser.add_argument('--filtro', help='Mede apenas endpoints cujo nome contenha este texto')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes deve ser pelo menos 1.')
+
+        # Usuário em memória: superusuário passa em DjangoModelPermissions sem tocar o banco
+        usuario = User(username='benchmark', is_staff=True, is_superuser=True)
+        client = APIClient()
+        client.force_authenticate(usuario)
+
+        endpoints = endpoints_do_router(crm_router) + endpoints_do_router(estoque_router)
+        if options['filtro']:
+            endpoints = [e for e in endpoints if options['filtro'] in e[0]]
+
+        setup_test_environment()
+        try:
+            resultados = {nome: self.medir(client, url, options['repeticoes']) for nome, url in endpoints}
+        finally:
+            teardown_test_environment()
+
+        with open(options['saida'], 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+        for nome, r in sorted(resultados.items()):
+            self.stdout.write(
+                f"{nome:45} {r['status']}  p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+                f"{r['queries']:5d} queries  {r['bytes']:9d} bytes"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}"))
+
+        if options['baseline']:
+            self.comparar(resultados, options['baseline'], options['tolerancia'])
+
+    def medir(self, client, url, repeticoes):
+        client.get(url)  # aquecimento (ContentType cache, conexões, etc.)
+        latencias, queries = [], []
+        for _ in range(repeticoes):
+            with CaptureQueriesContext(connection) as ctx:
+                inicio = time.perf_counter()
+                response = client.get(url)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            queries.append(len(ctx.captured_queries))
+        latencias.sort()
+        return {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(statistics.median(latencias), 2),
+            'p95_ms': round(percentil(latencias, 95), 2),
+            'queries': max(queries),
+            'bytes': len(response.content),
+        }
+
+    def comparar(self, resultados, caminho, tolerancia):
+        with open(caminho, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressoes = []
+        for nome, atual in resultados.items():
+            anterior = baseline.get(nome)
+            if not anterior:
+                continue
+            if atual['queries'] > anterior['queries']:
+                regressoes.append(f"{nome}: queries {anterior['queries']} -> {atual['queries']}")
+            limite = anterior['p50_ms'] * (1 + tolerancia)
+            if atual['p50_ms'] > limite and atual['p50_ms'] - anterior['p50_ms'] > LATENCIA_MINIMA_MS:
+                regressoes.append(f"{nome}: p50 {anterior['p50_ms']} ms -> {atual['p50_ms']} ms")
+
+        if regressoes:
+            raise CommandError('Regressões de performance:\n  ' + '\n  '.join(regressoes))
+        self.stdout.write(self.style.SUCCESS('Nenhuma regressão em relação à baseline.'))
@@ -0,0 +1,75 @@
+# estoque/management/commands/benchmark_inventario.py
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from estoque.inventarios import aprovar_inventario, calcular_diferencas, gravar_contagens
+from estoque.models import Inventario, Item
+from estoque.saldos import anotar_saldo_em
+
+
+class Desfazer(Exception):
+    """ Levantada no fim da medição para descartar tudo o que foi gravado. """
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede gravação das contagens, cálculo das diferenças e aprovação de um inventário '
+        'com N itens. Roda numa transação desfeita no final: o banco não é alterado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=5_000, help='Itens contados no inventário')
+        parser.add_argument('--divergencia', type=float, default=0.3, help='Fração de itens com diferença')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['semente'])
+        try:
+            with transaction.atomic():
+                self.medir_tudo(options['linhas'], options['divergencia'], rng)
+                raise Desfazer
+        except Desfazer:
+            pass
+
+    def medir_tudo(self, n, divergencia, rng):
+        faltam = n - Item.objects.count()
+        if faltam > 0:
+            Item.objects.bulk_create(
+                [Item(nome=f'Item benchmark inventário {i}', unidade_medida='un') for i in range(faltam)]
+            )
+        saldos = list(
+            anotar_saldo_em(Item.objects.order_by('pk'), timezone.now(), nome='saldo').values_list('pk', 'saldo')[:n]
+        )
+        if len(saldos) < n:
+            raise CommandError('Itens insuficientes.')
+
+        linhas = []
+        for item_id, saldo in saldos:
+            contado = max(saldo, 0)
+            if rng.random() < divergencia:
+                contado = max(contado + rng.randint(-20, 20), 0)
+            linhas.append({'item_id': item_id, 'quantidade_contada': contado})
+
+        usuario = User.objects.filter(is_superuser=True).first()
+        inventario = Inventario.objects.create(descricao='Benchmark', aberto_por=usuario)
+
+        self.medir('contagens', lambda: gravar_contagens(inventario, linhas))
+        self.medir('diferencas', lambda: len(list(calcular_diferencas(inventario).values('item_id', 'saldo', 'diferenca'))))
+        resultado = self.medir('aprovacao', lambda: aprovar_inventario(inventario, usuario=usuario))
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['contagens']} contagens, {resultado['ajustes']} ajustes (transação desfeita)"
+        ))
+
+    def medir(self, nome, funcao):
+        with CaptureQueriesContext(connection) as ctx:
+            inicio = time.perf_counter()
+            resultado = funcao()
+            ms = (time.perf_counter() - inicio) * 1000
+        self.stdout.write(f"{nome:12} {ms:10.1f} ms  {len(ctx.captured_queries):4d} queries")
+        return resultado
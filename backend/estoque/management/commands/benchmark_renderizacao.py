@@ -0,0 +1,86 @@
+# estoque/management/commands/benchmark_renderizacao.py
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from crm.models import Entidade
+from fundo_social import compressao
+from fundo_social.renderers import ORJSONRenderer
+
+
+def endpoints_grandes():
+    """ (nome, url) das maiores respostas: agenda, lista e detalhe de entidade, relatório. """
+    endpoints = [('agenda-contatos', reverse('agenda-contatos')), ('entidade-list', reverse('entidade-list'))]
+    maior = Entidade.objects.annotate(n=Count('beneficiarios')).order_by('-n').values_list('pk', flat=True).first()
+    if maior is not None:
+        endpoints.append(('entidade-detail', reverse('entidade-detail', args=[maior])))
+    gestora = (
+        Entidade.objects.filter(eh_gestor=True).annotate(n=Count('doacoes_distribuidas'))
+        .order_by('-n').values_list('pk', flat=True).first()
+    )
+    if gestora is not None:
+        endpoints.append(('relatorio-entidade', reverse('relatorio-entidade', args=[gestora]) + '?page_size=100'))
+    return endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o tempo de serialização JSON (json do DRF x orjson) e os bytes na rede '
+        '(sem compressão, gzip e brotli) das maiores respostas da API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20, help='Renderizações por endpoint')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes deve ser pelo menos 1.')
+
+        usuario = User(username='benchmark', is_staff=True, is_superuser=True)
+        client = APIClient()
+        client.force_authenticate(usuario)
+
+        setup_test_environment()
+        try:
+            for nome, url in endpoints_grandes():
+                response = client.get(url)
+                if response.status_code != 200:
+                    self.stdout.write(self.style.WARNING(f'{nome}: status {response.status_code}'))
+                    continue
+                self.medir(nome, response.data, options['repeticoes'])
+        finally:
+            teardown_test_environment()
+
+    def medir(self, nome, dados, repeticoes):
+        json_ms, corpo = self.cronometrar(lambda: JSONRenderer().render(dados), repeticoes)
+        orjson_ms, corpo_orjson = self.cronometrar(lambda: ORJSONRenderer().render(dados), repeticoes)
+        if corpo_orjson != corpo:
+            self.stdout.write(self.style.ERROR(f'{nome}: saída do orjson difere do JSONRenderer'))
+
+        tamanhos = [f'{len(corpo):9d} B']
+        for codificacao in ('gzip', 'br'):
+            if codificacao == 'br' and compressao.brotli is None:
+                tamanhos.append('  brotli não instalado')
+                continue
+            ms, comprimido = self.cronometrar(lambda: compressao.comprimir(corpo, codificacao), repeticoes)
+            tamanhos.append(f'{codificacao} {len(comprimido):8d} B ({ms:6.2f} ms)')
+
+        self.stdout.write(
+            f'{nome:20} json {json_ms:8.2f} ms  orjson {orjson_ms:7.2f} ms  '
+            f'({json_ms / max(orjson_ms, 0.001):4.1f}x)  ' + '  '.join(tamanhos)
+        )
+
+    def cronometrar(self, funcao, repeticoes):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resultado = funcao()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tempos), resultado
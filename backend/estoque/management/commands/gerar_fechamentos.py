@@ -0,0 +1,33 @@
+# estoque/management/commands/gerar_fechamentos.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from estoque.resumos import inicio_do_mes
+from estoque.saldos import gerar_fechamentos
+
+
+class Command(BaseCommand):
+    help = (
+        'Grava o saldo de cada item no fechamento de cada mês já encerrado, '
+        'a partir do primeiro mês em que falta fechamento a algum item.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Refaz os fechamentos a partir deste mês (AAAA-MM)')
+        parser.add_argument('--lote', type=int, default=5_000, help='Tamanho de cada bulk_create')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                ano, mes = (int(p) for p in options['desde'].split('-')[:2])
+                desde = date(ano, mes, 1)
+            except ValueError:
+                raise CommandError('--desde deve estar no formato AAAA-MM.')
+
+        with transaction.atomic():
+            total = gerar_fechamentos(inicio_do_mes(timezone.localdate()), desde=desde, lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} fechamentos gravados.'))
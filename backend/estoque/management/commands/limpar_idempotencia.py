@@ -0,0 +1,11 @@
+# estoque/management/commands/limpar_idempotencia.py
+from django.core.management.base import BaseCommand
+
+from estoque.idempotencia import limpar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Apaga as Idempotency-Key mais velhas que SGFS_IDEMPOTENCIA_HORAS. Rodar diariamente (cron).'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'{limpar_vencidas()} chaves vencidas apagadas.'))
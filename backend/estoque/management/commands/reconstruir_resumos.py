@@ -0,0 +1,17 @@
+# estoque/management/commands/reconstruir_resumos.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from estoque.resumos import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = 'Apaga e recalcula os resumos mensais de movimentações e de doações a partir do histórico.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5_000, help='Linhas por INSERT')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = reconstruir_resumos(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} linhas de resumo gravadas.'))
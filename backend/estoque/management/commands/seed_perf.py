@@ -0,0 +1,272 @@
+# estoque/management/commands/seed_perf.py
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from crm.models import CategoriaEntidade, Entidade, Contato, PessoaFisica, Responsavel, Beneficiario
+from crm.versoes import marcar_alteracao
+from estoque.doadores import snapshot_do_doador
+from estoque.resumos import reconstruir_resumos
+from estoque.models import (
+    CategoriaDeItens, Item, Kit, ItemKit, DoacaoRecebida, ItemDoacaoRecebida,
+    DoacaoRealizada, ItemSaida, KitSaida, MovimentacaoEstoque
+)
+
+# Volumes com --escala 1
+VOLUMES = {
+    'pessoas': 50_000,
+    'entidades': 5_000,
+    'itens': 2_000,
+    'kits': 200,
+    'doacoes_recebidas': 40_000,
+    'doacoes_realizadas': 40_000,
+    'movimentacoes': 1_000_000,
+}
+
+PREFIXO_ITEM = 'Item perf'
+ANOS_DE_HISTORICO = 10
+
+
+@contextmanager
+def sem_auto_now_add(model, campo):
+    """ Permite gravar datas retroativas em campos auto_now_add durante o seed. """
+    field = model._meta.get_field(campo)
+    original = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = original
+
+
+class Command(BaseCommand):
+    help = 'Gera um volume realista de dados (PF, entidades, itens, kits, doações e movimentações) para testes de performance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', type=float, default=1.0, help='Multiplicador dos volumes (ex.: 0.01 para um seed rápido)')
+        parser.add_argument('--lote', type=int, default=5_000, help='Tamanho de cada bulk_create')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório')
+
+    def handle(self, *args, **options):
+        if Item.objects.filter(nome__startswith=PREFIXO_ITEM).exists():
+            raise CommandError('Os dados de performance já foram gerados neste banco.')
+
+        self.lote = options['lote']
+        self.rng = random.Random(options['semente'])
+        self.volumes = {k: max(1, int(v * options['escala'])) for k, v in VOLUMES.items()}
+        self.hoje = date.today()
+
+        with transaction.atomic(), sem_auto_now_add(MovimentacaoEstoque, 'data_movimento'):
+            pessoas = self.gerar_pessoas()
+            entidades, gestoras = self.gerar_entidades(pessoas)
+            itens = self.gerar_itens()
+            kits = self.gerar_kits(itens)
+            movs = self.gerar_doacoes_recebidas(itens, entidades, pessoas)
+            movs += self.gerar_doacoes_realizadas(itens, kits, gestoras)
+            self.gerar_ajustes(itens, self.volumes['movimentacoes'] - movs)
+            self.stdout.write('Reconstruindo resumos mensais...')
+            reconstruir_resumos(self.lote)
+            # bulk_create não dispara sinais: invalida os ETags das leituras
+            marcar_alteracao(
+                CategoriaEntidade, Entidade, Contato, PessoaFisica, Responsavel, Beneficiario,
+                CategoriaDeItens, Item, Kit, ItemKit, MovimentacaoEstoque,
+            )
+
+        self.stdout.write(self.style.SUCCESS('Seed de performance concluído!'))
+
+    # ---------- utilitários ----------
+
+    def bulk(self, model, objs):
+        if model is MovimentacaoEstoque:
+            # Os resumos mensais são refeitos de uma vez no final
+            return model.objects.bulk_create(objs, batch_size=self.lote, atualizar_resumos=False)
+        return model.objects.bulk_create(objs, batch_size=self.lote)
+
+    def data_aleatoria(self):
+        return self.hoje - timedelta(days=self.rng.randrange(365 * ANOS_DE_HISTORICO))
+
+    def momento(self, dia):
+        hora = time(self.rng.randrange(8, 18), self.rng.randrange(60))
+        return timezone.make_aware(datetime.combine(dia, hora))
+
+    def quantidade(self, maximo=50):
+        return Decimal(self.rng.randint(1, maximo))
+
+    # ---------- cadastros ----------
+
+    def gerar_pessoas(self):
+        n = self.volumes['pessoas']
+        self.stdout.write(f'Gerando {n} pessoas físicas...')
+        pessoas = [
+            PessoaFisica(
+                nome_completo=f'Pessoa Perf {i:06d}',
+                cpf=f'PF{i:012d}',
+                data_nascimento=date(1940, 1, 1) + timedelta(days=self.rng.randrange(365 * 65)),
+                email=f'pessoa{i}@perf.local',
+                telefone=f'11 9{i:08d}',
+            )
+            for i in range(n)
+        ]
+        return self.bulk(PessoaFisica, pessoas)
+
+    def gerar_entidades(self, pessoas):
+        n = self.volumes['entidades']
+        self.stdout.write(f'Gerando {n} entidades...')
+        categorias = [
+            CategoriaEntidade.objects.get_or_create(nome=nome)[0]
+            for nome in ('Associação Perf', 'Entidade Religiosa Perf', 'Liderança Perf')
+        ]
+        entidades = self.bulk(Entidade, [
+            Entidade(
+                razao_social=f'Entidade Perf {i:05d} LTDA',
+                nome_fantasia=f'Entidade Perf {i:05d}',
+                documento=f'PERF{i:014d}',
+                categoria=self.rng.choice(categorias),
+                bairro=f'Bairro {i % 80}',
+                eh_doador=i % 3 != 0,
+                eh_gestor=i % 2 == 0,
+                vigencia_ate=self.hoje + timedelta(days=self.rng.randrange(-200, 700)),
+            )
+            for i in range(n)
+        ])
+
+        self.bulk(Contato, [
+            Contato(entidade=e, tipo_contato=tipo, valor=f'{tipo}{e.pk}@perf.local')
+            for e in entidades for tipo in (Contato.Tipo.TELEFONE, Contato.Tipo.EMAIL)
+        ])
+        self.bulk(Responsavel, [
+            Responsavel(entidade=e, pessoa_fisica=self.rng.choice(pessoas), cargo='Presidente')
+            for e in entidades
+        ])
+        # Cada pessoa é beneficiária de no máximo uma entidade (unique_together)
+        self.bulk(Beneficiario, [
+            Beneficiario(entidade_intermediaria=self.rng.choice(entidades), pessoa_fisica=p)
+            for p in pessoas[: len(pessoas) // 2]
+        ])
+        return entidades, [e for e in entidades if e.eh_gestor]
+
+    def gerar_itens(self):
+        n = self.volumes['itens']
+        self.stdout.write(f'Gerando {n} itens...')
+        categorias = [
+            CategoriaDeItens.objects.get_or_create(nome=f'Categoria Perf {i:02d}')[0]
+            for i in range(20)
+        ]
+        return self.bulk(Item, [
+            Item(
+                nome=f'{PREFIXO_ITEM} {i:05d}',
+                unidade_medida=self.rng.choice(['un', 'kg', 'pct', 'l']),
+                categoria=self.rng.choice(categorias),
+            )
+            for i in range(n)
+        ])
+
+    def gerar_kits(self, itens):
+        n = self.volumes['kits']
+        self.stdout.write(f'Gerando {n} kits...')
+        kits = self.bulk(Kit, [Kit(nome=f'Kit Perf {i:04d}') for i in range(n)])
+        self.bulk(ItemKit, [
+            ItemKit(kit=kit, item=item, quantidade=self.quantidade(5))
+            for kit in kits
+            for item in self.rng.sample(itens, min(len(itens), self.rng.randint(3, 8)))
+        ])
+        return kits
+
+    # ---------- doações e movimentações ----------
+
+    def gerar_doacoes_recebidas(self, itens, entidades, pessoas):
+        n = self.volumes['doacoes_recebidas']
+        self.stdout.write(f'Gerando {n} doações recebidas...')
+        ct_entidade = ContentType.objects.get_for_model(Entidade)
+        ct_pessoa = ContentType.objects.get_for_model(PessoaFisica)
+
+        doacoes = []
+        for _ in range(n):
+            if self.rng.random() < 0.7:
+                ct, doador = ct_entidade, self.rng.choice(entidades)
+            else:
+                ct, doador = ct_pessoa, self.rng.choice(pessoas)
+            doacoes.append(DoacaoRecebida(
+                data_doacao=self.data_aleatoria(), content_type=ct, object_id=doador.pk,
+                **snapshot_do_doador(doador)
+            ))
+        doacoes = self.bulk(DoacaoRecebida, doacoes)
+
+        # Mesma regra do ItemDoacaoRecebida.save(): cada linha gera uma entrada
+        linhas, movs = [], []
+        for doacao in doacoes:
+            for item in self.rng.sample(itens, min(len(itens), self.rng.randint(1, 5))):
+                qtd = self.quantidade(200)
+                linhas.append(ItemDoacaoRecebida(doacao=doacao, item=item, quantidade=qtd))
+                movs.append(MovimentacaoEstoque(
+                    item=item, tipo_movimento='E', quantidade=qtd,
+                    data_movimento=self.momento(doacao.data_doacao),
+                    observacao=f'Entrada via doação ID {doacao.pk}', doacao_recebida=doacao,
+                ))
+        self.bulk(ItemDoacaoRecebida, linhas)
+        self.bulk(MovimentacaoEstoque, movs)
+        return len(movs)
+
+    def gerar_doacoes_realizadas(self, itens, kits, gestoras):
+        n = self.volumes['doacoes_realizadas']
+        self.stdout.write(f'Gerando {n} doações realizadas...')
+        composicao = {}
+        for ik in ItemKit.objects.filter(kit__in=kits).values('kit_id', 'item_id', 'quantidade'):
+            composicao.setdefault(ik['kit_id'], []).append((ik['item_id'], ik['quantidade']))
+
+        doacoes = self.bulk(DoacaoRealizada, [
+            DoacaoRealizada(data_saida=self.data_aleatoria(), entidade_gestora=self.rng.choice(gestoras))
+            for _ in range(n)
+        ])
+
+        # Mesma agregação do DoacaoRealizadaViewSet.create: uma saída por item
+        itens_saida, kits_saida, movs = [], [], []
+        for doacao in doacoes:
+            necessidades = {}
+            for item in self.rng.sample(itens, min(len(itens), self.rng.randint(0, 3))):
+                qtd = self.quantidade(10)
+                itens_saida.append(ItemSaida(doacao_realizada=doacao, item=item, quantidade=qtd))
+                necessidades[item.pk] = necessidades.get(item.pk, 0) + qtd
+            if self.rng.random() < 0.5:
+                kit = self.rng.choice(kits)
+                qtd_kits = self.rng.randint(1, 5)
+                kits_saida.append(KitSaida(doacao_realizada=doacao, kit=kit, quantidade=qtd_kits))
+                for item_id, qtd in composicao.get(kit.pk, []):
+                    necessidades[item_id] = necessidades.get(item_id, 0) + qtd * qtd_kits
+            movs.extend(
+                MovimentacaoEstoque(
+                    item_id=item_id, tipo_movimento='S', quantidade=-qtd,
+                    data_movimento=self.momento(doacao.data_saida),
+                    observacao=f'Saída via doação realizada ID {doacao.pk}', doacao_realizada=doacao,
+                )
+                for item_id, qtd in necessidades.items()
+            )
+        self.bulk(ItemSaida, itens_saida)
+        self.bulk(KitSaida, kits_saida)
+        self.bulk(MovimentacaoEstoque, movs)
+        return len(movs)
+
+    def gerar_ajustes(self, itens, n):
+        """ Completa o volume de movimentações com lançamentos avulsos (entradas e saídas). """
+        if n <= 0:
+            return
+        self.stdout.write(f'Gerando {n} movimentações avulsas...')
+        for inicio in range(0, n, self.lote):
+            movs = []
+            for _ in range(min(self.lote, n - inicio)):
+                entrada = self.rng.random() < 0.6
+                qtd = self.quantidade(30)
+                movs.append(MovimentacaoEstoque(
+                    item=self.rng.choice(itens),
+                    tipo_movimento='E' if entrada else 'S',
+                    quantidade=qtd if entrada else -qtd,
+                    data_movimento=self.momento(self.data_aleatoria()),
+                    observacao='Ajuste (seed de performance)',
+                ))
+            MovimentacaoEstoque.objects.bulk_create(movs, atualizar_resumos=False)
@@ -0,0 +1,14 @@
+# estoque/management/commands/sincronizar_doadores.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from estoque.doadores import reconstruir_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Recalcula nome, tipo e documento do doador gravados em todas as Doações Recebidas.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = reconstruir_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'{total} doações sincronizadas.'))
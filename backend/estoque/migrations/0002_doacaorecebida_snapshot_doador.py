@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:07
+
+from django.db import migrations, models
+
+# Preenche o snapshot das doações já existentes (mesma regra de estoque.doadores)
+SQL_BACKFILL = r"""
+UPDATE estoque_doacaorecebida d
+   SET doador_tipo = 'PJ',
+       doador_nome = COALESCE(NULLIF(e.nome_fantasia, ''), e.razao_social),
+       doador_documento = regexp_replace(COALESCE(e.documento, ''), '\D', '', 'g')
+  FROM crm_entidade e, django_content_type ct
+ WHERE d.content_type_id = ct.id AND ct.app_label = 'crm' AND ct.model = 'entidade'
+   AND e.id = d.object_id;
+
+UPDATE estoque_doacaorecebida d
+   SET doador_tipo = 'PF',
+       doador_nome = p.nome_completo,
+       doador_documento = regexp_replace(COALESCE(p.cpf, ''), '\D', '', 'g')
+  FROM crm_pessoafisica p, django_content_type ct
+ WHERE d.content_type_id = ct.id AND ct.app_label = 'crm' AND ct.model = 'pessoafisica'
+   AND p.id = d.object_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('crm', '0003_alerta'),
+        ('estoque', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doacaorecebida',
+            name='doador_documento',
+            field=models.CharField(blank=True, db_index=True, max_length=18, verbose_name='Documento do Doador'),
+        ),
+        migrations.AddField(
+            model_name='doacaorecebida',
+            name='doador_nome',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Nome do Doador'),
+        ),
+        migrations.AddField(
+            model_name='doacaorecebida',
+            name='doador_tipo',
+            field=models.CharField(blank=True, choices=[('PF', 'Pessoa Física'), ('PJ', 'Entidade')], max_length=2, verbose_name='Tipo de Doador'),
+        ),
+        migrations.AddIndex(
+            model_name='doacaorecebida',
+            index=models.Index(fields=['content_type', 'object_id'], name='doacaorecebida_doador_idx'),
+        ),
+        migrations.RunSQL(SQL_BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('crm', '0003_alerta'),
+        ('estoque', '0002_doacaorecebida_snapshot_doador'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='doacaorecebida',
+            name='doacaorecebida_doador_idx',
+        ),
+        migrations.AddIndex(
+            model_name='doacaorealizada',
+            index=models.Index(fields=['entidade_gestora', 'data_saida'], name='doacaorealizada_gestora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doacaorecebida',
+            index=models.Index(fields=['content_type', 'object_id', 'data_doacao'], name='doacaorecebida_doador_data_idx'),
+        ),
+    ]
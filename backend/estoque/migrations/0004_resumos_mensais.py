@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Liga as movimentações já existentes às doações pelo texto da observação
+# (formatos gravados pelo ItemDoacaoRecebida.save, pelo DoacaoRealizadaViewSet e pelo admin)
+SQL_VINCULAR_DOACOES = r"""
+UPDATE estoque_movimentacaoestoque m
+   SET doacao_recebida_id = d.id
+  FROM estoque_doacaorecebida d
+ WHERE m.observacao ~ '^Entrada via doação ID \d+$'
+   AND d.id = substring(m.observacao FROM '(\d+)$')::bigint;
+
+UPDATE estoque_movimentacaoestoque m
+   SET doacao_realizada_id = d.id
+  FROM estoque_doacaorealizada d
+ WHERE m.observacao ~ '^Saída via doação (realizada ID \d+$|\(ItemSaida\) ID \d+ - Doação \d+$)'
+   AND d.id = substring(m.observacao FROM '(\d+)$')::bigint;
+
+UPDATE estoque_movimentacaoestoque m
+   SET doacao_realizada_id = k.doacao_realizada_id
+  FROM estoque_kitsaida k
+ WHERE m.observacao ~ '^Saída via doação \(KitSaida\) ID \d+ - '
+   AND k.id = substring(m.observacao FROM '\(KitSaida\) ID (\d+)')::bigint;
+"""
+
+# Carga inicial dos resumos (mesma regra de estoque.resumos.reconstruir_resumos)
+SQL_CARGA_RESUMOS = r"""
+INSERT INTO estoque_resumomensalmovimentacao (mes, item_id, categoria_id, entidade_id, direcao, quantidade, movimentacoes)
+SELECT date_trunc('month', m.data_movimento AT TIME ZONE 'UTC')::date, m.item_id, i.categoria_id, e.id,
+       m.tipo_movimento, SUM(ABS(m.quantidade)), COUNT(*)
+  FROM estoque_movimentacaoestoque m
+  JOIN estoque_item i ON i.id = m.item_id
+  LEFT JOIN estoque_doacaorealizada dr ON dr.id = m.doacao_realizada_id
+  LEFT JOIN estoque_doacaorecebida dd ON dd.id = m.doacao_recebida_id
+  LEFT JOIN django_content_type ct ON ct.id = dd.content_type_id AND ct.app_label = 'crm' AND ct.model = 'entidade'
+  LEFT JOIN crm_entidade e ON e.id = CASE WHEN m.tipo_movimento = 'S' THEN dr.entidade_gestora_id
+                                          WHEN ct.id IS NOT NULL THEN dd.object_id END
+ GROUP BY 1, 2, 3, 4, 5;
+
+INSERT INTO estoque_resumomensaldoacao (mes, entidade_id, direcao, doacoes)
+SELECT date_trunc('month', d.data_doacao)::date, e.id, 'E', COUNT(*)
+  FROM estoque_doacaorecebida d
+  LEFT JOIN django_content_type ct ON ct.id = d.content_type_id AND ct.app_label = 'crm' AND ct.model = 'entidade'
+  LEFT JOIN crm_entidade e ON e.id = d.object_id AND ct.id IS NOT NULL
+ GROUP BY 1, 2
+UNION ALL
+SELECT date_trunc('month', d.data_saida)::date, d.entidade_gestora_id, 'S', COUNT(*)
+  FROM estoque_doacaorealizada d
+ GROUP BY 1, 2;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('crm', '0003_alerta'),
+        ('estoque', '0003_indices_historico_entidade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentacaoestoque',
+            name='doacao_realizada',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentacoes', to='estoque.doacaorealizada', verbose_name='Doação Realizada'),
+        ),
+        migrations.AddField(
+            model_name='movimentacaoestoque',
+            name='doacao_recebida',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentacoes', to='estoque.doacaorecebida', verbose_name='Doação Recebida'),
+        ),
+        migrations.CreateModel(
+            name='ResumoMensalDoacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('direcao', models.CharField(choices=[('E', 'Entrada'), ('S', 'Saída')], max_length=1, verbose_name='Direção')),
+                ('doacoes', models.IntegerField(default=0)),
+                ('entidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crm.entidade')),
+            ],
+            options={
+                'verbose_name': 'Resumo Mensal de Doações',
+                'verbose_name_plural': 'Resumos Mensais de Doações',
+                'indexes': [models.Index(fields=['mes', 'direcao'], name='resumodoacao_mes_idx'), models.Index(fields=['entidade', 'mes'], name='resumodoacao_entidade_mes_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoMensalMovimentacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('direcao', models.CharField(choices=[('E', 'Entrada'), ('S', 'Saída')], max_length=1, verbose_name='Direção')),
+                ('quantidade', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('movimentacoes', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='estoque.categoriadeitens')),
+                ('entidade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crm.entidade')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_mensais', to='estoque.item')),
+            ],
+            options={
+                'verbose_name': 'Resumo Mensal de Movimentações',
+                'verbose_name_plural': 'Resumos Mensais de Movimentações',
+                'indexes': [models.Index(fields=['mes', 'item'], name='resumomov_mes_item_idx'), models.Index(fields=['categoria', 'mes'], name='resumomov_categoria_mes_idx'), models.Index(fields=['entidade', 'mes'], name='resumomov_entidade_mes_idx')],
+            },
+        ),
+        migrations.RunSQL(SQL_VINCULAR_DOACOES, migrations.RunSQL.noop),
+        migrations.RunSQL(SQL_CARGA_RESUMOS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0004_resumos_mensais'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['item', 'data_movimento'], name='movimentacao_item_data_idx'),
+        ),
+    ]
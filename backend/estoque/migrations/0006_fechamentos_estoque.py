@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0005_indice_movimentacao_item_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FechamentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_corte', models.DateTimeField(verbose_name='Data de Corte')),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fechamentos', to='estoque.item')),
+            ],
+            options={
+                'verbose_name': 'Fechamento de Estoque',
+                'verbose_name_plural': 'Fechamentos de Estoque',
+                'constraints': [models.UniqueConstraint(fields=('item', 'data_corte'), name='fechamento_item_corte_unico')],
+            },
+        ),
+    ]
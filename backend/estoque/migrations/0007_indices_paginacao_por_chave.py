@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('crm', '0003_alerta'),
+        ('estoque', '0006_fechamentos_estoque'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doacaorealizada',
+            index=models.Index(fields=['data_saida', 'id'], name='doacaorealizada_data_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doacaorecebida',
+            index=models.Index(fields=['data_doacao', 'id'], name='doacaorecebida_data_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data_movimento', 'id'], name='movimentacao_data_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0007_indices_paginacao_por_chave'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['usuario_responsavel', 'data_movimento'], name='movimentacao_usuario_data_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0008_indice_movimentacao_usuario_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('descricao', models.CharField(max_length=255, verbose_name='Descrição')),
+                ('status', models.CharField(choices=[('A', 'Aberto'), ('P', 'Aprovado')], default='A', max_length=1)),
+                ('observacoes', models.TextField(blank=True, verbose_name='Observações')),
+                ('data_abertura', models.DateTimeField(auto_now_add=True, verbose_name='Data de Abertura')),
+                ('data_aprovacao', models.DateTimeField(blank=True, null=True, verbose_name='Data de Aprovação')),
+                ('aberto_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Aberto por')),
+                ('aprovado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Aprovado por')),
+            ],
+            options={
+                'verbose_name': 'Inventário',
+                'verbose_name_plural': 'Inventários',
+                'ordering': ['-data_abertura'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimentacaoestoque',
+            name='inventario',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentacoes', to='estoque.inventario', verbose_name='Inventário'),
+        ),
+        migrations.CreateModel(
+            name='ContagemInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade_contada', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Quantidade Contada')),
+                ('saldo_sistema', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='Saldo do Sistema')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='contagens', to='estoque.item')),
+                ('inventario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contagens', to='estoque.inventario')),
+            ],
+            options={
+                'verbose_name': 'Contagem de Inventário',
+                'verbose_name_plural': 'Contagens de Inventário',
+                'constraints': [models.UniqueConstraint(fields=('inventario', 'item'), name='contagem_inventario_item_unica')],
+            },
+        ),
+    ]
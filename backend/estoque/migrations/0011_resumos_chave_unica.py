@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:40
+
+from django.db import migrations, models
+
+# Junta numa linha só as linhas com a mesma chave (gravações concorrentes
+# anteriores à restrição); o GROUP BY trata NULL como valor, como a restrição.
+# As FKs são conferidas já no comando: checagens adiadas impediriam o ALTER TABLE.
+SQL_FUNDIR_DUPLICADAS = """
+SET CONSTRAINTS ALL IMMEDIATE;
+
+WITH antigas AS (
+    DELETE FROM estoque_resumomensalmovimentacao RETURNING *
+)
+INSERT INTO estoque_resumomensalmovimentacao (mes, item_id, categoria_id, entidade_id, direcao, quantidade, movimentacoes)
+SELECT mes, item_id, categoria_id, entidade_id, direcao, SUM(quantidade), SUM(movimentacoes)
+FROM antigas GROUP BY mes, item_id, categoria_id, entidade_id, direcao;
+
+WITH antigas AS (
+    DELETE FROM estoque_resumomensaldoacao RETURNING *
+)
+INSERT INTO estoque_resumomensaldoacao (mes, entidade_id, direcao, doacoes)
+SELECT mes, entidade_id, direcao, SUM(doacoes)
+FROM antigas GROUP BY mes, entidade_id, direcao;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_alerta_nao_lido_idx'),
+        ('estoque', '0010_chaves_idempotencia'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL_FUNDIR_DUPLICADAS, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='resumomensaldoacao',
+            constraint=models.UniqueConstraint(fields=('mes', 'entidade', 'direcao'), name='resumodoacao_chave_unica', nulls_distinct=False),
+        ),
+        migrations.AddConstraint(
+            model_name='resumomensalmovimentacao',
+            constraint=models.UniqueConstraint(fields=('mes', 'item', 'categoria', 'entidade', 'direcao'), name='resumomov_chave_unica', nulls_distinct=False),
+        ),
+    ]
@@ -1,9 +1,12 @@
 # estoque/models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User
+from rest_framework.utils.encoders import JSONEncoder
 from crm.models import Entidade
+from .doadores import snapshot_do_doador
+from . import resumos
 
 class CategoriaDeItens(models.Model):
     nome = models.CharField(max_length=150, unique=True)
@@ -75,15 +78,54 @@ class DoacaoRecebida(models.Model):
     object_id = models.PositiveIntegerField()
     doador = GenericForeignKey('content_type', 'object_id')
 
+    # Snapshot do doador no momento da gravação (mantido em dia por estoque.signals),
+    # para que listas e rankings não precisem resolver o GenericForeignKey.
+    class TipoDoador(models.TextChoices):
+        PESSOA_FISICA = 'PF', 'Pessoa Física'
+        ENTIDADE = 'PJ', 'Entidade'
+
+    doador_nome = models.CharField(max_length=255, blank=True, verbose_name="Nome do Doador")
+    doador_tipo = models.CharField(max_length=2, choices=TipoDoador.choices, blank=True, verbose_name="Tipo de Doador")
+    doador_documento = models.CharField(max_length=18, blank=True, db_index=True, verbose_name="Documento do Doador")
+
     observacoes = models.TextField(blank=True, verbose_name="Observações")
     data_registro = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name = "Doação Recebida"
         verbose_name_plural = "Doações Recebidas"
+        indexes = [
+            # histórico de um doador em ordem de data (relatório da entidade)
+            models.Index(fields=['content_type', 'object_id', 'data_doacao'], name='doacaorecebida_doador_data_idx'),
+            # paginação por chave (estoque.pagination)
+            models.Index(fields=['data_doacao', 'id'], name='doacaorecebida_data_id_idx'),
+        ]
 
     def __str__(self):
-        return f"Doação de {self.doador} em {self.data_doacao.strftime('%d/%m/%Y')}"
+        return f"Doação de {self.doador_nome or self.doador} em {self.data_doacao.strftime('%d/%m/%Y')}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Doador gravado, para o save() saber se ele mudou
+        instancia._doador_salvo = (instancia.__dict__.get('content_type_id'), instancia.__dict__.get('object_id'))
+        return instancia
+
+    def save(self, *args, **kwargs):
+        # O snapshot só é refeito na criação ou na troca de doador; de resto quem
+        # o mantém é o signal do doador, e o doador apagado não apaga o histórico.
+        # Trocar para um doador inexistente limpa o snapshot (não herda o do anterior).
+        doador_atual = (self.content_type_id, self.object_id)
+        if (
+            self.content_type_id and self.object_id
+            and (self._state.adding or getattr(self, '_doador_salvo', None) != doador_atual)
+        ):
+            for campo, valor in snapshot_do_doador(self.doador).items():
+                setattr(self, campo, valor)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'doador_nome', 'doador_tipo', 'doador_documento'}
+        super().save(*args, **kwargs)
+        self._doador_salvo = doador_atual
 
 
 class ItemDoacaoRecebida(models.Model):
@@ -102,7 +144,8 @@ class ItemDoacaoRecebida(models.Model):
             item=self.item,
             tipo_movimento='E', # 'E' para Entrada
             quantidade=self.quantidade, # Quantidade positiva
-            observacao=f"Entrada via doação ID {self.doacao_id if self.doacao_id else 'Nova'}"
+            observacao=f"Entrada via doação ID {self.doacao_id if self.doacao_id else 'Nova'}",
+            doacao_recebida_id=self.doacao_id,
         )
         super().save(*args, **kwargs) # ... AGORA salva o item da doação.
     
@@ -110,6 +153,25 @@ class ItemDoacaoRecebida(models.Model):
         verbose_name = "Item de Doação Recebida"
         verbose_name_plural = "Itens de Doações Recebidas"
         
+class MovimentacaoEstoqueQuerySet(models.QuerySet):
+    """ Mantém os resumos mensais (estoque.resumos) em dia nas gravações em lote. """
+
+    def bulk_create(self, objs, *args, atualizar_resumos=True, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if atualizar_resumos:
+                resumos.registrar_movimentacoes(self.model.objects.filter(pk__in=[o.pk for o in objs]))
+        return objs
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            resumos.registrar_movimentacoes(self, sinal=-1)
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class MovimentacaoEstoque(models.Model):
     class Tipo(models.TextChoices):
         ENTRADA = 'E', 'Entrada'
@@ -132,15 +194,64 @@ class MovimentacaoEstoque(models.Model):
         verbose_name="Usuário Responsável"
     )
     observacao = models.TextField(blank=True, verbose_name="Observação")
+
+    # Origem da movimentação (vazio para lançamentos avulsos)
+    doacao_recebida = models.ForeignKey(
+        DoacaoRecebida,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimentacoes',
+        verbose_name="Doação Recebida"
+    )
+    doacao_realizada = models.ForeignKey(
+        'DoacaoRealizada',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimentacoes',
+        verbose_name="Doação Realizada"
+    )
+    inventario = models.ForeignKey(
+        'Inventario',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimentacoes',
+        verbose_name="Inventário"
+    )
+
+    objects = MovimentacaoEstoqueQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Movimentação de Estoque"
         verbose_name_plural = "Movimentações de Estoque"
         ordering = ['-data_movimento'] # Ordena as movimentações da mais recente para a mais antiga
+        indexes = [
+            # histórico/estatísticas de um item num intervalo de datas
+            models.Index(fields=['item', 'data_movimento'], name='movimentacao_item_data_idx'),
+            # paginação por chave (estoque.pagination)
+            models.Index(fields=['data_movimento', 'id'], name='movimentacao_data_id_idx'),
+            # movimentações de um usuário num período
+            models.Index(fields=['usuario_responsavel', 'data_movimento'], name='movimentacao_usuario_data_idx'),
+        ]
 
     def __str__(self):
         return f'{self.get_tipo_movimento_display()} de {self.quantidade} {self.item.unidade_medida}(s) de {self.item.nome}'
 
+    def save(self, *args, **kwargs):
+        # Na edição, estorna dos resumos o valor antigo antes de somar o novo
+        with transaction.atomic():
+            if not self._state.adding:
+                resumos.registrar_movimentacoes(MovimentacaoEstoque.objects.filter(pk=self.pk), sinal=-1)
+            super().save(*args, **kwargs)
+            resumos.registrar_movimentacoes(MovimentacaoEstoque.objects.filter(pk=self.pk))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resumos.registrar_movimentacoes(MovimentacaoEstoque.objects.filter(pk=self.pk), sinal=-1)
+            return super().delete(*args, **kwargs)
+
 class DoacaoRealizada(models.Model):
     """ Registra um evento de saída de doação para um beneficiário. """
     data_saida = models.DateField(verbose_name="Data da Saída")
@@ -155,6 +266,14 @@ class DoacaoRealizada(models.Model):
 
     observacoes = models.TextField(blank=True, verbose_name="Observações")
     data_registro = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # histórico de atendimentos de uma gestora em ordem de data
+            models.Index(fields=['entidade_gestora', 'data_saida'], name='doacaorealizada_gestora_idx'),
+            # paginação por chave (estoque.pagination)
+            models.Index(fields=['data_saida', 'id'], name='doacaorealizada_data_id_idx'),
+        ]
     
     def __str__(self):
         nome = (
@@ -174,4 +293,152 @@ class KitSaida(models.Model):
     """ Kit que saiu em uma doação. """
     doacao_realizada = models.ForeignKey(DoacaoRealizada, related_name="kits_saida", on_delete=models.CASCADE)
     kit = models.ForeignKey(Kit, on_delete=models.PROTECT)
-    quantidade = models.PositiveIntegerField()
\ No newline at end of file
+    quantidade = models.PositiveIntegerField()
+
+
+class ResumoMensalMovimentacao(models.Model):
+    """
+    Movimentações de estoque pré-agregadas por mês. Mantido por estoque.resumos;
+    ``manage.py reconstruir_resumos`` refaz a tabela a partir do histórico.
+    """
+    mes = models.DateField(verbose_name="Mês")  # sempre o dia 1º
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='resumos_mensais')
+    categoria = models.ForeignKey(CategoriaDeItens, on_delete=models.SET_NULL, null=True, blank=True)
+    # Doadora (pessoa jurídica) nas entradas, gestora nas saídas
+    entidade = models.ForeignKey(Entidade, on_delete=models.SET_NULL, null=True, blank=True)
+    direcao = models.CharField(max_length=1, choices=MovimentacaoEstoque.Tipo.choices, verbose_name="Direção")
+    quantidade = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    movimentacoes = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumo Mensal de Movimentações"
+        verbose_name_plural = "Resumos Mensais de Movimentações"
+        indexes = [
+            models.Index(fields=['mes', 'item'], name='resumomov_mes_item_idx'),
+            models.Index(fields=['categoria', 'mes'], name='resumomov_categoria_mes_idx'),
+            models.Index(fields=['entidade', 'mes'], name='resumomov_entidade_mes_idx'),
+        ]
+        constraints = [
+            # Uma linha por chave (NULL conta como valor): estoque.resumos grava com ON CONFLICT
+            models.UniqueConstraint(
+                fields=['mes', 'item', 'categoria', 'entidade', 'direcao'],
+                name='resumomov_chave_unica', nulls_distinct=False,
+            ),
+        ]
+
+
+class ResumoMensalDoacao(models.Model):
+    """ Quantidade de doações recebidas/realizadas por mês e entidade. """
+    mes = models.DateField(verbose_name="Mês")
+    entidade = models.ForeignKey(Entidade, on_delete=models.SET_NULL, null=True, blank=True)
+    direcao = models.CharField(max_length=1, choices=MovimentacaoEstoque.Tipo.choices, verbose_name="Direção")
+    doacoes = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumo Mensal de Doações"
+        verbose_name_plural = "Resumos Mensais de Doações"
+        indexes = [
+            models.Index(fields=['mes', 'direcao'], name='resumodoacao_mes_idx'),
+            models.Index(fields=['entidade', 'mes'], name='resumodoacao_entidade_mes_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['mes', 'entidade', 'direcao'], name='resumodoacao_chave_unica', nulls_distinct=False,
+            ),
+        ]
+
+
+class FechamentoEstoque(models.Model):
+    """
+    Saldo de um item no fechamento do mês: soma das movimentações anteriores
+    a ``data_corte`` (1º instante do mês seguinte). Gravado por
+    ``manage.py gerar_fechamentos``; ver estoque.saldos.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='fechamentos')
+    data_corte = models.DateTimeField(verbose_name="Data de Corte")
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Fechamento de Estoque"
+        verbose_name_plural = "Fechamentos de Estoque"
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'data_corte'], name='fechamento_item_corte_unico'),
+        ]
+
+
+class Inventario(models.Model):
+    """
+    Sessão de contagem física do estoque. As contagens são lançadas enquanto
+    a sessão está aberta; na aprovação, a diferença entre o contado e o saldo
+    de cada item vira uma movimentação de ajuste (ver estoque.inventarios).
+    """
+    class Status(models.TextChoices):
+        ABERTO = 'A', 'Aberto'
+        APROVADO = 'P', 'Aprovado'
+
+    descricao = models.CharField(max_length=255, verbose_name="Descrição")
+    status = models.CharField(max_length=1, choices=Status.choices, default=Status.ABERTO)
+    observacoes = models.TextField(blank=True, verbose_name="Observações")
+    data_abertura = models.DateTimeField(auto_now_add=True, verbose_name="Data de Abertura")
+    aberto_por = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="Aberto por"
+    )
+    data_aprovacao = models.DateTimeField(null=True, blank=True, verbose_name="Data de Aprovação")
+    aprovado_por = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="Aprovado por"
+    )
+
+    class Meta:
+        verbose_name = "Inventário"
+        verbose_name_plural = "Inventários"
+        ordering = ['-data_abertura']
+
+    def __str__(self):
+        return f'Inventário #{self.pk} - {self.descricao}'
+
+
+class ContagemInventario(models.Model):
+    """ Quantidade contada de um item numa sessão de inventário. """
+    inventario = models.ForeignKey(Inventario, on_delete=models.CASCADE, related_name='contagens')
+    item = models.ForeignKey(Item, on_delete=models.PROTECT, related_name='contagens')
+    quantidade_contada = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Quantidade Contada")
+    # Saldo do sistema no momento da aprovação (vazio enquanto a sessão está aberta)
+    saldo_sistema = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, verbose_name="Saldo do Sistema")
+
+    class Meta:
+        verbose_name = "Contagem de Inventário"
+        verbose_name_plural = "Contagens de Inventário"
+        constraints = [
+            models.UniqueConstraint(fields=['inventario', 'item'], name='contagem_inventario_item_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantidade_contada} de {self.item.nome} (inventário #{self.inventario_id})'
+
+
+class ChaveIdempotencia(models.Model):
+    """
+    Resposta de um POST enviado com Idempotency-Key (ver estoque.idempotencia).
+    Reenvios com a mesma chave recebem esta resposta sem gravar de novo.
+    ``manage.py limpar_idempotencia`` apaga as linhas vencidas.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    rota = models.CharField(max_length=50)  # basename-ação da view
+    chave = models.CharField(max_length=255)
+    # sha256 do corpo: a mesma chave com outro conteúdo é recusada
+    assinatura = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    resposta = models.JSONField(null=True, encoder=JSONEncoder)
+    criada_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Chave de Idempotência"
+        verbose_name_plural = "Chaves de Idempotência"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'rota', 'chave'], name='idempotencia_chave_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.rota} {self.chave}'
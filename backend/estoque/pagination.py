@@ -0,0 +1,149 @@
+# estoque/pagination.py
+"""
+Paginação por chave (keyset) para listas que crescem sem parar: o livro de
+movimentações e as doações.
+
+A página seguinte é pedida a partir da última linha vista, com
+``(campo, id) < (valor, id)`` em vez de OFFSET. Toda página sai de um range
+scan no índice (campo, id) e custa o mesmo que a primeira. Não há COUNT(*)
+por padrão: ``?com_total=1`` conta de verdade e ``?com_total=estimado`` usa
+a estimativa do planejador do Postgres.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimar_linhas(queryset):
+    """ Linhas previstas pelo planejador (EXPLAIN), sem executar a query. """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plano = cursor.fetchone()[0]
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return int(plano[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    A subclasse (ou a view, via ``keyset_campo``) define o campo de ordenação;
+    o desempate é sempre a pk. A ordem é decrescente (mais recentes primeiro).
+    """
+    campo = None
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'com_total'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.campo = getattr(view, 'keyset_campo', None) or self.campo
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.total = self.contar(queryset, request.query_params.get(self.total_query_param))
+
+        posicao = self.decodificar(request.query_params.get(self.cursor_query_param), queryset.model)
+        self.voltando = bool(posicao and posicao['voltar'])
+
+        if posicao is None:
+            linhas = queryset.order_by(f'-{self.campo}', '-pk')
+        elif self.voltando:
+            # Página anterior: lê na ordem inversa a partir da posição e desinverte no fim
+            linhas = queryset.filter(
+                Q(**{f'{self.campo}__gte': posicao['valor']}),
+                Q(**{f'{self.campo}__gt': posicao['valor']}) | Q(pk__gt=posicao['pk']),
+            ).order_by(self.campo, 'pk')
+        else:
+            linhas = queryset.filter(
+                Q(**{f'{self.campo}__lte': posicao['valor']}),
+                Q(**{f'{self.campo}__lt': posicao['valor']}) | Q(pk__lt=posicao['pk']),
+            ).order_by(f'-{self.campo}', '-pk')
+
+        pagina = list(linhas[:self.page_size + 1])
+        tem_mais = len(pagina) > self.page_size
+        pagina = pagina[:self.page_size]
+        if self.voltando:
+            pagina.reverse()
+
+        self.proxima = pagina[-1] if pagina and (tem_mais or self.voltando) else None
+        self.anterior = pagina[0] if pagina and posicao and (tem_mais or not self.voltando) else None
+        return pagina
+
+    def get_page_size(self, request):
+        try:
+            pedido = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(pedido, self.max_page_size))
+
+    def contar(self, queryset, modo):
+        if not modo:
+            return None
+        if modo == 'estimado':
+            return {'count': self.estimar(queryset), 'count_estimado': True}
+        return {'count': queryset.count(), 'count_estimado': False}
+
+    def estimar(self, queryset):
+        return estimar_linhas(queryset)
+
+    # ---------- cursor ----------
+
+    def codificar(self, obj, voltar):
+        valor = getattr(obj, self.campo)
+        dados = {'v': valor.isoformat() if hasattr(valor, 'isoformat') else valor, 'pk': obj.pk}
+        if voltar:
+            dados['r'] = 1
+        cursor = base64.urlsafe_b64encode(json.dumps(dados).encode()).decode()
+        url = replace_query_param(self.base_url, self.cursor_query_param, cursor)
+        return remove_query_param(url, self.total_query_param)
+
+    def decodificar(self, cursor, modelo):
+        if not cursor:
+            return None
+        try:
+            dados = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            # Converte já aqui: um valor que não serve para o campo viraria erro 500 no filtro
+            valor = modelo._meta.get_field(self.campo).to_python(dados['v'])
+            if valor is None:
+                raise ValueError
+            return {'valor': valor, 'pk': int(dados['pk']), 'voltar': bool(dados.get('r'))}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound('Cursor inválido.')
+
+    def get_next_link(self):
+        return self.codificar(self.proxima, voltar=False) if self.proxima else None
+
+    def get_previous_link(self):
+        return self.codificar(self.anterior, voltar=True) if self.anterior else None
+
+    def get_paginated_response(self, data):
+        resposta = OrderedDict()
+        if self.total is not None:
+            resposta.update(self.total)
+        resposta['next'] = self.get_next_link()
+        resposta['previous'] = self.get_previous_link()
+        resposta['results'] = data
+        return Response(resposta)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'count_estimado': {'type': 'boolean'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,255 @@
+# estoque/resumos.py
+"""
+Resumos mensais pré-agregados do estoque.
+
+ResumoMensalMovimentacao guarda quantidade e nº de movimentações por
+(mês, item, categoria, entidade, direção); ResumoMensalDoacao guarda o nº de
+doações por (mês, entidade, direção). A entidade é a doadora (quando pessoa
+jurídica) nas entradas e a gestora nas saídas.
+
+Os dois são mantidos a cada gravação: MovimentacaoEstoque e seu QuerySet
+chamam registrar_movimentacoes() (que também invalida os fechamentos de
+estoque.saldos e a versão da tabela, ver crm.versoes), e estoque.signals
+chama registrar_doacao() para as doações. Cada chave tem uma linha só
+(restrição única, com NULL contando como valor) e os contadores são somados
+com INSERT ... ON CONFLICT DO UPDATE: gravações concorrentes da mesma chave
+esperam uma pela outra em vez de criar linhas repetidas.
+
+A atribuição das movimentações também muda sem que elas sejam gravadas, e
+estoque.signals cobre esses casos: trocar a doadora ou a gestora de uma
+doação e apagar a doação (o SET_NULL em MovimentacaoEstoque.doacao_* deixa
+as movimentações sem entidade) passam por reatribuir_movimentacoes(); trocar
+a categoria de um item (save ou gravar_itens) passa por
+sincronizar_categorias(). Apagar uma entidade ou categoria funde as linhas
+dela nas linhas sem entidade/categoria (fundir_em_nulo()). Gravações que pulam signals e o próprio código
+(QuerySet.update() em doações e itens, SQL direto) deixam os resumos
+defasados: ``manage.py reconstruir_resumos`` refaz as tabelas a partir do
+histórico.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, models
+from django.db.models import Case, Count, F, Q, Sum, When
+from django.db.models.functions import Abs, TruncMonth
+
+from crm.models import Entidade
+from crm.versoes import marcar_alteracao
+
+CHAVE_MOVIMENTACAO = ('mes', 'item_id', 'categoria_id', 'entidade_id', 'direcao')
+CHAVE_DOACAO = ('mes', 'entidade_id', 'direcao')
+
+
+def inicio_do_mes(data):
+    # Aceita também a data em texto, como chega de Model.objects.create(data_doacao='2025-01-10')
+    return models.DateField().to_python(data).replace(day=1)
+
+
+def _entidade_da_movimentacao():
+    ct_entidade = ContentType.objects.get_for_model(Entidade)
+    return Case(
+        When(tipo_movimento='S', then=F('doacao_realizada__entidade_gestora_id')),
+        When(doacao_recebida__content_type=ct_entidade, then=F('doacao_recebida__object_id')),
+        output_field=models.BigIntegerField(),
+    )
+
+
+def agregar_movimentacoes(queryset):
+    """ Linhas de ResumoMensalMovimentacao (dicts) somadas no banco a partir das movimentações. """
+    linhas = (
+        queryset.order_by()
+        .annotate(
+            mes_resumo=TruncMonth('data_movimento', output_field=models.DateField()),
+            entidade_resumo=_entidade_da_movimentacao(),
+        )
+        .values('mes_resumo', 'item_id', 'item__categoria_id', 'entidade_resumo', 'tipo_movimento')
+        .annotate(total=Sum(Abs('quantidade')), n=Count('id'))
+    )
+    return [
+        {
+            'mes': linha['mes_resumo'],
+            'item_id': linha['item_id'],
+            'categoria_id': linha['item__categoria_id'],
+            'entidade_id': linha['entidade_resumo'],
+            'direcao': linha['tipo_movimento'],
+            'quantidade': linha['total'],
+            'movimentacoes': linha['n'],
+        }
+        for linha in linhas
+    ]
+
+
+def chave_da_doacao(doacao):
+    """ Chave de ResumoMensalDoacao para uma DoacaoRecebida ou DoacaoRealizada. """
+    from .models import DoacaoRecebida
+
+    if isinstance(doacao, DoacaoRecebida):
+        entidade_id = None
+        if doacao.content_type_id == ContentType.objects.get_for_model(Entidade).pk:
+            entidade_id = doacao.object_id
+        return {'mes': inicio_do_mes(doacao.data_doacao), 'entidade_id': entidade_id, 'direcao': 'E'}
+    return {'mes': inicio_do_mes(doacao.data_saida), 'entidade_id': doacao.entidade_gestora_id, 'direcao': 'S'}
+
+
+def _descartar_entidades_removidas(linhas):
+    # O doador de uma DoacaoRecebida é um GenericForeignKey: a entidade pode não existir mais
+    ids = {linha['entidade_id'] for linha in linhas if linha['entidade_id'] is not None}
+    if not ids:
+        return
+    existentes = set(Entidade.objects.filter(pk__in=ids).values_list('pk', flat=True))
+    for linha in linhas:
+        if linha['entidade_id'] not in existentes:
+            linha['entidade_id'] = None
+
+
+def acumular(modelo, linhas, chave, contadores, sinal=1, lote=1_000):
+    """
+    Soma (ou subtrai, com sinal=-1) os contadores de cada linha na linha do
+    resumo com a mesma chave, criando as que faltam, com um
+    INSERT ... ON CONFLICT DO UPDATE por lote. As chaves vão ordenadas para
+    que gravações concorrentes travem as linhas sempre na mesma ordem.
+    Devolve o nº de chaves gravadas.
+    """
+    if not linhas:
+        return 0
+    _descartar_entidades_removidas(linhas)
+
+    por_chave = {}
+    for linha in linhas:
+        k = tuple(linha[c] for c in chave)
+        acumulado = por_chave.setdefault(k, dict.fromkeys(contadores, 0))
+        for c in contadores:
+            acumulado[c] += sinal * linha[c]
+
+    meta = modelo._meta
+    banco = modelo.objects.db
+    tabela = connections[banco].ops.quote_name(meta.db_table)
+    colunas = [meta.get_field(c).column for c in (*chave, *contadores)]
+    restricao = next(r.name for r in meta.constraints if isinstance(r, models.UniqueConstraint))
+    somas = ', '.join(f'{c} = {tabela}.{c} + EXCLUDED.{c}' for c in contadores)
+    ordenadas = sorted(por_chave.items(), key=lambda par: tuple((v is None, v) for v in par[0]))
+    with connections[banco].cursor() as cursor:
+        for inicio in range(0, len(ordenadas), lote):
+            bloco = ordenadas[inicio:inicio + lote]
+            marcadores = ', '.join(['(' + ', '.join(['%s'] * len(colunas)) + ')'] * len(bloco))
+            cursor.execute(
+                f'INSERT INTO {tabela} ({", ".join(colunas)}) VALUES {marcadores} '
+                f'ON CONFLICT ON CONSTRAINT {restricao} DO UPDATE SET {somas}',
+                [v for k, valores in bloco for v in (*k, *(valores[c] for c in contadores))],
+            )
+    return len(ordenadas)
+
+
+def acumular_movimentacoes(linhas, sinal=1):
+    from .models import ResumoMensalMovimentacao
+
+    acumular(ResumoMensalMovimentacao, linhas, CHAVE_MOVIMENTACAO, ('quantidade', 'movimentacoes'), sinal)
+
+
+def registrar_movimentacoes(queryset, sinal=1):
+    from .saldos import invalidar_fechamentos
+
+    linhas = agregar_movimentacoes(queryset)
+    invalidar_fechamentos(linhas)
+    acumular_movimentacoes(linhas, sinal)
+    # O estoque calculado em ItemViewSet/KitViewSet muda: invalida o ETag deles
+    marcar_alteracao(queryset.model)
+
+
+def reatribuir_movimentacoes(linhas_anteriores, queryset):
+    """
+    Tira do resumo as linhas agregadas antes da mudança e soma as mesmas
+    movimentações com a atribuição atual. O saldo não muda: fechamentos e
+    versões ficam como estão.
+    """
+    if not linhas_anteriores:
+        return
+    acumular_movimentacoes(linhas_anteriores, sinal=-1)
+    acumular_movimentacoes(agregar_movimentacoes(queryset))
+
+
+def _mover_linhas(modelo, queryset, chave, contadores, **novos_valores):
+    """ Apaga as linhas de ``queryset`` e soma os contadores delas nas chaves com ``novos_valores``. """
+    linhas = list(queryset.values('pk', *chave, *contadores))
+    if not linhas:
+        return 0
+    modelo.objects.filter(pk__in=[linha.pop('pk') for linha in linhas]).delete()
+    acumular(modelo, [{**linha, **novos_valores} for linha in linhas], chave, contadores)
+    return len(linhas)
+
+
+def sincronizar_categorias(itens):
+    """
+    Leva a categoria atual dos itens para as linhas de ResumoMensalMovimentacao
+    deles. Sem mudança de categoria, é só uma leitura que não acha nada.
+    """
+    from .models import ResumoMensalMovimentacao
+
+    desatualizadas = list(
+        ResumoMensalMovimentacao.objects.filter(item__in=itens)
+        .filter(
+            ~Q(categoria=F('item__categoria'))
+            | Q(categoria__isnull=True, item__categoria__isnull=False)
+            | Q(categoria__isnull=False, item__categoria__isnull=True)
+        )
+        .values('pk', *CHAVE_MOVIMENTACAO, 'quantidade', 'movimentacoes', categoria_atual=F('item__categoria'))
+    )
+    if not desatualizadas:
+        return 0
+    ResumoMensalMovimentacao.objects.filter(pk__in=[linha.pop('pk') for linha in desatualizadas]).delete()
+    for linha in desatualizadas:
+        linha['categoria_id'] = linha.pop('categoria_atual')
+    acumular_movimentacoes(desatualizadas)
+    return len(desatualizadas)
+
+
+def fundir_em_nulo(campo, pk):
+    """
+    Antes de apagar uma Entidade (campo='entidade_id') ou CategoriaDeItens
+    (campo='categoria_id'): as linhas dela passam para a chave com o campo
+    nulo, somadas às que já existem, em vez de o SET_NULL do banco bater na
+    restrição única.
+    """
+    from .models import ResumoMensalDoacao, ResumoMensalMovimentacao
+
+    resumos = [(ResumoMensalMovimentacao, CHAVE_MOVIMENTACAO, ('quantidade', 'movimentacoes'))]
+    if campo == 'entidade_id':
+        resumos.append((ResumoMensalDoacao, CHAVE_DOACAO, ('doacoes',)))
+    for modelo, chave, contadores in resumos:
+        _mover_linhas(modelo, modelo.objects.filter(**{campo: pk}), chave, contadores, **{campo: None})
+
+
+def registrar_doacao(chave, sinal=1):
+    from .models import ResumoMensalDoacao
+
+    acumular(ResumoMensalDoacao, [{**chave, 'doacoes': 1}], CHAVE_DOACAO, ('doacoes',), sinal)
+
+
+def reconstruir_resumos(lote=5_000):
+    """ Apaga e recalcula os dois resumos a partir de todo o histórico. Devolve o nº de linhas gravadas. """
+    from .models import (
+        DoacaoRealizada, DoacaoRecebida, MovimentacaoEstoque,
+        ResumoMensalDoacao, ResumoMensalMovimentacao
+    )
+
+    ResumoMensalMovimentacao.objects.all().delete()
+    ResumoMensalDoacao.objects.all().delete()
+
+    # Por acumular(): entidades removidas viram NULL e podem juntar chaves
+    gravadas = acumular(
+        ResumoMensalMovimentacao, agregar_movimentacoes(MovimentacaoEstoque.objects.all()),
+        CHAVE_MOVIMENTACAO, ('quantidade', 'movimentacoes'), lote=lote,
+    )
+
+    ct_entidade = ContentType.objects.get_for_model(Entidade)
+    doacoes = [
+        {'mes': d['mes'], 'entidade_id': d['entidade'], 'direcao': 'E', 'doacoes': d['n']}
+        for d in DoacaoRecebida.objects.order_by().annotate(
+            mes=TruncMonth('data_doacao'),
+            entidade=Case(When(content_type=ct_entidade, then=F('object_id')), output_field=models.BigIntegerField()),
+        ).values('mes', 'entidade').annotate(n=Count('id'))
+    ] + [
+        {'mes': d['mes'], 'entidade_id': d['entidade_gestora_id'], 'direcao': 'S', 'doacoes': d['n']}
+        for d in DoacaoRealizada.objects.order_by().annotate(
+            mes=TruncMonth('data_saida'),
+        ).values('mes', 'entidade_gestora_id').annotate(n=Count('id'))
+    ]
+    return gravadas + acumular(ResumoMensalDoacao, doacoes, CHAVE_DOACAO, ('doacoes',), lote=lote)
@@ -0,0 +1,72 @@
+# estoque/saidas.py
+"""
+Baixa de estoque de uma DoacaoRealizada, usada pela API
+(DoacaoRealizadaViewSet.create) e pelo admin (DoacaoRealizadaAdmin).
+
+Itens avulsos e kits (expandidos em seus componentes) são somados por item.
+O saldo de todos os itens é conferido numa única query agregada, e cada item
+vira uma única MovimentacaoEstoque de saída, com quantidade negativa e o
+vínculo com a doação. Todas são gravadas com um bulk_create.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+from .models import Item, ItemKit, MovimentacaoEstoque
+
+
+def somar_necessidades(itens, kits):
+    """
+    {item_id: quantidade} a partir de ``itens`` [(item_id, quantidade)] e
+    ``kits`` [(kit_id, quantidade_de_kits)]. A composição de todos os kits é
+    lida numa query.
+    """
+    necessidades = {}
+    for item_id, quantidade in itens:
+        necessidades[item_id] = necessidades.get(item_id, 0) + Decimal(quantidade)
+
+    kits = list(kits)
+    composicao = {}
+    if kits:
+        for kit_id, item_id, quantidade in ItemKit.objects.filter(
+            kit_id__in={kit_id for kit_id, _ in kits}
+        ).values_list('kit_id', 'item_id', 'quantidade'):
+            composicao.setdefault(kit_id, []).append((item_id, quantidade))
+    for kit_id, quantidade_kits in kits:
+        for item_id, quantidade in composicao.get(kit_id, []):
+            necessidades[item_id] = necessidades.get(item_id, 0) + quantidade * quantidade_kits
+    return necessidades
+
+
+def conferir_estoque(necessidades):
+    """ Levanta ValidationError se algum item não existir ou não tiver saldo para a saída. """
+    saldos = list(Item.objects.filter(pk__in=necessidades).annotate(
+        estoque_atual=Coalesce(Sum('movimentacoes__quantidade'), Decimal('0'), output_field=DecimalField())
+    ).values_list('pk', 'nome', 'estoque_atual'))
+    inexistentes = set(necessidades) - {item_id for item_id, _, _ in saldos}
+    if inexistentes:
+        raise serializers.ValidationError(f"Itens não encontrados: {sorted(inexistentes)}.")
+    for item_id, nome, estoque_atual in saldos:
+        if estoque_atual < necessidades[item_id]:
+            raise serializers.ValidationError(
+                f"Estoque insuficiente para o item '{nome}'. "
+                f"Saldo atual: {estoque_atual}, Saída solicitada: {necessidades[item_id]}"
+            )
+
+
+def lancar_saida(doacao, necessidades, usuario=None):
+    """ Uma movimentação de saída (quantidade negativa) por item, num único bulk_create. """
+    return MovimentacaoEstoque.objects.bulk_create([
+        MovimentacaoEstoque(
+            item_id=item_id,
+            tipo_movimento=MovimentacaoEstoque.Tipo.SAIDA,
+            quantidade=-quantidade,
+            observacao=f"Saída via doação realizada ID {doacao.id}",
+            usuario_responsavel=usuario,
+            doacao_realizada=doacao,
+        )
+        for item_id, quantidade in necessidades.items()
+        if quantidade > 0
+    ])
@@ -0,0 +1,167 @@
+# estoque/saldos.py
+"""
+Fechamentos mensais de estoque (saldo de cada item no fim de cada mês).
+
+O saldo de um item em uma data é o último fechamento anterior à data mais
+as movimentações entre o fechamento e a data. Sem fechamento, é a soma de
+todo o histórico. ``manage.py gerar_fechamentos`` grava os fechamentos dos
+meses já encerrados. Uma movimentação gravada, alterada ou apagada num mês
+já fechado descarta os fechamentos seguintes daquele item (ver
+invalidar_fechamentos). A consulta continua correta, só mais lenta, até o
+próximo ``gerar_fechamentos``, que recomeça do mês mais antigo em que
+algum item ficou sem fechamento.
+"""
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db.models import DateField, DateTimeField, DecimalField, Exists, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+# Limite inferior usado quando o item ainda não tem fechamento
+INICIO_DO_HISTORICO = datetime(1900, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def inicio_do_dia(data):
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def proximo_mes(data):
+    return data.replace(year=data.year + data.month // 12, month=data.month % 12 + 1, day=1)
+
+
+def anotar_saldo_em(itens, corte, nome='estoque_atual', item='pk'):
+    """
+    Anota em ``itens`` o saldo de cada item considerando as movimentações
+    anteriores a ``corte`` (datetime, exclusivo): fechamento + delta.
+    ``item`` é o campo do queryset com o id do item ('item_id' para anotar
+    linhas que apontam para um item, como as contagens de inventário).
+    """
+    from .models import FechamentoEstoque, MovimentacaoEstoque
+
+    fechamento = (
+        FechamentoEstoque.objects.filter(item=OuterRef(item), data_corte__lte=corte)
+        .order_by('-data_corte')
+    )
+    delta = (
+        MovimentacaoEstoque.objects.filter(
+            item=OuterRef(item),
+            data_movimento__lt=corte,
+            data_movimento__gte=Coalesce(
+                OuterRef('fechamento_corte'), Value(INICIO_DO_HISTORICO, output_field=DateTimeField())
+            ),
+        )
+        .order_by().values('item').annotate(s=Sum('quantidade')).values('s')
+    )
+    zero = Value(Decimal('0'), output_field=DecimalField())
+    return itens.annotate(
+        fechamento_corte=Subquery(fechamento.values('data_corte')[:1]),
+        fechamento_saldo=Subquery(fechamento.values('saldo')[:1]),
+    ).annotate(**{
+        nome: Coalesce('fechamento_saldo', zero) + Coalesce(Subquery(delta), zero),
+    })
+
+
+def invalidar_fechamentos(linhas):
+    """
+    Apaga os fechamentos afetados por movimentações de meses já encerrados.
+    ``linhas`` são as linhas agregadas de estoque.resumos (com 'mes' e 'item_id').
+    Movimentações do mês corrente não tocam fechamento nenhum e não geram query.
+    """
+    from .models import FechamentoEstoque
+
+    mes_corrente = timezone.localdate().replace(day=1)
+    primeiro_mes = {}
+    for linha in linhas:
+        if linha['mes'] < mes_corrente:
+            item_id = linha['item_id']
+            primeiro_mes[item_id] = min(linha['mes'], primeiro_mes.get(item_id, linha['mes']))
+    if not primeiro_mes:
+        return
+    filtro = Q()
+    for item_id, mes in primeiro_mes.items():
+        filtro |= Q(item_id=item_id, data_corte__gt=inicio_do_dia(mes))
+    FechamentoEstoque.objects.filter(filtro).delete()
+
+
+def primeiro_mes_sem_fechamento():
+    """
+    Mês de onde ``gerar_fechamentos`` precisa recomeçar: o mais antigo em que
+    algum item ficou sem fechamento. invalidar_fechamentos apaga os últimos
+    fechamentos de um item, então cada item tem os fechamentos contínuos até
+    o seu último corte; itens movimentados antes do último corte geral e sem
+    fechamento nenhum contam a partir da primeira movimentação. None sem
+    movimentação alguma.
+    """
+    from .models import FechamentoEstoque, MovimentacaoEstoque
+    from .resumos import inicio_do_mes
+
+    ultimo_geral = FechamentoEstoque.objects.aggregate(m=Max('data_corte'))['m']
+    candidatos = []
+    if ultimo_geral is not None:
+        candidatos.append(
+            FechamentoEstoque.objects.values('item').annotate(ultimo=Max('data_corte'))
+            .order_by('ultimo').values_list('ultimo', flat=True).first()
+        )
+        sem_fechamento = MovimentacaoEstoque.objects.filter(data_movimento__lt=ultimo_geral).exclude(
+            Exists(FechamentoEstoque.objects.filter(item=OuterRef('item')))
+        )
+    else:
+        sem_fechamento = MovimentacaoEstoque.objects.all()
+    primeira = sem_fechamento.aggregate(m=Min('data_movimento'))['m']
+    if primeira is not None:
+        candidatos.append(primeira)
+    if not candidatos:
+        return None
+    return inicio_do_mes(timezone.localtime(min(candidatos)).date())
+
+
+def gerar_fechamentos(ate, desde=None, lote=5_000):
+    """
+    Grava os fechamentos de cada mês encerrado até ``ate`` (date, 1º dia do mês
+    cujo início é o último corte). Parte de ``desde`` ou do primeiro mês em que
+    falta fechamento a algum item, e soma as movimentações mês a mês com uma
+    única query agregada. Devolve o nº de fechamentos gravados.
+    """
+    from .models import FechamentoEstoque, Item, MovimentacaoEstoque
+
+    if desde is None:
+        desde = primeiro_mes_sem_fechamento()
+        if desde is None:
+            return 0
+    if desde >= ate:
+        return 0
+
+    # Saldo de partida, no corte inicial, de cada item que já teve movimentação
+    corte_inicial = inicio_do_dia(desde)
+    movimentado = MovimentacaoEstoque.objects.filter(item=OuterRef('pk'), data_movimento__lt=corte_inicial)
+    saldos = dict(
+        anotar_saldo_em(Item.objects.all(), corte_inicial, nome='saldo')
+        .filter(Q(fechamento_corte__isnull=False) | Exists(movimentado))
+        .values_list('pk', 'saldo')
+    )
+
+    variacoes = {}
+    for linha in (
+        MovimentacaoEstoque.objects
+        .filter(data_movimento__gte=corte_inicial, data_movimento__lt=inicio_do_dia(ate))
+        .order_by()
+        .values('item_id', mes=TruncMonth('data_movimento', output_field=DateField()))
+        .annotate(s=Sum('quantidade'))
+    ):
+        variacoes.setdefault(linha['mes'], []).append((linha['item_id'], linha['s']))
+
+    total = 0
+    mes = desde
+    while mes < ate:
+        for item_id, s in variacoes.get(mes, []):
+            saldos[item_id] = saldos.get(item_id, 0) + s
+        mes = proximo_mes(mes)
+        corte = inicio_do_dia(mes)
+        FechamentoEstoque.objects.bulk_create(
+            [FechamentoEstoque(item_id=item_id, data_corte=corte, saldo=saldo) for item_id, saldo in saldos.items()],
+            batch_size=lote,
+            update_conflicts=True, unique_fields=['item', 'data_corte'], update_fields=['saldo'],
+        )
+        total += len(saldos)
+    return total
@@ -2,8 +2,9 @@
 from rest_framework import serializers
 from django.db.models import Sum, DecimalField
 from django.db.models.functions import Coalesce
-from .models import Item, CategoriaDeItens, DoacaoRecebida, ItemDoacaoRecebida, Kit, ItemKit, DoacaoRealizada, ItemSaida, KitSaida, MovimentacaoEstoque
+from .models import Item, CategoriaDeItens, DoacaoRecebida, ItemDoacaoRecebida, Kit, ItemKit, DoacaoRealizada, ItemSaida, KitSaida, MovimentacaoEstoque, Inventario
 from crm.models import Entidade
+from .lotes import aplicar_composicao
 
 class CategoriaDeItensSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,6 +24,12 @@ class ItemSerializer(serializers.ModelSerializer):
         # Adicione 'estoque_atual' à lista de campos
         fields = ['id', 'nome', 'descricao', 'unidade_medida', 'categoria', 'categoria_id', 'estoque_atual']
 
+class ItemResumoSerializer(serializers.ModelSerializer):
+    """ Item em forma compacta para listas grandes: sem categoria aninhada nem estoque calculado. """
+    class Meta:
+        model = Item
+        fields = ['id', 'nome', 'unidade_medida', 'categoria']
+
 class ItemKitSerializer(serializers.ModelSerializer):
     # Para LEITURA, aninha os dados do item para sabermos o nome
     item = ItemSerializer(read_only=True)
@@ -43,24 +50,31 @@ class KitSerializer(serializers.ModelSerializer):
         model = Kit
         fields = ['id', 'nome', 'descricao', 'itens_do_kit', 'quantidade_montavel']
 
+    def validate_itens_do_kit(self, itens):
+        componentes = {}
+        for item_data in itens:
+            item = item_data['item']
+            if item.pk in componentes:
+                raise serializers.ValidationError(f"O item '{item.nome}' aparece mais de uma vez no kit.")
+            componentes[item.pk] = item_data['quantidade']
+        return componentes
+
     def create(self, validated_data):
-        itens_data = validated_data.pop('itens_do_kit')
+        componentes = validated_data.pop('itens_do_kit')
         kit = Kit.objects.create(**validated_data)
-        for item_data in itens_data:
-            ItemKit.objects.create(kit=kit, **item_data)
+        aplicar_composicao(kit, componentes)
         return kit
 
     def update(self, instance, validated_data):
-        itens_data = validated_data.pop('itens_do_kit')
+        componentes = validated_data.pop('itens_do_kit', None)
         instance.nome = validated_data.get('nome', instance.nome)
         instance.descricao = validated_data.get('descricao', instance.descricao)
         instance.save()
 
-        # Lógica para atualizar os itens: deleta os antigos e cria os novos.
-        # É a abordagem mais simples e robusta.
-        ItemKit.objects.filter(kit=instance).delete()
-        for item_data in itens_data:
-            ItemKit.objects.create(kit=instance, **item_data)
+        # Só a diferença é gravada: linhas inalteradas mantêm o id
+        if componentes is not None:
+            aplicar_composicao(instance, componentes)
+            instance._prefetched_objects_cache = {}
 
         return instance
 
@@ -81,21 +95,16 @@ class DoacaoRecebidaSerializer(serializers.ModelSerializer):
         required=True
     )
     itens_doados = ItemDoacaoRecebidaSerializer(many=True)
-    doador_nome = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = DoacaoRecebida
         fields = [
             'id', 'data_doacao', 'observacoes', 'itens_doados',
             'content_type', 'object_id',
-            'doador_nome',
+            'doador_nome', 'doador_tipo', 'doador_documento',
         ]
-
-    def get_doador_nome(self, obj):
-        try:
-            return str(obj.doador) if obj.doador else None
-        except Exception:
-            return None
+        # Snapshot gravado pelo DoacaoRecebida.save()
+        read_only_fields = ['doador_nome', 'doador_tipo', 'doador_documento']
 
     def create(self, validated_data):
         itens_data = validated_data.pop('itens_doados')
@@ -104,16 +113,33 @@ class DoacaoRecebidaSerializer(serializers.ModelSerializer):
             ItemDoacaoRecebida.objects.create(doacao=doacao, **item_data)
         return doacao
 
+class KitResumoSerializer(serializers.ModelSerializer):
+    """
+    Kit em forma compacta (id e nome). A composição só entra quando a view
+    pede (contexto ``expandir_composicao``) e já trouxe os itens por prefetch.
+    """
+    class Meta:
+        model = Kit
+        fields = ['id', 'nome']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get('expandir_composicao'):
+            data['itens_do_kit'] = [
+                {'item': ik.item_id, 'item_nome': ik.item.nome, 'quantidade': ik.quantidade}
+                for ik in instance.itens_do_kit.all()
+            ]
+        return data
+
 class ItemSaidaSerializer(serializers.ModelSerializer):
-    # Aninha os detalhes do item para sabermos o nome
-    item = ItemSerializer(read_only=True)
+    # Só id/nome/unidade do item: a lista de saídas não precisa do item completo
+    item = ItemResumoSerializer(read_only=True)
     class Meta:
         model = ItemSaida
         fields = ['id', 'item', 'quantidade']
 
 class KitSaidaSerializer(serializers.ModelSerializer):
-    # Aninha os detalhes do kit
-    kit = KitSerializer(read_only=True)
+    kit = KitResumoSerializer(read_only=True)
     class Meta:
         model = KitSaida
         fields = ['id', 'kit', 'quantidade']
@@ -147,7 +173,7 @@ class DoacaoRealizadaSerializer(serializers.ModelSerializer):
 
 
 class MovimentacaoEstoqueSerializer(serializers.ModelSerializer):
-    item = ItemSerializer(read_only=True)
+    item = ItemResumoSerializer(read_only=True)
     item_id = serializers.PrimaryKeyRelatedField(
         queryset=Item.objects.all(), source='item', write_only=True
     )
@@ -156,9 +182,10 @@ class MovimentacaoEstoqueSerializer(serializers.ModelSerializer):
         model = MovimentacaoEstoque
         fields = [
             'id', 'item', 'item_id', 'tipo_movimento', 'quantidade',
-            'data_movimento', 'usuario_responsavel', 'observacao'
+            'data_movimento', 'usuario_responsavel', 'observacao',
+            'doacao_recebida', 'doacao_realizada'
         ]
-        read_only_fields = ['data_movimento', 'usuario_responsavel']
+        read_only_fields = ['data_movimento', 'usuario_responsavel', 'doacao_recebida', 'doacao_realizada']
 
     def validate(self, attrs):
         tipo = attrs.get('tipo_movimento') or getattr(self.instance, 'tipo_movimento', None)
@@ -186,4 +213,17 @@ class MovimentacaoEstoqueSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and request.user and request.user.is_authenticated:
             validated_data['usuario_responsavel'] = request.user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class InventarioSerializer(serializers.ModelSerializer):
+    total_contagens = serializers.IntegerField(read_only=True)
+    total_ajustes = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Inventario
+        fields = [
+            'id', 'descricao', 'observacoes', 'status', 'data_abertura', 'aberto_por',
+            'data_aprovacao', 'aprovado_por', 'total_contagens', 'total_ajustes'
+        ]
+        read_only_fields = ['status', 'data_abertura', 'aberto_por', 'data_aprovacao', 'aprovado_por']
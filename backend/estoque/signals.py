@@ -0,0 +1,99 @@
+# estoque/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from crm.models import Entidade, PessoaFisica
+from crm.versoes import versionar
+from .doadores import sincronizar_doador
+from .models import CategoriaDeItens, DoacaoRealizada, DoacaoRecebida, Item, ItemKit, Kit, MovimentacaoEstoque
+from .resumos import (
+    agregar_movimentacoes, chave_da_doacao, fundir_em_nulo, reatribuir_movimentacoes, registrar_doacao,
+    sincronizar_categorias
+)
+
+# Tabelas com versão para ETag (ver crm.versoes)
+versionar(CategoriaDeItens, Item, Kit, ItemKit)
+
+
+@receiver(post_save, sender=Entidade)
+@receiver(post_save, sender=PessoaFisica)
+def atualizar_snapshot_do_doador(sender, instance, created, raw=False, **kwargs):
+    """
+    Renomear uma Entidade/PessoaFisica propaga o novo nome e documento para as
+    doações dela. O UPDATE em lote roda depois do commit, fora da transação
+    de quem salvou o cadastro.
+    """
+    if created or raw:
+        return
+    transaction.on_commit(lambda: sincronizar_doador(instance))
+
+
+@receiver(pre_save, sender=DoacaoRecebida)
+@receiver(pre_save, sender=DoacaoRealizada)
+def guardar_chave_do_resumo(sender, instance, raw=False, **kwargs):
+    """
+    Na edição, lembra mês/entidade gravados para mover a doação no resumo
+    mensal. Se a entidade muda, as movimentações da doação mudam de entidade
+    no resumo de movimentações: guarda como elas estavam agregadas.
+    """
+    if raw or instance._state.adding:
+        return
+    anterior = sender.objects.filter(pk=instance.pk).first()
+    instance._chave_resumo_anterior = chave_da_doacao(anterior) if anterior else None
+    instance._movimentacoes_anteriores = None
+    if anterior and instance._chave_resumo_anterior['entidade_id'] != chave_da_doacao(instance)['entidade_id']:
+        instance._movimentacoes_anteriores = agregar_movimentacoes(anterior.movimentacoes.all())
+
+
+@receiver(post_save, sender=DoacaoRecebida)
+@receiver(post_save, sender=DoacaoRealizada)
+def atualizar_resumo_de_doacoes(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and getattr(instance, '_movimentacoes_anteriores', None):
+        reatribuir_movimentacoes(instance._movimentacoes_anteriores, instance.movimentacoes.all())
+    chave = chave_da_doacao(instance)
+    anterior = None if created else getattr(instance, '_chave_resumo_anterior', None)
+    if anterior == chave:
+        return
+    if anterior:
+        registrar_doacao(anterior, sinal=-1)
+    registrar_doacao(chave)
+
+
+@receiver(pre_delete, sender=DoacaoRecebida)
+@receiver(pre_delete, sender=DoacaoRealizada)
+def guardar_movimentacoes_da_doacao(sender, instance, **kwargs):
+    """
+    As movimentações que sobrarem perdem o vínculo (SET_NULL) e, com ele, a
+    entidade no resumo: guarda quais são e como estavam agregadas.
+    """
+    movimentacoes = instance.movimentacoes.all()
+    instance._movimentacoes_desvinculadas = list(movimentacoes.values_list('pk', flat=True))
+    instance._movimentacoes_anteriores = agregar_movimentacoes(movimentacoes) if instance._movimentacoes_desvinculadas else None
+
+
+@receiver(post_delete, sender=DoacaoRecebida)
+@receiver(post_delete, sender=DoacaoRealizada)
+def remover_do_resumo_de_doacoes(sender, instance, **kwargs):
+    registrar_doacao(chave_da_doacao(instance), sinal=-1)
+    if getattr(instance, '_movimentacoes_anteriores', None):
+        reatribuir_movimentacoes(
+            instance._movimentacoes_anteriores,
+            MovimentacaoEstoque.objects.filter(pk__in=instance._movimentacoes_desvinculadas),
+        )
+
+
+@receiver(post_save, sender=Item)
+def atualizar_categoria_nos_resumos(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    sincronizar_categorias([instance])
+
+
+@receiver(pre_delete, sender=Entidade)
+@receiver(pre_delete, sender=CategoriaDeItens)
+def fundir_resumos_da_exclusao(sender, instance, **kwargs):
+    """ As linhas dos resumos da entidade/categoria apagada vão para a chave sem ela (ver fundir_em_nulo). """
+    fundir_em_nulo('entidade_id' if sender is Entidade else 'categoria_id', instance.pk)
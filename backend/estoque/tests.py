@@ -1,3 +1,875 @@
-from django.test import TestCase
+import base64
+import itertools
+import json
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet, Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from crm.models import Contato, Entidade, PessoaFisica
+from crm.tests import criar_entidade, criar_pessoa
+from fundo_social.testing import QueryCountGuardMixin
+from .models import (
+    CategoriaDeItens, Item, Kit, ItemKit, DoacaoRecebida, ItemDoacaoRecebida,
+    DoacaoRealizada, ItemSaida, KitSaida, MovimentacaoEstoque,
+    ResumoMensalMovimentacao, ResumoMensalDoacao, FechamentoEstoque, Inventario
+)
+from .admin import com_datas_pelo_indice
+from .resumos import reconstruir_resumos
+from .saldos import gerar_fechamentos
+
+_seq = itertools.count()
+
+
+def criar_item(**kwargs):
+    n = next(_seq)
+    kwargs.setdefault('nome', f'Item Teste {n}')
+    kwargs.setdefault('unidade_medida', 'un')
+    if 'categoria' not in kwargs:
+        kwargs['categoria'] = CategoriaDeItens.objects.create(nome=f'Categoria Teste {n}')
+    return Item.objects.create(**kwargs)
+
+
+def criar_kit(n_itens, **kwargs):
+    n = next(_seq)
+    kwargs.setdefault('nome', f'Kit Teste {n}')
+    kit = Kit.objects.create(**kwargs)
+    for _ in range(n_itens):
+        ItemKit.objects.create(kit=kit, item=criar_item(), quantidade=2)
+    return kit
+
+
+def entrada(item, quantidade):
+    return MovimentacaoEstoque.objects.create(item=item, tipo_movimento='E', quantidade=quantidade)
+
+
+def datar(mov, quando, tipo=None):
+    """ Muda a data (auto_now_add) de uma movimentação já gravada. """
+    campos = {'data_movimento': f'{quando}T12:00:00Z'}
+    if tipo:
+        campos['tipo_movimento'] = tipo
+    MovimentacaoEstoque.objects.filter(pk=mov.pk).update(**campos)
+    mov.refresh_from_db()
+    return mov
+
+
+class ItemQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'item'
+
+    def semear(self, n):
+        for _ in range(n):
+            item = criar_item()
+            for _ in range(n):
+                entrada(item, 5)
+        return item.pk
+
+
+class KitQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'kit'
+
+    def semear(self, n):
+        for _ in range(n):
+            kit = criar_kit(n)
+            for item_kit in kit.itens_do_kit.all():
+                entrada(item_kit.item, 10)
+        return kit.pk
+
+
+class DoacaoRecebidaQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'doacao-recebida'
+
+    def semear(self, n):
+        ct_entidade = ContentType.objects.get_for_model(Entidade)
+        ct_pessoa = ContentType.objects.get_for_model(PessoaFisica)
+        for i in range(n):
+            if i % 2:
+                ct, doador = ct_pessoa, criar_pessoa()
+            else:
+                ct, doador = ct_entidade, criar_entidade(eh_doador=True)
+            doacao = DoacaoRecebida.objects.create(data_doacao='2025-01-10', content_type=ct, object_id=doador.pk)
+            for _ in range(n):
+                ItemDoacaoRecebida.objects.create(doacao=doacao, item=criar_item(), quantidade=3)
+        return doacao.pk
+
+
+class DoacaoRealizadaQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'doacao-realizada'
+
+    def semear(self, n):
+        for _ in range(n):
+            doacao = DoacaoRealizada.objects.create(
+                data_saida='2025-01-10', entidade_gestora=criar_entidade(eh_gestor=True)
+            )
+            for _ in range(n):
+                ItemSaida.objects.create(doacao_realizada=doacao, item=criar_item(), quantidade=1)
+                KitSaida.objects.create(doacao_realizada=doacao, kit=criar_kit(n), quantidade=1)
+        return doacao.pk
+
+    def test_composicao_sob_demanda_nao_cresce_com_n(self):
+        url = reverse('doacao-realizada-list') + '?expandir=composicao'
+        self.semear(self.N)
+        antes = self.capturar(url)
+        self.semear(self.N * 10)
+        depois = self.capturar(url)
+        self.assertQueriesNaoCrescem(antes, depois, 'doacao-realizada-list?expandir=composicao')
+        self.assertIn('itens_do_kit', self.client.get(url).data['results'][0]['kits_saida'][0]['kit'])
+
+
+class MovimentacaoEstoqueQueryGuardTest(QueryCountGuardMixin, APITestCase):
+    basename = 'movimentacao-estoque'
+
+    def semear(self, n):
+        for _ in range(n):
+            item = criar_item()
+            for _ in range(n):
+                mov = entrada(item, 1)
+        return mov.pk
+
+
+class SnapshotDoadorTest(APITestCase):
+
+    def test_snapshot_gravado_e_sincronizado_ao_renomear(self):
+        entidade = criar_entidade(nome_fantasia='Padaria Central', documento='12.345.678/0001-90')
+        doacao = DoacaoRecebida.objects.create(
+            data_doacao='2025-01-10',
+            content_type=ContentType.objects.get_for_model(Entidade),
+            object_id=entidade.pk,
+        )
+        self.assertEqual(
+            (doacao.doador_nome, doacao.doador_tipo, doacao.doador_documento),
+            ('Padaria Central', DoacaoRecebida.TipoDoador.ENTIDADE, '12345678000190'),
+        )
+
+        entidade.nome_fantasia = 'Padaria Nova'
+        with self.captureOnCommitCallbacks(execute=True):
+            entidade.save()
+        doacao.refresh_from_db()
+        self.assertEqual(doacao.doador_nome, 'Padaria Nova')
+
+    def test_snapshot_so_muda_com_a_troca_de_doador(self):
+        pessoa = criar_pessoa(nome_completo='Maria Doadora')
+        ct_pessoa = ContentType.objects.get_for_model(PessoaFisica)
+        doacao = DoacaoRecebida.objects.create(data_doacao=date(2025, 1, 10), content_type=ct_pessoa, object_id=pessoa.pk)
+
+        # Salvar sem trocar o doador não busca o doador
+        doacao = DoacaoRecebida.objects.get(pk=doacao.pk)
+        doacao.observacoes = 'conferida'
+        with CaptureQueriesContext(connection) as ctx:
+            doacao.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'crm_pessoafisica' in q['sql']])
+
+        # Doador apagado: o histórico do snapshot fica
+        PessoaFisica.objects.filter(pk=pessoa.pk).delete()
+        doacao = DoacaoRecebida.objects.get(pk=doacao.pk)
+        doacao.observacoes = 'doador excluído'
+        doacao.save()
+        doacao.refresh_from_db()
+        self.assertEqual((doacao.doador_nome, doacao.doador_tipo), ('Maria Doadora', DoacaoRecebida.TipoDoador.PESSOA_FISICA))
+
+        # Troca para um doador inexistente: o snapshot do anterior não fica
+        doacao.object_id = pessoa.pk + 1000
+        doacao.save()
+        doacao.refresh_from_db()
+        self.assertEqual((doacao.doador_nome, doacao.doador_tipo, doacao.doador_documento), ('', '', ''))
+
+        outra = criar_pessoa(nome_completo='João Doador')
+        doacao.object_id = outra.pk
+        doacao.save(update_fields=['object_id'])
+        doacao.refresh_from_db()
+        self.assertEqual(doacao.doador_nome, 'João Doador')
+
+
+class EntidadeRelatorioTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('relatorio', 'relatorio@sgfs.local', 'relatorio'))
+        self.entidade = criar_entidade(eh_gestor=True, eh_doador=True)
+        self.url = reverse('relatorio-entidade', args=[self.entidade.pk])
+
+    def saida(self, quando, n_linhas=1):
+        doacao = DoacaoRealizada.objects.create(data_saida=quando, entidade_gestora=self.entidade)
+        for _ in range(n_linhas):
+            ItemSaida.objects.create(doacao_realizada=doacao, item=criar_item(), quantidade=2)
+            KitSaida.objects.create(doacao_realizada=doacao, kit=criar_kit(1), quantidade=1)
+        return doacao
+
+    def entrada(self, quando, n_linhas=1):
+        doacao = DoacaoRecebida.objects.create(
+            data_doacao=quando, content_type=ContentType.objects.get_for_model(Entidade), object_id=self.entidade.pk
+        )
+        for _ in range(n_linhas):
+            ItemDoacaoRecebida.objects.create(doacao=doacao, item=criar_item(), quantidade=3)
+        return doacao
+
+    def test_resumo_e_linha_do_tempo(self):
+        antiga = self.entrada(date(2025, 1, 5), n_linhas=2)
+        entrada_mesmo_dia = self.entrada(date(2025, 3, 1))
+        saida_mesmo_dia = self.saida(date(2025, 3, 1))
+        recente = self.saida(date(2025, 4, 1), n_linhas=2)
+        # Doações de outras entidades não entram
+        DoacaoRealizada.objects.create(data_saida=date(2025, 5, 1), entidade_gestora=criar_entidade(eh_gestor=True))
+
+        data = self.client.get(self.url).data
+        self.assertEqual(data['entidade']['id'], self.entidade.pk)
+        self.assertEqual(data['resumo'], {'entradas': 2, 'saidas': 2, 'ultimo_atendimento': date(2025, 4, 1)})
+
+        historico = data['historico']
+        self.assertEqual((historico['count'], historico['page'], historico['next'], historico['previous']), (4, 1, None, None))
+        # -data, -tipo, -id: no mesmo dia a saída vem antes da entrada
+        self.assertEqual(
+            [(e['tipo'], e['id']) for e in historico['results']],
+            [('saida', recente.pk), ('saida', saida_mesmo_dia.pk), ('entrada', entrada_mesmo_dia.pk), ('entrada', antiga.pk)],
+        )
+        primeira, ultima = historico['results'][0], historico['results'][-1]
+        self.assertEqual((primeira['qtd_itens'], primeira['qtd_kits']), (Decimal('4'), 2))
+        self.assertEqual((len(primeira['itens']), len(primeira['kits'])), (2, 2))
+        self.assertEqual((ultima['qtd_itens'], ultima['qtd_kits'], len(ultima['itens']), ultima['kits']), (Decimal('6'), 0, 2, []))
+
+    def test_entidade_sem_historico(self):
+        data = self.client.get(self.url).data
+        self.assertEqual(data['resumo'], {'entradas': 0, 'saidas': 0, 'ultimo_atendimento': None})
+        self.assertEqual((data['historico']['count'], data['historico']['results']), (0, []))
+
+    def test_paginacao(self):
+        for dia in range(1, 6):
+            self.saida(date(2025, 1, dia))
+
+        pagina = self.client.get(self.url, {'page': 2, 'page_size': 2}).data['historico']
+        self.assertEqual((pagina['page'], pagina['page_size'], pagina['next'], pagina['previous']), (2, 2, 3, 1))
+        self.assertEqual([e['data'] for e in pagina['results']], [date(2025, 1, 3), date(2025, 1, 2)])
+
+        ultima = self.client.get(self.url, {'page': 3, 'page_size': 2}).data['historico']
+        self.assertEqual((len(ultima['results']), ultima['next']), (1, None))
+        self.assertEqual(self.client.get(self.url, {'page': 9, 'page_size': 2}).data['historico']['results'], [])
+
+        # page_size fica entre 1 e max_page_size; page mínima é 1
+        self.assertEqual(self.client.get(self.url, {'page_size': 1000}).data['historico']['page_size'], 100)
+        self.assertEqual(self.client.get(self.url, {'page_size': 0}).data['historico']['page_size'], 1)
+        self.assertEqual(self.client.get(self.url, {'page': -3}).data['historico']['page'], 1)
+
+    def test_parametros_invalidos_e_404(self):
+        response = self.client.get(self.url, {'page': 'x'})
+        self.assertEqual((response.status_code, list(response.data)), (400, ['page']))
+        response = self.client.get(self.url, {'page_size': 'x'})
+        self.assertEqual((response.status_code, list(response.data)), (400, ['page_size']))
+
+        response = self.client.get(reverse('relatorio-entidade', args=[self.entidade.pk + 1000]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_queries_nao_crescem_com_o_historico(self):
+        def capturar():
+            self.client.get(self.url)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(self.url).status_code, 200)
+            return len(ctx.captured_queries)
+
+        for dia in range(1, 3):
+            self.saida(date(2025, 1, dia), n_linhas=2)
+            self.entrada(date(2025, 1, dia), n_linhas=2)
+        antes = capturar()
+        for dia in range(1, 21):
+            self.saida(date(2025, 2, dia), n_linhas=20)
+            self.entrada(date(2025, 2, dia), n_linhas=20)
+        self.assertEqual(capturar(), antes)
+
+
+class ResumoMensalTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('resumo', 'resumo@sgfs.local', 'resumo'))
+
+    def resumos(self):
+        movs = sorted(ResumoMensalMovimentacao.objects.values_list(
+            'mes', 'item_id', 'categoria_id', 'entidade_id', 'direcao', 'quantidade', 'movimentacoes'), key=repr)
+        doacoes = sorted(ResumoMensalDoacao.objects.values_list('mes', 'entidade_id', 'direcao', 'doacoes'), key=repr)
+        return movs, doacoes
+
+    def test_incremental_igual_a_reconstrucao(self):
+        item = criar_item()
+        doadora, gestora = criar_entidade(eh_doador=True), criar_entidade(eh_gestor=True)
+        doacao = DoacaoRecebida.objects.create(
+            data_doacao='2025-01-10', content_type=ContentType.objects.get_for_model(Entidade), object_id=doadora.pk
+        )
+        ItemDoacaoRecebida.objects.create(doacao=doacao, item=item, quantidade=10)
+        ItemDoacaoRecebida.objects.create(doacao=doacao, item=item, quantidade=5)
+        response = self.client.post(reverse('doacao-realizada-list'), {
+            'data_saida': '2025-02-01', 'entidade_gestora': gestora.pk,
+            'itens_saida': [{'item': item.pk, 'quantidade': 4}], 'kits_saida': [],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.client.delete(reverse('doacao-realizada-detail', args=[response.data['id']]))
+        entrada(item, 2)
+
+        incremental = self.resumos()
+        reconstruir_resumos()
+        self.assertEqual(self._sem_zeros(incremental), self.resumos())
+
+        response = self.client.get(reverse('relatorio-resumo-mensal'), {'agrupar': 'item,direcao', 'item': item.pk})
+        self.assertEqual(
+            [(r['direcao'], r['quantidade'], r['movimentacoes']) for r in response.data['resultados']],
+            [('E', 17, 3)],
+        )
+
+    def test_mudancas_de_atribuicao_mantem_resumos(self):
+        item, categoria_nova = criar_item(), CategoriaDeItens.objects.create(nome='Higiene')
+        doadora, outra_doadora = criar_entidade(eh_doador=True), criar_entidade(eh_doador=True)
+        gestora, outra_gestora = criar_entidade(eh_gestor=True), criar_entidade(eh_gestor=True)
+        ct_entidade = ContentType.objects.get_for_model(Entidade)
+        recebida = DoacaoRecebida.objects.create(data_doacao='2025-01-10', content_type=ct_entidade, object_id=doadora.pk)
+        ItemDoacaoRecebida.objects.create(doacao=recebida, item=item, quantidade=10)
+        realizada = DoacaoRealizada.objects.create(data_saida='2025-01-20', entidade_gestora=gestora)
+        MovimentacaoEstoque.objects.create(item=item, tipo_movimento='S', quantidade=-3, doacao_realizada=realizada)
+
+        def confere():
+            incremental = self._sem_zeros(self.resumos())
+            reconstruir_resumos()
+            self.assertEqual(incremental, self.resumos())
+
+        recebida.object_id = outra_doadora.pk
+        recebida.save()
+        realizada.entidade_gestora = outra_gestora
+        realizada.save()
+        confere()
+
+        item.categoria = categoria_nova
+        item.save()
+        confere()
+        item.categoria = None
+        item.save()
+        confere()
+
+        # Movimentações que sobram de doações apagadas ficam sem entidade
+        DoacaoRealizada.objects.get(pk=realizada.pk).delete()
+        DoacaoRecebida.objects.get(pk=recebida.pk).delete()
+        confere()
+        self.assertFalse(ResumoMensalMovimentacao.objects.exclude(entidade=None).filter(quantidade__gt=0))
+
+    def test_uma_linha_por_chave_e_exclusao_de_entidade(self):
+        item, doadora = criar_item(), criar_entidade(eh_doador=True)
+        ct_entidade = ContentType.objects.get_for_model(Entidade)
+        for _ in range(2):
+            doacao = DoacaoRecebida.objects.create(data_doacao='2025-01-10', content_type=ct_entidade, object_id=doadora.pk)
+            ItemDoacaoRecebida.objects.create(doacao=doacao, item=item, quantidade=4)
+        datar(entrada(item, 1), '2025-01-12')
+        movs, doacoes = self.resumos()
+        self.assertEqual(
+            [m[3:] for m in movs], sorted([(doadora.pk, 'E', 8, 2), (None, 'E', 1, 1)], key=repr)
+        )
+        self.assertEqual([d[1:] for d in doacoes], [(doadora.pk, 'E', 2)])
+
+        # As linhas da entidade apagada somam nas linhas sem entidade, sem violar a chave única
+        doadora.delete()
+        movs, doacoes = self.resumos()
+        self.assertEqual([m[3:] for m in movs], [(None, 'E', 9, 3)])
+        self.assertEqual([d[1:] for d in doacoes], [(None, 'E', 2)])
+
+    def _sem_zeros(self, resumos):
+        # O incremental mantém com zero as linhas estornadas; a reconstrução não as cria
+        movs, doacoes = resumos
+        return [m for m in movs if m[-1]], [d for d in doacoes if d[-1]]
+
+
+class EstatisticasMovimentacaoTest(APITestCase):
+
+    def test_saldo_acumulado_parte_do_saldo_anterior(self):
+        self.client.force_authenticate(User.objects.create_superuser('stats', 'stats@sgfs.local', 'stats'))
+        item = criar_item()
+        for quando, tipo, qtd in (('2024-12-20', 'E', 10), ('2025-01-05', 'E', 5),
+                                  ('2025-01-20', 'S', -3), ('2025-03-02', 'E', 1)):
+            datar(entrada(item, qtd), quando, tipo)
+
+        response = self.client.get(reverse('movimentacao-estoque-estatisticas'), {
+            'item': item.pk, 'de': '2025-01-01', 'ate': '2025-03-31', 'intervalo': 'mes',
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        serie, = response.data['series']
+        self.assertEqual(serie['saldo_inicial'], 10)
+        self.assertEqual(
+            [(str(p['periodo']), p['entradas'], p['saidas'], p['saldo']) for p in serie['pontos']],
+            [('2025-01-01', 5, 3, 12), ('2025-03-01', 1, 0, 13)],
+        )
+
+    def test_data_invalida_apontada_no_proprio_parametro(self):
+        self.client.force_authenticate(User.objects.create_superuser('stats', 'stats@sgfs.local', 'stats'))
+        url = reverse('movimentacao-estoque-estatisticas')
+        for params, campo in (({'ate': '2025-13-01'}, 'ate'), ({'de': 'ontem'}, 'de')):
+            response = self.client.get(url, params)
+            self.assertEqual((response.status_code, list(response.data)), (400, [campo]))
+
+
+class FechamentoEstoqueTest(APITestCase):
+
+    def test_as_of_usa_fechamento_e_sobrevive_a_invalidacao(self):
+        self.client.force_authenticate(User.objects.create_superuser('saldo', 'saldo@sgfs.local', 'saldo'))
+        item = criar_item()
+        datar(entrada(item, 10), '2025-01-10')
+        antiga = datar(entrada(item, 4), '2025-02-10')
+        datar(entrada(item, 1), '2025-03-10')
+
+        self.assertEqual(gerar_fechamentos(date(2025, 4, 1), desde=date(2025, 1, 1)), 3)
+
+        def saldo_em(as_of):
+            response = self.client.get(reverse('item-detail', args=[item.pk]), {'as_of': as_of})
+            return response.data['estoque_atual']
+
+        self.assertEqual((saldo_em('2025-01-31'), saldo_em('2025-02-15'), saldo_em('2025-03-31')), (10, 14, 15))
+
+        # Apagar uma movimentação de fevereiro descarta os fechamentos de março em diante
+        antiga.delete()
+        self.assertEqual(
+            list(FechamentoEstoque.objects.filter(item=item).values_list('data_corte__month', flat=True)), [2]
+        )
+        self.assertEqual((saldo_em('2025-02-15'), saldo_em('2025-03-31')), (10, 11))
+
+    def test_comando_refaz_fechamentos_invalidados(self):
+        item, outro = criar_item(), criar_item()
+        datar(entrada(item, 10), '2025-01-10')
+        antiga = datar(entrada(item, 4), '2025-02-10')
+        datar(entrada(outro, 7), '2025-03-10')
+        gerar_fechamentos(date(2025, 4, 1), desde=date(2025, 1, 1))
+
+        # O outro item continua com fechamentos até abril: o comando não pode partir dali
+        antiga.delete()
+        call_command('gerar_fechamentos', stdout=StringIO())
+        # O comando fecha até o mês corrente: os de 2025 até abril bastam aqui
+        fechamentos = FechamentoEstoque.objects.filter(data_corte__lte='2025-04-01T00:00:00Z').order_by('data_corte')
+        self.assertEqual(
+            list(fechamentos.filter(item=item).values_list('data_corte__month', 'saldo')), [(2, 10), (3, 10), (4, 10)]
+        )
+        self.assertEqual(list(fechamentos.filter(item=outro).values_list('data_corte__month', 'saldo')), [(4, 7)])
+
+
+class KeysetPaginationTest(APITestCase):
+
+    def test_percorre_ida_e_volta_com_empates_de_data(self):
+        self.client.force_authenticate(User.objects.create_superuser('cursor', 'cursor@sgfs.local', 'cursor'))
+        item = criar_item()
+        # 7 movimentações, 3 delas no mesmo instante (desempate pela pk)
+        for i, quando in enumerate(['2025-01-01', '2025-01-02', '2025-01-02', '2025-01-02',
+                                    '2025-01-03', '2025-01-04', '2025-01-05']):
+            datar(entrada(item, i + 1), quando)
+        esperado = list(MovimentacaoEstoque.objects.order_by('-data_movimento', '-id').values_list('id', flat=True))
+
+        url, vistos, paginas = reverse('movimentacao-estoque-list') + '?page_size=3&com_total=1', [], []
+        while url:
+            response = self.client.get(url)
+            paginas.append(response)
+            vistos += [m['id'] for m in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(paginas[0].data['count'], 7)
+        self.assertNotIn('count', paginas[1].data)
+
+        # Voltando a partir da última página
+        anterior = self.client.get(paginas[-1].data['previous'])
+        self.assertEqual([m['id'] for m in anterior.data['results']], esperado[3:6])
+        self.assertEqual(self.client.get(anterior.data['previous']).data['previous'], None)
+
+    def test_cursor_invalido_responde_404(self):
+        self.client.force_authenticate(User.objects.create_superuser('cursor', 'cursor@sgfs.local', 'cursor'))
+        url = reverse('movimentacao-estoque-list')
+        for dados in ('nem base64', {'v': 'ontem', 'pk': 1}, {'v': None, 'pk': 1}, {'v': '2025-01-01'}):
+            cursor = dados if isinstance(dados, str) else base64.urlsafe_b64encode(json.dumps(dados).encode()).decode()
+            self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 404, dados)
+
+
+class MovimentacaoEstoqueFilterTest(APITestCase):
+
+    def test_filtra_por_item_e_periodo(self):
+        self.client.force_authenticate(User.objects.create_superuser('filtro', 'filtro@sgfs.local', 'filtro'))
+        item, outro = criar_item(), criar_item()
+        marco = datar(entrada(item, 1), '2025-03-31')
+        datar(entrada(item, 1), '2025-04-01')
+        datar(entrada(outro, 1), '2025-03-10')
+
+        response = self.client.get(reverse('movimentacao-estoque-list'), {
+            'item': item.pk, 'data_inicio': '2025-03-01', 'data_fim': '2025-03-31',
+        })
+        self.assertEqual([m['id'] for m in response.data['results']], [marco.pk])
+        self.assertEqual(response.data['results'][0]['item']['nome'], item.nome)
+
+
+class LotesTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('lote', 'lote@sgfs.local', 'lote'))
+
+    def test_itens_em_lote_criam_e_atualizam_ou_nada(self):
+        existente = criar_item()
+        url = reverse('item-lote')
+        response = self.client.post(url, [
+            {'id': existente.pk, 'nome': 'Feijão 1kg', 'unidade_medida': 'pct'},
+            {'nome': 'Arroz 5kg', 'unidade_medida': 'pct'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(sorted(i['nome'] for i in response.data), ['Arroz 5kg', 'Feijão 1kg'])
+
+        response = self.client.post(url, [
+            {'nome': 'Óleo', 'unidade_medida': 'un'},
+            {'nome': 'Arroz 5kg', 'unidade_medida': 'pct'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[1]['nome'][0], 'Já existe um item com este nome.')
+        self.assertFalse(Item.objects.filter(nome='Óleo').exists())
+
+    def test_composicao_aplica_diff_e_mantem_ids(self):
+        kit = criar_kit(3)
+        a, b, c = kit.itens_do_kit.order_by('pk')
+        novo = criar_item()
+        response = self.client.put(reverse('kit-composicao', args=[kit.pk]), [
+            {'item_id': a.item_id, 'quantidade': '2.00'},
+            {'item_id': b.item_id, 'quantidade': '5'},
+            {'item_id': novo.pk, 'quantidade': '1'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['alteracoes'], {'adicionados': 1, 'alterados': 1, 'removidos': 1})
+        self.assertEqual(
+            set(kit.itens_do_kit.values_list('pk', flat=True)) - {a.pk, b.pk},
+            set(kit.itens_do_kit.filter(item=novo).values_list('pk', flat=True)),
+        )
+
+    def test_movimentacoes_em_lote_conferem_saldo(self):
+        item = criar_item()
+        entrada(item, 5)
+        url = reverse('movimentacao-estoque-lote')
+        response = self.client.post(url, [
+            {'item_id': item.pk, 'tipo_movimento': 'S', 'quantidade': '3'},
+            {'item_id': item.pk, 'tipo_movimento': 'S', 'quantidade': '3'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantidade', response.data[1])
+
+        response = self.client.post(url, [
+            {'item_id': item.pk, 'tipo_movimento': 'S', 'quantidade': '3'},
+            {'item_id': item.pk, 'tipo_movimento': 'E', 'quantidade': '10'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(sorted(m['quantidade'] for m in response.data), ['-3.00', '10.00'])
+
+
+class KitSerializerComposicaoTest(APITestCase):
+
+    def test_update_mantem_ids_e_grava_so_a_diferenca(self):
+        self.client.force_authenticate(User.objects.create_superuser('kit', 'kit@sgfs.local', 'kit'))
+        kit = criar_kit(5)
+        linhas = list(kit.itens_do_kit.order_by('pk'))
+        payload = {
+            'nome': kit.nome,
+            'itens_do_kit': [{'item_id': ik.item_id, 'quantidade': '2.00'} for ik in linhas[1:]],
+        }
+        payload['itens_do_kit'][0]['quantidade'] = '7.00'
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.put(reverse('kit-detail', args=[kit.pk]), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(set(kit.itens_do_kit.values_list('pk', flat=True)), {ik.pk for ik in linhas[1:]})
+        escritas = [
+            q['sql'].split()[0] for q in ctx.captured_queries
+            if '"estoque_itemkit"' in q['sql'] and q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(escritas, ['DELETE', 'UPDATE'])
+
+    def test_item_repetido_e_recusado(self):
+        self.client.force_authenticate(User.objects.create_superuser('kit2', 'kit2@sgfs.local', 'kit2'))
+        item = criar_item()
+        response = self.client.post(reverse('kit-list'), {
+            'nome': 'Kit repetido',
+            'itens_do_kit': [{'item_id': item.pk, 'quantidade': 1}, {'item_id': item.pk, 'quantidade': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class InventarioTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('inv', 'inv@sgfs.local', 'inv'))
+        self.sobra, self.falta, self.confere = criar_item(), criar_item(), criar_item()
+        for item in (self.sobra, self.falta, self.confere):
+            entrada(item, 10)
+        self.inventario = self.client.post(reverse('inventario-list'), {'descricao': 'Anual'}, format='json').data
+
+    def url(self, nome):
+        return reverse(f'inventario-{nome}', args=[self.inventario['id']])
+
+    def test_aprovacao_lanca_ajustes_das_diferencas(self):
+        response = self.client.post(self.url('contagens'), [
+            {'item_id': self.sobra.pk, 'quantidade_contada': '12.50'},
+            {'item_id': self.falta.pk, 'quantidade_contada': '4'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        planilha = SimpleUploadedFile('contagem.csv', f'item_id;quantidade_contada\n{self.confere.pk};10,00\n'.encode())
+        response = self.client.post(self.url('contagens'), {'arquivo': planilha}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        linhas = self.client.get(self.url('diferencas'), {'divergentes': 1}).data['linhas']
+        self.assertEqual(
+            {l['item_id']: l['diferenca'] for l in linhas},
+            {self.sobra.pk: Decimal('2.50'), self.falta.pk: Decimal('-6.00')},
+        )
+
+        response = self.client.post(self.url('aprovar'))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['status'], response.data['contagens'], response.data['ajustes']), ('P', 3, 2))
+        saldos = dict(
+            MovimentacaoEstoque.objects.values('item_id').annotate(s=Sum('quantidade')).values_list('item_id', 's')
+        )
+        self.assertEqual(saldos, {self.sobra.pk: Decimal('12.50'), self.falta.pk: Decimal('4'), self.confere.pk: 10})
+        self.assertEqual(
+            set(MovimentacaoEstoque.objects.filter(inventario_id=self.inventario['id']).values_list('tipo_movimento', 'quantidade')),
+            {('E', Decimal('2.50')), ('S', Decimal('-6.00'))},
+        )
+
+        # Aprovado: diferenças congeladas e nada mais pode ser gravado
+        entrada(self.falta, 1)
+        linhas = self.client.get(self.url('diferencas'), {'divergentes': 1}).data['linhas']
+        self.assertEqual(len(linhas), 2)
+        self.assertEqual(self.client.post(self.url('aprovar')).status_code, 400)
+        response = self.client.post(self.url('contagens'), [{'item_id': self.sobra.pk, 'quantidade_contada': 1}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_contagens_invalidas_sao_recusadas_por_linha(self):
+        response = self.client.post(self.url('contagens'), [
+            {'item_id': self.sobra.pk, 'quantidade_contada': 1},
+            {'item_id': self.sobra.pk, 'quantidade_contada': 2},
+            {'item_id': 0, 'quantidade_contada': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([bool(e) for e in response.data], [False, True, True])
+        self.assertFalse(Inventario.objects.get(pk=self.inventario['id']).contagens.exists())
+
+
+class AdminListagemTest(APITestCase):
+    """ As colunas de total das listagens do admin não podem custar uma query por linha. """
+
+    def semear(self, n):
+        for _ in range(n):
+            kit = criar_kit(2)
+            recebida = DoacaoRecebida.objects.create(
+                data_doacao='2025-01-10', content_type=ContentType.objects.get_for_model(Entidade),
+                object_id=criar_entidade().pk,
+            )
+            ItemDoacaoRecebida.objects.create(doacao=recebida, item=criar_item(), quantidade=3)
+            realizada = DoacaoRealizada.objects.create(
+                data_saida='2025-01-10', entidade_gestora=criar_entidade(eh_gestor=True)
+            )
+            ItemSaida.objects.create(doacao_realizada=realizada, item=criar_item(), quantidade=1)
+            KitSaida.objects.create(doacao_realizada=realizada, kit=kit, quantidade=3)
+
+    def test_listagens_custam_queries_fixas(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@sgfs.local', 'admin'))
+        urls = [reverse(f'admin:estoque_{m}_changelist') for m in ('kit', 'doacaorecebida', 'doacaorealizada')]
+
+        def contar(url):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.semear(2)
+        antes = [contar(url) for url in urls]
+        self.semear(20)
+        self.assertEqual([contar(url) for url in urls], antes)
+
+        # 1 item avulso + 3 kits x (2 + 2) unidades, ordenável pela coluna
+        response = self.client.get(urls[2], {'o': '3'})
+        self.assertEqual(response.context['cl'].result_list[0]._qtd_itens_total, 13)
+
+
+class DoacaoRealizadaAdminSaidaTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('saida', 'saida@sgfs.local', 'saida'))
+        self.kit = criar_kit(2)
+        self.a, self.b = [ik.item for ik in self.kit.itens_do_kit.order_by('pk')]
+        entrada(self.a, 10)
+        entrada(self.b, 5)
+        self.gestora = criar_entidade(eh_gestor=True)
+
+    def postar(self, qtd_item, qtd_kits):
+        dados = {'data_saida': '2025-01-10', 'entidade_gestora': self.gestora.pk, 'observacoes': ''}
+        for prefixo, campo, alvo, qtd in (('itens_saida', 'item', self.a, qtd_item), ('kits_saida', 'kit', self.kit, qtd_kits)):
+            dados.update({
+                f'{prefixo}-TOTAL_FORMS': 1, f'{prefixo}-INITIAL_FORMS': 0,
+                f'{prefixo}-MIN_NUM_FORMS': 0, f'{prefixo}-MAX_NUM_FORMS': 1000,
+                f'{prefixo}-0-{campo}': alvo.pk, f'{prefixo}-0-quantidade': qtd,
+            })
+        return self.client.post(reverse('admin:estoque_doacaorealizada_add'), dados)
+
+    def test_saida_agrega_por_item_com_sinal_e_vinculo(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.postar('3', '2')
+        self.assertEqual(response.status_code, 302)
+        doacao = DoacaoRealizada.objects.get()
+        # item avulso 3 + 2 kits x 2 de cada componente
+        self.assertEqual(
+            set(doacao.movimentacoes.values_list('item_id', 'tipo_movimento', 'quantidade')),
+            {(self.a.pk, 'S', Decimal('-7')), (self.b.pk, 'S', Decimal('-4'))},
+        )
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "estoque_movimentacaoestoque"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_estoque_insuficiente_volta_para_o_formulario(self):
+        response = self.postar('3', '3')  # precisa de 9 unidades de B, há 5
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Estoque insuficiente')
+        self.assertFalse(DoacaoRealizada.objects.exists())
+
+
+class TabelaGrandeAdminTest(APITestCase):
+
+    def setUp(self):
+        self.item, self.outro = criar_item(), criar_item()
+        for quando in ('2023-12-31', '2024-01-01', '2024-01-15', '2024-03-02'):
+            datar(entrada(self.item, 1), quando)
+        datar(entrada(self.outro, 1), '2024-03-02')
+
+    def test_datetimes_pelo_indice_igual_ao_distinct(self):
+        qs = com_datas_pelo_indice(MovimentacaoEstoque.objects.all())
+        for kind, filtro in (('year', {}), ('month', {'data_movimento__year': 2024}), ('day', {'data_movimento__year': 2024})):
+            with self.subTest(kind=kind):
+                esperado = list(MovimentacaoEstoque.objects.filter(**filtro).datetimes('data_movimento', kind))
+                # MIN/MAX e uma query para todos os períodos
+                with self.assertNumQueries(2):
+                    self.assertEqual(qs.filter(**filtro).datetimes('data_movimento', kind), esperado)
+        # Fora da listagem do admin, datetimes() segue devolvendo um QuerySet
+        self.assertIsInstance(MovimentacaoEstoque.objects.datetimes('data_movimento', 'year'), QuerySet)
+
+    def test_navegacao_por_data_na_listagem(self):
+        self.client.force_login(User.objects.create_superuser('datas', 'datas@sgfs.local', 'datas'))
+        url = reverse('admin:estoque_movimentacaoestoque_changelist')
+        response = self.client.get(url, {'data_movimento__year': 2024})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'data_movimento__month=3')
+        self.assertNotContains(response, 'data_movimento__month=2')
+
+    def test_listagem_com_filtro_autocomplete_e_um_count(self):
+        self.client.force_login(User.objects.create_superuser('grande', 'grande@sgfs.local', 'grande'))
+        url = reverse('admin:estoque_movimentacaoestoque_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'item__id__exact': self.item.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({m.item_id for m in response.context['cl'].result_list}, {self.item.pk})
+        self.assertEqual(response.context['cl'].result_count, 4)
+        self.assertContains(response, f'<option value="{self.item.pk}" selected>')
+        self.assertEqual(sum('COUNT(' in q['sql'] for q in ctx.captured_queries), 1)
+
+
+class LookupsTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('lookups', 'lookups@sgfs.local', 'lookups'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = criar_item(nome='Arroz')
+            self.gestora = criar_entidade(eh_gestor=True)
+            criar_entidade()
+
+    def test_catalogos_e_revalidacao_por_etag(self):
+        url = reverse('lookups')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn([self.item.pk, 'Arroz'], response.json()['itens'])
+        self.assertEqual([g[0] for g in response.json()['gestoras']], [self.gestora.pk])
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('item-detail', args=[self.item.pk]), {'nome': 'Arroz tipo 1'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn([self.item.pk, 'Arroz tipo 1'], response.json()['itens'])
+
+
+class LeituraCondicionalTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('condicional', 'cond@sgfs.local', 'condicional'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = criar_item()
+            self.entidade = criar_entidade()
+
+    def test_304_sem_consultar_os_dados_e_invalidacao_por_movimentacao(self):
+        url = reverse('item-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # Movimentação muda o estoque calculado: o ETag dos itens e kits muda
+        kits = self.client.get(reverse('kit-list'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            entrada(self.item, 5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(float(response.json()['results'][0]['estoque_atual']), 5)
+        self.assertNotEqual(self.client.get(reverse('kit-list'))['ETag'], kits)
+
+    def test_entidade_so_no_detalhe(self):
+        self.assertNotIn('ETag', self.client.get(reverse('entidade-list')))
+        url = reverse('entidade-detail', args=[self.entidade.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Contato.objects.create(entidade=self.entidade, tipo_contato='T', valor='11 9000-0000')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['contatos']), 1)
+
+
+class IdempotenciaTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('idem', 'idem@sgfs.local', 'idem'))
+        self.item = criar_item()
+        self.gestora = criar_entidade(eh_gestor=True)
+        self.url = reverse('doacao-realizada-list')
+        self.payload = {
+            'data_saida': '2025-03-10', 'entidade_gestora': self.gestora.pk,
+            'itens_saida': [{'item': self.item.pk, 'quantidade': 2}], 'kits_saida': [],
+        }
+
+    def post(self, payload, chave='chave-1'):
+        return self.client.post(self.url, payload, format='json', HTTP_IDEMPOTENCY_KEY=chave)
+
+    def test_reenvio_devolve_a_resposta_gravada(self):
+        # Falha de validação (sem estoque) não consome a chave
+        self.assertEqual(self.post(self.payload).status_code, 400)
+        entrada(self.item, 10)
+
+        primeira = self.post(self.payload)
+        self.assertEqual(primeira.status_code, 201)
+        with CaptureQueriesContext(connection) as ctx:
+            segunda = self.post(self.payload)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.json(), primeira.json())
+        self.assertFalse([q for q in ctx.captured_queries if 'INSERT INTO "estoque_doacaorealizada"' in q['sql']])
+
+        self.assertEqual(DoacaoRealizada.objects.count(), 1)
+        self.assertEqual(MovimentacaoEstoque.objects.filter(tipo_movimento='S').count(), 1)
+
+        # Mesma chave com outro conteúdo; outra chave cria de novo
+        self.assertEqual(self.post({**self.payload, 'observacoes': 'outra'}).status_code, 422)
+        self.assertEqual(self.post(self.payload, chave='chave-2').status_code, 201)
+        self.assertEqual(DoacaoRealizada.objects.count(), 2)
@@ -3,8 +3,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ItemViewSet, CategoriaDeItensViewSet, DoacaoRecebidaViewSet,
-    KitViewSet, DoacaoRealizadaViewSet, MovimentacaoEstoqueViewSet,
-    EntidadeRelatorioAPIView
+    KitViewSet, DoacaoRealizadaViewSet, MovimentacaoEstoqueViewSet, InventarioViewSet,
+    EntidadeRelatorioAPIView, ResumoMensalAPIView, LookupsAPIView
 )
 
 router = DefaultRouter()
@@ -14,8 +14,11 @@ router.register(r'doacoes-recebidas', DoacaoRecebidaViewSet, basename='doacao-re
 router.register(r'kits', KitViewSet, basename='kit')
 router.register(r'doacoes-realizadas', DoacaoRealizadaViewSet, basename='doacao-realizada')
 router.register(r'movimentacoes-estoque', MovimentacaoEstoqueViewSet, basename='movimentacao-estoque')
+router.register(r'inventarios', InventarioViewSet, basename='inventario')
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('relatorios/entidade/<int:pk>/', EntidadeRelatorioAPIView.as_view()),
+    path('relatorios/entidade/<int:pk>/', EntidadeRelatorioAPIView.as_view(), name='relatorio-entidade'),
+    path('relatorios/resumo-mensal/', ResumoMensalAPIView.as_view(), name='relatorio-resumo-mensal'),
+    path('lookups/', LookupsAPIView.as_view(), name='lookups'),
 ]
\ No newline at end of file
@@ -4,50 +4,101 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, NumberFilter, ChoiceFilter, DateFilter
 from django.db import transaction
-from django.db.models import Sum, DecimalField
-from django.db.models.functions import Coalesce
-from django.utils.timezone import now
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Sum, Count, F, Value, OuterRef, Subquery, DecimalField
+from django.db.models.functions import Coalesce, ExtractYear, NullIf
+from django.utils.decorators import method_decorator
+from django.utils.timezone import localdate, now, make_aware
+from django.views.decorators.http import condition
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
 import math
 import json
 from .models import (
     Item, CategoriaDeItens, MovimentacaoEstoque, DoacaoRecebida, Kit,
-    DoacaoRealizada, ItemSaida, KitSaida, ItemKit, ItemDoacaoRecebida
+    DoacaoRealizada, ItemSaida, KitSaida, ItemKit, ItemDoacaoRecebida,
+    ResumoMensalMovimentacao, ResumoMensalDoacao, Inventario, ContagemInventario
 )
 from .serializers import (
     ItemSerializer, CategoriaDeItensSerializer, DoacaoRecebidaSerializer,
-    KitSerializer, DoacaoRealizadaSerializer, MovimentacaoEstoqueSerializer
+    KitSerializer, DoacaoRealizadaSerializer, MovimentacaoEstoqueSerializer, InventarioSerializer
 )
+from .estatisticas import INTERVALOS, serie_do_estoque
+from .saldos import anotar_saldo_em, inicio_do_dia
+from .pagination import KeysetPagination
+from .lotes import (
+    ItemLoteSerializer, ComponenteKitSerializer, MovimentacaoLoteSerializer,
+    validar_lote, gravar_itens, validar_componentes, aplicar_composicao, gravar_movimentacoes
+)
+from .saidas import somar_necessidades, conferir_estoque, lancar_saida
+from .idempotencia import idempotente
+from .inventarios import ContagemLoteSerializer, ler_planilha, gravar_contagens, calcular_diferencas, aprovar_inventario
 from crm.models import Entidade
+from crm.versoes import etag, LeituraCondicionalMixin
+from fundo_social.renderers import ORJSONRenderer
 
-class CategoriaDeItensViewSet(viewsets.ModelViewSet):
+class CategoriaDeItensViewSet(LeituraCondicionalMixin, viewsets.ModelViewSet):
     """ API para gerenciar as Categorias de Itens. """
+    modelos_versionados = (CategoriaDeItens,)
     queryset = CategoriaDeItens.objects.all().order_by('nome')
     serializer_class = CategoriaDeItensSerializer
 
-class ItemViewSet(viewsets.ModelViewSet):
+class ItemViewSet(LeituraCondicionalMixin, viewsets.ModelViewSet):
     """
     Endpoint da API que permite que Itens sejam visualizados ou editados.
     Agora inclui o cálculo de estoque.
     """
     serializer_class = ItemSerializer
     search_fields = ['nome', 'descricao']
+    # O estoque calculado muda a cada movimentação
+    modelos_versionados = (Item, CategoriaDeItens, MovimentacaoEstoque)
     
     def get_queryset(self):
         """
         Sobrescreve o queryset para incluir a soma das movimentações de estoque.
+        Com ?as_of=AAAA-MM-DD, o estoque é o saldo no fim daquele dia, calculado
+        a partir do último fechamento mensal (estoque.saldos).
         """
-        return Item.objects.annotate(
+        itens = Item.objects.select_related('categoria')
+        as_of = self.request.query_params.get('as_of')
+        if as_of:
+            try:
+                corte = inicio_do_dia(date.fromisoformat(as_of) + timedelta(days=1))
+            except ValueError:
+                raise ValidationError({'as_of': 'Use o formato AAAA-MM-DD.'})
+            return anotar_saldo_em(itens, corte).order_by('nome')
+        return itens.annotate(
             estoque_atual=Coalesce(Sum('movimentacoes__quantidade'), 0.0, output_field=DecimalField())
         ).order_by('nome')
 
+    @action(detail=False, methods=['post'], url_path='lote')
+    @transaction.atomic
+    def lote(self, request):
+        """
+        Cria e atualiza vários itens numa chamada: linhas com "id" são
+        atualizadas, as demais criadas. Tudo ou nada.
+        """
+        itens = gravar_itens(validar_lote(ItemLoteSerializer, request.data))
+        gravados = self.get_queryset().filter(pk__in=[i.pk for i in itens])
+        return Response(self.get_serializer(gravados, many=True).data, status=status.HTTP_200_OK)
+
 class DoacaoRecebidaViewSet(viewsets.ModelViewSet):
     """ API para gerenciar as Doações Recebidas """
     permission_classes = [IsAuthenticated]
 
-    queryset = DoacaoRecebida.objects.all().order_by('-data_doacao')
+    # O nome do doador vem do snapshot gravado na doação (sem resolver o GenericForeignKey)
+    queryset = DoacaoRecebida.objects.prefetch_related(
+        'itens_doados__item__categoria'
+    ).order_by('-data_doacao', '-id')
     serializer_class = DoacaoRecebidaSerializer
+    pagination_class = KeysetPagination
+    keyset_campo = 'data_doacao'
 
+    @idempotente
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
 
@@ -87,12 +138,13 @@ class DoacaoRecebidaViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         doacao = serializer.save()
 
+        # Descarta o prefetch do get_queryset(): a resposta precisa refletir o que foi gravado
+        doacao._prefetched_objects_cache = {}
+
         # Se o cliente enviou itens_doados, substitui a lista (apaga e recria)
         if has_itens:
             # Remove as movimentações antigas desta doação
-            MovimentacaoEstoque.objects.filter(
-                observacao=f"Entrada via doação ID {doacao.id}"
-            ).delete()
+            MovimentacaoEstoque.objects.filter(doacao_recebida=doacao).delete()
 
             # Remove itens antigos
             doacao.itens_doados.all().delete()
@@ -133,9 +185,7 @@ class DoacaoRecebidaViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         obj = self.get_object()
         # remove as movimentações criadas pelo save() de ItemDoacaoRecebida
-        MovimentacaoEstoque.objects.filter(
-            observacao=f"Entrada via doação ID {obj.id}"
-        ).delete()
+        MovimentacaoEstoque.objects.filter(doacao_recebida=obj).delete()
         # apagar a doação vai apagar ItemDoacaoRecebida via CASCADE
         super().destroy(request, *args, **kwargs)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -145,18 +195,19 @@ class StandardResultsSetPagination(pagination.PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class KitViewSet(viewsets.ModelViewSet):
+class KitViewSet(LeituraCondicionalMixin, viewsets.ModelViewSet):
     """ API para gerenciar os Kits e seus itens, agora com cálculo de montagem. """
-    queryset = Kit.objects.all().order_by('nome')
+    queryset = Kit.objects.prefetch_related('itens_do_kit__item__categoria').order_by('nome')
     serializer_class = KitSerializer
     pagination_class = StandardResultsSetPagination
+    # A quantidade montável depende da composição e do estoque dos itens
+    modelos_versionados = (Kit, ItemKit, Item, CategoriaDeItens, MovimentacaoEstoque)
 
     def list(self, request, *args, **kwargs):
+        return self.leitura_condicional(self.listar_com_montagem, request, *args, **kwargs)
+
+    def listar_com_montagem(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        
-        queryset = queryset.prefetch_related(
-            'itens_do_kit__item__movimentacoes'
-        )
 
         itens_ids = ItemKit.objects.filter(kit__in=queryset).values_list('item_id', flat=True)
         estoques = {
@@ -190,10 +241,46 @@ class KitViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['put'])
+    @transaction.atomic
+    def composicao(self, request, pk=None):
+        """
+        Substitui a composição do kit pela lista enviada ([{item_id, quantidade}])
+        aplicando só a diferença em relação ao que está gravado.
+        """
+        kit = self.get_object()
+        componentes = validar_componentes(validar_lote(ComponenteKitSerializer, request.data))
+        alteracoes = aplicar_composicao(kit, componentes)
+        kit = self.get_queryset().get(pk=kit.pk)
+        return Response({**self.get_serializer(kit).data, 'alteracoes': alteracoes})
+
 class DoacaoRealizadaViewSet(viewsets.ModelViewSet):
-    queryset = DoacaoRealizada.objects.all()
+    """
+    Saídas com itens e kits em forma compacta (id e nome). Com
+    ?expandir=composicao cada kit traz também os itens que o compõem.
+    """
+    queryset = DoacaoRealizada.objects.select_related('entidade_gestora').prefetch_related(
+        'itens_saida__item', 'kits_saida__kit'
+    ).order_by('-data_saida', '-id')
     serializer_class = DoacaoRealizadaSerializer
+    pagination_class = KeysetPagination
+    keyset_campo = 'data_saida'
+
+    def expandir_composicao(self):
+        return 'composicao' in self.request.query_params.get('expandir', '').split(',')
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.expandir_composicao():
+            qs = qs.prefetch_related('kits_saida__kit__itens_do_kit__item')
+        return qs
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expandir_composicao'] = self.expandir_composicao()
+        return context
 
+    @idempotente
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         # 1) SEMPRE trabalhe numa cópia
@@ -221,19 +308,22 @@ class DoacaoRealizadaViewSet(viewsets.ModelViewSet):
             raise ValidationError({'kits_saida': 'Deve ser uma lista.'})
 
         # 3) Agregue necessidades (itens + kits)
-        necessidades = {}
+        itens, kits = [], []
         for idx, i in enumerate(itens_saida_data):
             item_id = i.get('item')
             qtd = i.get('quantidade')
             try:
-                qtd = float(qtd)
-            except (TypeError, ValueError):
+                qtd = Decimal(str(qtd))
+            except (TypeError, ValueError, InvalidOperation):
                 raise ValidationError({f'itens_saida[{idx}].quantidade': 'Número inválido.'})
             if not item_id:
                 raise ValidationError({f'itens_saida[{idx}].item': 'Obrigatório.'})
             if qtd <= 0:
                 raise ValidationError({f'itens_saida[{idx}].quantidade': 'Deve ser > 0.'})
-            necessidades[item_id] = necessidades.get(item_id, 0) + qtd
+            try:
+                itens.append((int(item_id), qtd))
+            except (TypeError, ValueError):
+                raise ValidationError({f'itens_saida[{idx}].item': 'Id inválido.'})
 
         for idx, k in enumerate(kits_saida_data):
             kit_id = k.get('kit')
@@ -246,22 +336,19 @@ class DoacaoRealizadaViewSet(viewsets.ModelViewSet):
                 raise ValidationError({f'kits_saida[{idx}].kit': 'Obrigatório.'})
             if qtd_kits <= 0:
                 raise ValidationError({f'kits_saida[{idx}].quantidade': 'Deve ser > 0.'})
+            try:
+                kits.append((int(kit_id), qtd_kits))
+            except (TypeError, ValueError):
+                raise ValidationError({f'kits_saida[{idx}].kit': 'Id inválido.'})
 
-            kit = Kit.objects.get(id=kit_id)
-            for item_no_kit in kit.itens_do_kit.all():
-                item_id = item_no_kit.item_id
-                necessidades[item_id] = necessidades.get(item_id, 0) + float(item_no_kit.quantidade) * qtd_kits
+        kits_existentes = set(Kit.objects.filter(pk__in=[k for k, _ in kits]).values_list('pk', flat=True))
+        for idx, (kit_id, _) in enumerate(kits):
+            if kit_id not in kits_existentes:
+                raise ValidationError({f'kits_saida[{idx}].kit': 'Kit não encontrado.'})
+        necessidades = somar_necessidades(itens, kits)
 
-        # 4) Valide estoque
-        itens_a_verificar = Item.objects.filter(id__in=necessidades.keys()).annotate(
-            estoque_atual=Coalesce(Sum('movimentacoes__quantidade'), 0.0, output_field=DecimalField())
-        )
-        for item in itens_a_verificar:
-            if (item.estoque_atual or 0) < necessidades[item.id]:
-                raise ValidationError(
-                    f"Estoque insuficiente para o item '{item.nome}'. "
-                    f"Saldo atual: {item.estoque_atual or 0}, Saída solicitada: {necessidades[item.id]}"
-                )
+        # 4) Valide estoque (uma query para todos os itens)
+        conferir_estoque(necessidades)
 
         # 5) Crie a doação (copiando campos simples)
         entidade_gestora_id = dados.pop('entidade_gestora')
@@ -271,16 +358,7 @@ class DoacaoRealizadaViewSet(viewsets.ModelViewSet):
         )
 
         # 6) Movimentações (uma por item agregado)
-        movs = [
-            MovimentacaoEstoque(
-                item_id=item_id,
-                tipo_movimento='S',
-                quantidade=-qtd_total,
-                observacao=f"Saída via doação realizada ID {doacao.id}"
-            )
-            for item_id, qtd_total in necessidades.items()
-        ]
-        MovimentacaoEstoque.objects.bulk_create(movs)
+        lancar_saida(doacao, necessidades)
 
         # 7) Registros de itens/kits da saída (para histórico)
         ItemSaida.objects.bulk_create([
@@ -299,19 +377,48 @@ class DoacaoRealizadaViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         obj = self.get_object()
         # remove as movimentações de saída lançadas no create()
-        MovimentacaoEstoque.objects.filter(
-            observacao=f"Saída via doação realizada ID {obj.id}"
-        ).delete()
+        MovimentacaoEstoque.objects.filter(doacao_realizada=obj).delete()
         # apaga a doação (e itens/kits de saída)
         super().destroy(request, *args, **kwargs)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class MovimentacaoEstoqueFilter(FilterSet):
+    """
+    Filtros do livro de movimentações. Item e usuário caem nos índices
+    (item, data_movimento) e (usuario_responsavel, data_movimento); o período
+    sozinho usa (data_movimento, id).
+    """
+    item = NumberFilter(field_name='item_id')
+    categoria = NumberFilter(field_name='item__categoria_id')
+    tipo_movimento = ChoiceFilter(choices=MovimentacaoEstoque.Tipo.choices)
+    usuario = NumberFilter(field_name='usuario_responsavel_id')
+    data_inicio = DateFilter(method='filtrar_data_inicio')
+    data_fim = DateFilter(method='filtrar_data_fim')
+    doacao_recebida = NumberFilter(field_name='doacao_recebida_id')
+    doacao_realizada = NumberFilter(field_name='doacao_realizada_id')
+
+    class Meta:
+        model = MovimentacaoEstoque
+        fields = ['item', 'categoria', 'tipo_movimento', 'usuario', 'data_inicio', 'data_fim',
+                  'doacao_recebida', 'doacao_realizada']
+
+    # Limites como instantes (e não data_movimento__date) para o índice ser usado
+    def filtrar_data_inicio(self, queryset, name, value):
+        return queryset.filter(data_movimento__gte=inicio_do_dia(value))
+
+    def filtrar_data_fim(self, queryset, name, value):
+        return queryset.filter(data_movimento__lt=inicio_do_dia(value + timedelta(days=1)))
+
 class MovimentacaoEstoqueViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = MovimentacaoEstoqueSerializer
+    pagination_class = KeysetPagination
+    keyset_campo = 'data_movimento'
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MovimentacaoEstoqueFilter
 
     def get_queryset(self):
-        return MovimentacaoEstoque.objects.select_related('item','usuario_responsavel').order_by('-data_movimento')
+        return MovimentacaoEstoque.objects.select_related('item').order_by('-data_movimento', '-id')
 
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
@@ -323,50 +430,370 @@ class MovimentacaoEstoqueViewSet(viewsets.ModelViewSet):
         self.perform_create(serializer)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], url_path='lote')
+    @transaction.atomic
+    def lote(self, request):
+        """
+        Lança várias movimentações de uma vez ([{item_id, tipo_movimento,
+        quantidade, observacao}]). O saldo de todos os itens é conferido numa
+        query e o lote é gravado com um bulk_create, ou nada é gravado.
+        """
+        movs = gravar_movimentacoes(validar_lote(MovimentacaoLoteSerializer, request.data), usuario=request.user)
+        gravadas = self.get_queryset().filter(pk__in=[m.pk for m in movs])
+        return Response(self.get_serializer(gravadas, many=True).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def estatisticas(self, request):
+        """
+        Série temporal de entradas, saídas e saldo acumulado, agregada no banco.
+        ?item= e ?categoria= (ids separados por vírgula), ?de= e ?ate= (AAAA-MM-DD,
+        padrão: últimos 12 meses), ?intervalo=dia|semana|mes e ?por_item=1.
+        """
+        params = request.query_params
+        intervalo = params.get('intervalo', 'mes')
+        if intervalo not in INTERVALOS:
+            raise ValidationError({'intervalo': f"Use um de: {', '.join(INTERVALOS)}."})
+
+        try:
+            ate = date.fromisoformat(params['ate']) if params.get('ate') else localdate()
+        except ValueError:
+            raise ValidationError({'ate': 'Use o formato AAAA-MM-DD.'})
+        try:
+            de = date.fromisoformat(params['de']) if params.get('de') else ate - timedelta(days=365)
+        except ValueError:
+            raise ValidationError({'de': 'Use o formato AAAA-MM-DD.'})
+        if de > ate:
+            raise ValidationError({'de': 'Deve ser anterior a "ate".'})
+
+        movimentacoes = MovimentacaoEstoque.objects.all()
+        for filtro, campo in (('item', 'item_id__in'), ('categoria', 'item__categoria_id__in')):
+            if not params.get(filtro):
+                continue
+            try:
+                movimentacoes = movimentacoes.filter(**{campo: [int(i) for i in params[filtro].split(',')]})
+            except ValueError:
+                raise ValidationError({filtro: 'Informe ids numéricos separados por vírgula.'})
+
+        por_item = params.get('por_item') in ('1', 'true')
+        series = serie_do_estoque(
+            movimentacoes,
+            make_aware(datetime.combine(de, time.min)),
+            make_aware(datetime.combine(ate + timedelta(days=1), time.min)),
+            intervalo,
+            por_item=por_item,
+        )
+        if por_item:
+            nomes = dict(Item.objects.filter(pk__in=[s['item_id'] for s in series]).values_list('pk', 'nome'))
+            for serie in series:
+                serie['item_nome'] = nomes.get(serie['item_id'])
+
+        return Response({'de': de, 'ate': ate, 'intervalo': intervalo, 'series': series})
+
+class InventarioViewSet(viewsets.ModelViewSet):
+    """
+    Sessões de inventário (contagem física). As contagens são enviadas em
+    lote para /contagens/, /diferencas/ compara com o saldo do sistema e
+    /aprovar/ grava todos os ajustes de uma vez.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = InventarioSerializer
+
+    def get_queryset(self):
+        contagens = (
+            ContagemInventario.objects.filter(inventario=OuterRef('pk'))
+            .order_by().values('inventario').annotate(n=Count('id')).values('n')
+        )
+        ajustes = (
+            MovimentacaoEstoque.objects.filter(inventario=OuterRef('pk'))
+            .order_by().values('inventario').annotate(n=Count('id')).values('n')
+        )
+        return Inventario.objects.annotate(
+            total_contagens=Coalesce(Subquery(contagens), 0),
+            total_ajustes=Coalesce(Subquery(ajustes), 0),
+        ).order_by('-data_abertura', '-id')
+
+    def perform_create(self, serializer):
+        serializer.save(aberto_por=self.request.user)
+
+    def perform_update(self, serializer):
+        if serializer.instance.status != Inventario.Status.ABERTO:
+            raise ValidationError('Inventário aprovado não pode ser alterado.')
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        if instance.status != Inventario.Status.ABERTO:
+            raise ValidationError('Inventário aprovado não pode ser excluído.')
+        instance.delete()
+
+    @action(detail=True, methods=['post'])
+    @transaction.atomic
+    def contagens(self, request, pk=None):
+        """
+        Grava as quantidades contadas: JSON [{item_id, quantidade_contada}] ou
+        um CSV com essas colunas no campo ``arquivo`` (multipart). Um item já
+        contado tem a contagem substituída.
+        """
+        inventario = self.get_object()
+        dados = request.data
+        if 'arquivo' in request.FILES:
+            dados = ler_planilha(request.FILES['arquivo'])
+        gravadas = gravar_contagens(inventario, validar_lote(ContagemLoteSerializer, dados))
+        return Response({'contagens_gravadas': gravadas}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def diferencas(self, request, pk=None):
+        """ Contado x saldo de cada item da sessão. ?divergentes=1 omite os itens que batem. """
+        inventario = self.get_object()
+        linhas = calcular_diferencas(inventario).order_by('item__nome')
+        if request.query_params.get('divergentes') in ('1', 'true'):
+            linhas = linhas.exclude(diferenca=0)
+        return Response({
+            'inventario': inventario.pk,
+            'status': inventario.status,
+            'linhas': list(linhas.values(
+                'item_id', 'quantidade_contada', 'saldo', 'diferenca',
+                item_nome=F('item__nome'), unidade_medida=F('item__unidade_medida'),
+            )),
+        })
+
+    @action(detail=True, methods=['post'])
+    def aprovar(self, request, pk=None):
+        """ Fecha a sessão e lança os ajustes de todas as diferenças numa transação. """
+        resultado = aprovar_inventario(self.get_object(), usuario=request.user)
+        inventario = self.get_queryset().get(pk=pk)
+        return Response({**self.get_serializer(inventario).data, **resultado})
+
+
 class EntidadeRelatorioAPIView(APIView):
     """
-    Retorna dados da entidade + histórico de doações (entradas e saídas)
+    Retorna dados da entidade, um resumo (totais e último atendimento) e o
+    histórico de doações (entradas e saídas) numa única linha do tempo
+    ordenada por data e paginada (?page=, ?page_size=).
     """
-    def get(self, request, pk):
-        try:
-            ent = Entidade.objects.select_related('categoria').get(pk=pk)
-        except Entidade.DoesNotExist:
-            return Response({'detail':'Entidade não encontrada.'}, status=404)
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    page_size = 20
+    max_page_size = 100
 
-        # entradas: entidade como doadora (ContentType Entidade + object_id = pk)
-        from django.contrib.contenttypes.models import ContentType
+    def get(self, request, pk):
         ct_entidade = ContentType.objects.get_for_model(Entidade)
-        entradas = DoacaoRecebida.objects.filter(content_type=ct_entidade, object_id=pk).order_by('-data_doacao')
-
-        # saídas: entidade como beneficiária/gestora
-        saidas = DoacaoRealizada.objects.filter(entidade_gestora_id=pk).order_by('-data_saida')
+        entradas = DoacaoRecebida.objects.filter(content_type=ct_entidade, object_id=pk)
+        saidas = DoacaoRealizada.objects.filter(entidade_gestora_id=pk)
+
+        # entidade + resumo numa única query (subqueries agregadas)
+        ent = Entidade.objects.select_related('categoria').filter(pk=pk).annotate(
+            total_entradas=Coalesce(Subquery(
+                entradas.order_by().values('object_id').annotate(c=Count('id')).values('c')
+            ), 0),
+            total_saidas=Coalesce(Subquery(
+                saidas.order_by().values('entidade_gestora_id').annotate(c=Count('id')).values('c')
+            ), 0),
+            ultimo_atendimento=Subquery(
+                saidas.order_by('-data_saida').values('data_saida')[:1]
+            ),
+        ).first()
+        if ent is None:
+            return Response({'detail':'Entidade não encontrada.'}, status=404)
 
-        # serializa
         s_ent = {
             'id': ent.id,
-            'nome': ent.nome,
+            'nome': str(ent),
             'nome_fantasia': ent.nome_fantasia,
             'razao_social': ent.razao_social,
             'documento': ent.documento,
             'bairro': ent.bairro,
-            'data_cadastro': getattr(ent, 'data_cadastro', None),
-            'categoria': {'id': getattr(ent.categoria, 'id', None), 'nome': getattr(ent.categoria, 'nome', None)} if getattr(ent, 'categoria', None) else None
+            'data_cadastro': ent.data_cadastro,
+            'categoria': {'id': ent.categoria.id, 'nome': ent.categoria.nome} if ent.categoria else None
         }
-        s_entradas = DoacaoRecebidaSerializer(entradas, many=True).data
-        s_saidas   = DoacaoRealizadaSerializer(saidas, many=True).data
-
-        ultimo = None
-        if saidas.exists():
-            ultimo = saidas.first().data_saida
-
         resumo = {
-            'entradas': entradas.count(),
-            'saidas': saidas.count(),
-            'ultimo_atendimento': ultimo
+            'entradas': ent.total_entradas,
+            'saidas': ent.total_saidas,
+            'ultimo_atendimento': ent.ultimo_atendimento
         }
+        total = ent.total_entradas + ent.total_saidas
+
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+        except ValueError:
+            raise ValidationError({'page': 'Número de página inválido.'})
+        try:
+            page_size = min(self.max_page_size, max(1, int(request.query_params.get('page_size', self.page_size))))
+        except ValueError:
+            raise ValidationError({'page_size': 'Tamanho de página inválido.'})
+        inicio = (page - 1) * page_size
+        fim = inicio + page_size
+
         return Response({
             'entidade': s_ent,
             'resumo': resumo,
-            'entradas': s_entradas,
-            'saidas': s_saidas
-        })
\ No newline at end of file
+            'historico': {
+                'count': total,
+                'page': page,
+                'page_size': page_size,
+                'next': page + 1 if fim < total else None,
+                'previous': page - 1 if page > 1 else None,
+                'results': self.linha_do_tempo(entradas, saidas, fim)[inicio:fim] if inicio < total else [],
+            }
+        })
+
+    def linha_do_tempo(self, entradas, saidas, limite):
+        """
+        UNION das entradas e saídas ordenada por data. Cada lado já vem ordenado
+        e limitado às `limite` primeiras linhas, então a página sai de um
+        índice (doador/data e gestora/data) sem ordenar o histórico inteiro.
+        """
+        colunas = ('id', 'observacoes', 'data', 'tipo', 'qtd_itens', 'qtd_kits')
+        lado_entradas = entradas.annotate(
+            data=F('data_doacao'),
+            tipo=Value('entrada'),
+            qtd_itens=Coalesce(Subquery(
+                ItemDoacaoRecebida.objects.filter(doacao=OuterRef('pk')).order_by().values('doacao')
+                .annotate(s=Sum('quantidade')).values('s')
+            ), Value(Decimal('0'))),
+            qtd_kits=Value(0),
+        ).values(*colunas).order_by('-data', '-id')[:limite]
+        lado_saidas = saidas.annotate(
+            data=F('data_saida'),
+            tipo=Value('saida'),
+            qtd_itens=Coalesce(Subquery(
+                ItemSaida.objects.filter(doacao_realizada=OuterRef('pk')).order_by().values('doacao_realizada')
+                .annotate(s=Sum('quantidade')).values('s')
+            ), Value(Decimal('0'))),
+            qtd_kits=Coalesce(Subquery(
+                KitSaida.objects.filter(doacao_realizada=OuterRef('pk')).order_by().values('doacao_realizada')
+                .annotate(s=Sum('quantidade')).values('s')
+            ), 0),
+        ).values(*colunas).order_by('-data', '-id')[:limite]
+
+        eventos = list(lado_entradas.union(lado_saidas, all=True).order_by('-data', '-tipo', '-id')[:limite])
+        self.anexar_linhas(eventos)
+        return eventos
+
+    def anexar_linhas(self, eventos):
+        """ Itens/kits de cada evento da página, com uma query por tabela de linhas. """
+        ids_entrada = [e['id'] for e in eventos if e['tipo'] == 'entrada']
+        ids_saida = [e['id'] for e in eventos if e['tipo'] == 'saida']
+        linhas = {}
+        for l in ItemDoacaoRecebida.objects.filter(doacao_id__in=ids_entrada).values(
+                'doacao_id', 'item_id', 'item__nome', 'quantidade'):
+            linhas.setdefault(('entrada', l['doacao_id']), {'itens': [], 'kits': []})['itens'].append(
+                {'item': l['item_id'], 'item_nome': l['item__nome'], 'quantidade': l['quantidade']})
+        for l in ItemSaida.objects.filter(doacao_realizada_id__in=ids_saida).values(
+                'doacao_realizada_id', 'item_id', 'item__nome', 'quantidade'):
+            linhas.setdefault(('saida', l['doacao_realizada_id']), {'itens': [], 'kits': []})['itens'].append(
+                {'item': l['item_id'], 'item_nome': l['item__nome'], 'quantidade': l['quantidade']})
+        for l in KitSaida.objects.filter(doacao_realizada_id__in=ids_saida).values(
+                'doacao_realizada_id', 'kit_id', 'kit__nome', 'quantidade'):
+            linhas.setdefault(('saida', l['doacao_realizada_id']), {'itens': [], 'kits': []})['kits'].append(
+                {'kit': l['kit_id'], 'kit_nome': l['kit__nome'], 'quantidade': l['quantidade']})
+        for e in eventos:
+            e.update(linhas.get((e['tipo'], e['id']), {'itens': [], 'kits': []}))
+
+
+class ResumoMensalAPIView(APIView):
+    """
+    Tendências mensais lidas dos resumos pré-agregados (estoque.resumos),
+    sem varrer movimentações nem doações.
+
+    ?tipo=movimentacoes (padrão) soma quantidade e nº de movimentações;
+    ?tipo=doacoes conta doações. Período em ?de= e ?ate= (AAAA-MM), filtros
+    ?direcao=E|S, ?item=, ?categoria=, ?entidade= (ids separados por vírgula)
+    e agrupamento em ?agrupar= (mes, ano, item, categoria, entidade, direcao).
+    """
+    permission_classes = [IsAuthenticated]
+
+    # coluna -> expressão (None para campos do próprio resumo)
+    AGRUPAMENTOS = {
+        'mes': {'mes': None},
+        'ano': {'ano': ExtractYear('mes')},
+        'direcao': {'direcao': None},
+        'item': {'item_id': None, 'item_nome': F('item__nome')},
+        'categoria': {'categoria_id': None, 'categoria_nome': F('categoria__nome')},
+        'entidade': {'entidade_id': None, 'entidade_nome': Coalesce(
+            NullIf('entidade__nome_fantasia', Value('')), 'entidade__razao_social')},
+    }
+    TIPOS = {
+        'movimentacoes': (ResumoMensalMovimentacao, {'quantidade': Sum('quantidade'), 'movimentacoes': Sum('movimentacoes')}),
+        'doacoes': (ResumoMensalDoacao, {'doacoes': Sum('doacoes')}),
+    }
+
+    def get(self, request):
+        params = request.query_params
+        tipo = params.get('tipo', 'movimentacoes')
+        if tipo not in self.TIPOS:
+            raise ValidationError({'tipo': f"Use um de: {', '.join(self.TIPOS)}."})
+        modelo, totais = self.TIPOS[tipo]
+        campos = {f.name for f in modelo._meta.get_fields()}
+
+        agrupar = [a for a in params.get('agrupar', 'mes,direcao').split(',') if a]
+        for a in agrupar:
+            if a not in self.AGRUPAMENTOS or (a != 'ano' and a not in campos):
+                raise ValidationError({'agrupar': f"Agrupamento '{a}' não disponível para {tipo}."})
+
+        qs = modelo.objects.all()
+        if params.get('de'):
+            qs = qs.filter(mes__gte=self.mes(params['de'], 'de'))
+        if params.get('ate'):
+            qs = qs.filter(mes__lte=self.mes(params['ate'], 'ate'))
+        if params.get('direcao'):
+            qs = qs.filter(direcao=params['direcao'])
+        for filtro in ('item', 'categoria', 'entidade'):
+            if not params.get(filtro):
+                continue
+            if filtro not in campos:
+                raise ValidationError({filtro: f'Filtro não disponível para {tipo}.'})
+            try:
+                ids = [int(i) for i in params[filtro].split(',')]
+            except ValueError:
+                raise ValidationError({filtro: 'Informe ids numéricos separados por vírgula.'})
+            qs = qs.filter(**{f'{filtro}_id__in': ids})
+
+        colunas = {}
+        for a in agrupar:
+            colunas.update(self.AGRUPAMENTOS[a])
+        resultados = (
+            qs.values(*(c for c, expr in colunas.items() if expr is None),
+                      **{c: expr for c, expr in colunas.items() if expr is not None})
+            .annotate(**totais)
+            .order_by(*colunas)
+        )
+        return Response({'tipo': tipo, 'agrupar': agrupar, 'resultados': list(resultados)})
+
+    def mes(self, valor, campo):
+        try:
+            ano, mes = (int(p) for p in valor.split('-')[:2])
+            return date(ano, mes, 1)
+        except ValueError:
+            raise ValidationError({campo: 'Use o formato AAAA-MM.'})
+
+
+def _etag_dos_lookups(request, *args, **kwargs):
+    return 'lookups-' + etag(Item, Kit, Entidade, CategoriaDeItens)
+
+
+class LookupsAPIView(APIView):
+    """
+    Catálogos para os selects dos formulários de doação: itens, kits,
+    entidades gestoras e categorias, como listas de [id, nome].
+
+    O ETag vem das versões das tabelas (crm.versoes): com If-None-Match
+    igual, a resposta é 304 sem consultar os catálogos.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(condition(etag_func=_etag_dos_lookups))
+    def get(self, request):
+        gestoras = (
+            Entidade.objects.filter(eh_gestor=True)
+            .annotate(nome=Coalesce(NullIf('nome_fantasia', Value('')), 'razao_social'))
+            .order_by('nome')
+        )
+        response = Response({
+            'itens': list(Item.objects.order_by('nome').values_list('id', 'nome')),
+            'kits': list(Kit.objects.order_by('nome').values_list('id', 'nome')),
+            'gestoras': list(gestoras.values_list('id', 'nome')),
+            'categorias': list(CategoriaDeItens.objects.order_by('nome').values_list('id', 'nome')),
+        })
+        # O navegador guarda, mas sempre revalida pelo ETag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -3,6 +3,9 @@ ASGI config for fundo_social project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+O stream de alertas (/api/alertas/stream/, crm.alertas) só funciona aqui,
+servido por um servidor ASGI (ex.: uvicorn fundo_social.asgi:application).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
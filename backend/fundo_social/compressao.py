@@ -0,0 +1,104 @@
+# fundo_social/compressao.py
+"""
+Compressão das respostas com brotli ou gzip, negociada pelo Accept-Encoding.
+
+Só comprime as respostas JSON da API acima de ``SGFS_COMPRESSAO_MINIMO``
+bytes: abaixo disso o custo de CPU não compensa na rede da prefeitura.
+
+HTML (admin, páginas de login) fica de fora de propósito: essas páginas
+trazem o token CSRF e repetem o que veio na URL (``?q=`` da busca), e
+comprimir as duas coisas juntas abre espaço para o ataque BREACH. O
+GZipMiddleware do Django mitiga com enchimento aleatório; aqui a saída é
+simplesmente não comprimir. O brotli é opcional (``pip install brotli``);
+sem o pacote instalado, vale só o gzip.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+MINIMO_PADRAO = 1024
+# Qualidade 4-5 é o ponto bom do brotli para conteúdo dinâmico
+QUALIDADE_BROTLI = 5
+# Só JSON: nada de text/html (ver BREACH acima)
+TIPOS_COMPRIMIVEIS = ('application/json',)
+
+_RE_CODIFICACAO = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def codificacoes_aceitas(cabecalho):
+    """ Codificações do Accept-Encoding com q > 0. """
+    aceitas = set()
+    for parte in cabecalho.lower().split(','):
+        casou = _RE_CODIFICACAO.match(parte)
+        if not casou:
+            continue
+        try:
+            q = float(casou.group(2) or 1)
+        except ValueError:
+            continue
+        if q > 0:
+            aceitas.add(casou.group(1))
+    return aceitas
+
+
+def escolher_codificacao(cabecalho):
+    aceitas = codificacoes_aceitas(cabecalho)
+    if brotli is not None and 'br' in aceitas:
+        return 'br'
+    if 'gzip' in aceitas:
+        return 'gzip'
+    return None
+
+
+def comprimir(conteudo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(conteudo, quality=QUALIDADE_BROTLI)
+    return compress_string(conteudo)
+
+
+class CompressaoMiddleware:
+    """
+    Deve ficar logo abaixo do QueryMetricsMiddleware, antes dos middlewares
+    que leem ou alteram o corpo da resposta.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.minimo = getattr(settings, 'SGFS_COMPRESSAO_MINIMO', MINIMO_PADRAO)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(TIPOS_COMPRIMIVEIS)
+        ):
+            return response
+
+        # O tamanho pode mudar de uma requisição para outra: o Vary vale sempre
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.minimo:
+            return response
+
+        codificacao = escolher_codificacao(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if codificacao is None:
+            return response
+        comprimido = comprimir(response.content, codificacao)
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = codificacao
+        # O corpo mudou de bytes: o ETag forte vira fraco (como no GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,176 @@
+# fundo_social/metrics.py
+"""
+Instrumentação por requisição: quantidade de queries, tempo de SQL,
+queries repetidas (fingerprints) e latência total, agregadas por rota.
+
+Os números ficam em memória no processo (cada worker do gunicorn tem os seus)
+e são expostos no cabeçalho ``Server-Timing`` e em ``/api/_metrics/``.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# Quantas requisições recentes guardamos por rota para calcular percentis
+JANELA_PADRAO = 500
+# Quantas queries repetidas diferentes guardamos por rota
+MAX_FINGERPRINTS = 50
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTA_IN = re.compile(r"\bIN \((?:\s*\(?(?:%s|\?)\)?\s*,?)+\)", re.IGNORECASE)
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+def fingerprint_sql(sql):
+    """ Normaliza o SQL para que a mesma query com parâmetros diferentes seja agrupada. """
+    sql = _RE_STRING.sub('?', sql)
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_LISTA_IN.sub('IN (...)', sql)
+    return _RE_ESPACOS.sub(' ', sql).strip()
+
+
+def percentil(valores, p):
+    """ Percentil pelo método nearest-rank (valores já ordenados). """
+    if not valores:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(valores)) - 1)
+    return valores[indice]
+
+
+class ColetorDeQueries:
+    """ execute_wrapper que conta e cronometra cada query executada na requisição. """
+
+    def __init__(self):
+        self.total = 0
+        self.tempo_sql = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo_sql += time.perf_counter() - inicio
+            self.total += 1
+            self.fingerprints[fingerprint_sql(sql)] += 1
+
+    @property
+    def duplicadas(self):
+        return {sql: n for sql, n in self.fingerprints.items() if n > 1}
+
+
+class RegistroDeMetricas:
+    """ Agregador em memória, por rota, das últimas requisições. """
+
+    def __init__(self, janela=JANELA_PADRAO):
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._amostras = defaultdict(lambda: deque(maxlen=self.janela))
+        self._duplicadas = defaultdict(Counter)
+
+    def registrar(self, rota, latencia_ms, queries, sql_ms, duplicadas):
+        with self._lock:
+            self._amostras[rota].append((latencia_ms, queries, sql_ms))
+            if duplicadas:
+                contador = self._duplicadas[rota]
+                contador.update(duplicadas)
+                if len(contador) > MAX_FINGERPRINTS * 2:
+                    self._duplicadas[rota] = Counter(dict(contador.most_common(MAX_FINGERPRINTS)))
+
+    def limpar(self):
+        with self._lock:
+            self._amostras.clear()
+            self._duplicadas.clear()
+
+    def resumo(self):
+        with self._lock:
+            amostras = {rota: list(valores) for rota, valores in self._amostras.items()}
+            duplicadas = {rota: c.most_common(10) for rota, c in self._duplicadas.items()}
+
+        resultado = []
+        for rota, valores in amostras.items():
+            latencias = sorted(v[0] for v in valores)
+            queries = sorted(v[1] for v in valores)
+            tempos_sql = sorted(v[2] for v in valores)
+            resultado.append({
+                'rota': rota,
+                'requisicoes': len(valores),
+                'latencia_ms': {p: _arredonda(percentil(latencias, n)) for p, n in (('p50', 50), ('p95', 95), ('p99', 99))},
+                'sql_ms': {p: _arredonda(percentil(tempos_sql, n)) for p, n in (('p50', 50), ('p95', 95), ('p99', 99))},
+                'queries': {p: percentil(queries, n) for p, n in (('p50', 50), ('p95', 95), ('p99', 99))},
+                'queries_max': queries[-1],
+                'queries_repetidas': [{'sql': sql, 'vezes': n} for sql, n in duplicadas.get(rota, [])],
+            })
+        return sorted(resultado, key=lambda r: r['latencia_ms']['p95'] or 0, reverse=True)
+
+
+def _arredonda(valor):
+    return round(valor, 2) if valor is not None else None
+
+
+registro = RegistroDeMetricas(getattr(settings, 'SGFS_METRICS_JANELA', JANELA_PADRAO))
+
+
+def nome_da_rota(request):
+    """ Método + nome da view resolvida (ex.: 'GET item-list'). """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return f'{request.method} <nao-resolvida>'
+    nome = match.view_name or match.route
+    return f'{request.method} {nome}'
+
+
+class QueryMetricsMiddleware:
+    """
+    Mede queries, tempo de SQL e latência de cada requisição.
+    Deve ficar no topo do MIDDLEWARE para incluir as queries dos demais middlewares.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        coletor = ColetorDeQueries()
+        inicio = time.perf_counter()
+        with ExitStack() as stack:
+            for conexao in connections.all():
+                stack.enter_context(conexao.execute_wrapper(coletor))
+            response = self.get_response(request)
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        sql_ms = coletor.tempo_sql * 1000
+        duplicadas = coletor.duplicadas
+        rota = nome_da_rota(request)
+
+        registro.registrar(rota, latencia_ms, coletor.total, sql_ms, duplicadas)
+
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={sql_ms:.2f};desc="{coletor.total} queries"',
+            f'dup;desc="{sum(duplicadas.values())} repetidas"',
+            f'total;dur={latencia_ms:.2f}',
+            f'view;desc="{rota}"',
+        ])
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Percentis (p50/p95/p99) de latência, tempo de SQL e nº de queries por rota.
+    DELETE zera as amostras acumuladas.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(registro.resumo())
+
+    def delete(self, request, format=None):
+        registro.limpar()
+        return Response(status=204)
@@ -0,0 +1,38 @@
+# fundo_social/renderers.py
+"""
+Renderer JSON com orjson para as respostas grandes da API (agenda de
+contatos, entidades com vínculos aninhados, relatório por entidade).
+
+É opcional, por view (``renderer_classes``). A saída é a mesma do
+JSONRenderer do DRF: o que o orjson não serializa nativamente (Decimal,
+datetime, time, timedelta, UUID, lazy strings, QuerySet...) passa pelo
+mesmo JSONEncoder do DRF. Sem o orjson instalado, ou com indentação
+pedida (API navegável, ``; indent=``), cai no JSONRenderer padrão.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+_encoder_drf = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=_encoder_drf.default,
+            # datas e horas no formato do DRF (milissegundos, 'Z' em UTC)
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # Mesmo escape do DRF para U+2028/U+2029, inválidos em JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Mede queries/latência por requisição (cabeçalho Server-Timing e /api/_metrics/)
+    'fundo_social.metrics.QueryMetricsMiddleware',
+    # brotli/gzip das respostas JSON acima de SGFS_COMPRESSAO_MINIMO bytes (fundo_social.compressao)
+    'fundo_social.compressao.CompressaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
@@ -144,13 +149,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Idempotency-Key nos POST de doações (estoque.idempotencia)
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 #CORS_ALLOWED_ORIGINS = [
 #    "https://fundosocial.mogidascruzes.sp.gov.br",
 #]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Usuário em cache no processo por SGFS_USUARIO_CACHE_TTL segundos (crm.autenticacao)
+        'crm.autenticacao.JWTAuthenticationComCache',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -166,6 +174,25 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['rest_framework.filters.SearchFilter'],
 }
 
+# Nº de requisições recentes, por rota, usadas nos percentis de /api/_metrics/
+SGFS_METRICS_JANELA = 500
+
+# Respostas menores que isso (bytes) não são comprimidas
+SGFS_COMPRESSAO_MINIMO = 1024
+# Dependências opcionais, instaladas à parte (pip install orjson brotli):
+#   orjson  renderer JSON rápido (fundo_social.renderers); sem ele, vale o JSONRenderer
+#   brotli  Content-Encoding br (fundo_social.compressao); sem ele, só gzip
+
+# Permissões de cada usuário ficam no cache (crm.permissoes). Com vários
+# workers, use um cache compartilhado em CACHES para a invalidação valer em todos.
+AUTHENTICATION_BACKENDS = ['crm.permissoes.ModelBackendComCache']
+SGFS_PERMISSOES_TTL = 300
+# Tempo máximo em que um usuário desativado ainda é aceito por outro worker
+SGFS_USUARIO_CACHE_TTL = 30
+
+# Validade das Idempotency-Key (estoque.idempotencia); manage.py limpar_idempotencia apaga as vencidas
+SGFS_IDEMPOTENCIA_HORAS = 24
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -198,7 +225,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
+    # Inclui username, is_staff e a versão das permissões no token (crm.autenticacao)
+    "TOKEN_OBTAIN_SERIALIZER": "crm.autenticacao.TokenComClaimsSerializer",
     "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
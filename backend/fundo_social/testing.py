@@ -0,0 +1,77 @@
+# fundo_social/testing.py
+"""
+Apoio aos testes de regressão de nº de queries.
+
+Cada caso semeia N e depois 10×N registros relacionados e compara quantas
+queries o list e o retrieve executam: o número não pode crescer com N.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .metrics import fingerprint_sql
+
+
+class QueryCountGuardMixin:
+    """
+    Mixin para APITestCase. A subclasse define ``basename`` (nome da rota no
+    router) e ``semear(n)``, que cria n registros principais com n filhos cada
+    e devolve a pk de um registro com n filhos (usada no retrieve).
+
+    N = 2 faz com que 10×N passe do tamanho de página (10): a lista vai de
+    2 para 10 linhas e cada linha vai de 2 para 20 filhos.
+    """
+    basename = None
+    N = 2
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.basename is None or not callable(getattr(cls, 'semear', None)):
+            raise TypeError(f'{cls.__name__} precisa definir basename e semear(n).')
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_superuser('guarda', 'guarda@sgfs.local', 'guarda')
+        self.client.force_authenticate(self.usuario)
+
+    def capturar(self, url):
+        # Primeira chamada aquece caches de processo (ContentType, etc.)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, f'{url} respondeu {response.status_code}')
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def assertQueriesNaoCrescem(self, antes, depois, rota):
+        if len(depois) <= len(antes):
+            return
+        contagem_antes = Counter(fingerprint_sql(sql) for sql in antes)
+        contagem_depois = Counter(fingerprint_sql(sql) for sql in depois)
+        cresceram = [
+            f'  {contagem_antes[fp]} -> {n}x  {fp}'
+            for fp, n in contagem_depois.most_common()
+            if n > contagem_antes[fp]
+        ]
+        self.fail(
+            f'{rota}: {len(antes)} queries com N={self.N} e {len(depois)} com N={self.N * 10}.\n'
+            'Queries que cresceram com N:\n' + '\n'.join(cresceram)
+        )
+
+    def test_list_nao_cresce_com_n(self):
+        url = reverse(f'{self.basename}-list')
+        self.semear(self.N)
+        antes = self.capturar(url)
+        self.semear(self.N * 10)
+        depois = self.capturar(url)
+        self.assertQueriesNaoCrescem(antes, depois, f'{self.basename}-list')
+
+    def test_retrieve_nao_cresce_com_n(self):
+        pk = self.semear(self.N)
+        antes = self.capturar(reverse(f'{self.basename}-detail', args=[pk]))
+        pk = self.semear(self.N * 10)
+        depois = self.capturar(reverse(f'{self.basename}-detail', args=[pk]))
+        self.assertQueriesNaoCrescem(antes, depois, f'{self.basename}-detail')
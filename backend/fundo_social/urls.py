@@ -5,9 +5,11 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from .metrics import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/_metrics/', MetricsView.as_view(), name='metrics'),
     path('api/', include('crm.urls')),
     path('api/', include('estoque.urls')),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
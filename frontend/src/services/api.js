@@ -19,6 +19,9 @@ api.interceptors.request.use(
     }
 );
 
+// Renovação do token de acesso em andamento (ver interceptor de resposta)
+let renovacao = null;
+
 // NOVO!! INTERCEPTOR DE RESPOSTA (Response Interceptor)
 // Este código será executado DEPOIS de cada resposta da API ser recebida.
 api.interceptors.response.use(
@@ -34,6 +37,22 @@ api.interceptors.response.use(
         if (error.response?.status === 401 && !originalRequest._retry) {
             originalRequest._retry = true; // Evita loops infinitos de logout
 
+            // Antes de deslogar, tenta renovar o token de acesso com o refresh
+            // (uma renovação só, compartilhada pelas requisições que falharem juntas)
+            const refresh = localStorage.getItem('refreshToken');
+            if (refresh && !originalRequest.url?.startsWith('/token/')) {
+                try {
+                    renovacao = renovacao || api.post('/token/refresh/', { refresh });
+                    const r = await renovacao;
+                    localStorage.setItem('accessToken', r.data.access);
+                    return api(originalRequest);
+                } catch {
+                    // refresh vencido: segue para o logout
+                } finally {
+                    renovacao = null;
+                }
+            }
+
             // Importamos a store de autenticação aqui dentro para evitar problemas
             // de dependência circular.
             const { useAuthStore } = await import('@/store/auth');